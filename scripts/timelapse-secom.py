@@ -10,6 +10,9 @@ This is a script to acquire a set of EM/FM overlays over a long period.
 run as:
 ./scripts/timelapse-overlay.py -n 12 --period 60 --output filename-.tiff
 
+--refocus (optional) defines the time after which the optical focus is
+    checked again, with an autofocus.
+
 -n defines the number of images to acquire.
    Don't set it to make it infinite, in which case you can stop with Ctrl+C.
 --period defines the time between each acquisition
@@ -31,6 +34,7 @@ from __future__ import division
 import argparse
 import logging
 from odemis import dataio, model, acq
+from odemis.acq import align
 from odemis.acq import stream
 import sys
 import os
@@ -42,9 +46,10 @@ logging.getLogger().setLevel(logging.INFO)  # put "DEBUG" level for more message
 # logging.getLogger().setLevel(logging.DEBUG)
 
 
-def acquire_timelapse(num, period, filename):
+def acquire_timelapse(num, period, filename, refocus=None):
     """
     num (int or None): if None, will never stop, unless interrupted
+    refocus (None or float): time (s) after which autofocus is run again
     """
 
     # Find components by their role
@@ -80,6 +85,15 @@ def acquire_timelapse(num, period, filename):
     fpos = open(fn_pos, "a")
     fpos.write("time\tX\tY\tZ\n")
 
+    # The current focus is considered good. Autofocus will only look around it
+    # to compensate for the drift.
+    if refocus:
+        spos = stage.position.value
+        fmap = align.FocusMap(validity=refocus)
+        fmap.add(spos["x"], spos["y"], focus.position.value["z"])
+    else:
+        fmap = None
+
     # Run acquisition every period
     try:
         i = 1
@@ -87,6 +101,19 @@ def acquire_timelapse(num, period, filename):
             logging.info("Acquiring image %d", i)
             start = time.time()
 
+            if fmap and fmap.needsValidation():
+                logging.info("Running autofocus")
+                # The excitation light is only on while the fluorescence
+                # stream is active, so keep it active during the autofocus.
+                stfm.is_active.value = True
+                try:
+                    f = align.ValidateFocusMap(fmap, stage, focus, ccd, None)
+                    f.result()
+                except Exception:
+                    logging.exception("Autofocus failed, will keep the current focus")
+                finally:
+                    stfm.is_active.value = False
+
             # Acquire all the images
             f = acq.acquire(acq_streams)
             data, e = f.result()
@@ -104,8 +131,6 @@ def acquire_timelapse(num, period, filename):
             if data:
                 exporter.export(fn_pattern % (i,), data)
 
-            # TODO: run autofocus from time to time?
-
             left = period - (time.time() - start)
             if left < 0:
                 logging.warning("Acquisition took longer than the period (%g s overdue)", -left)
@@ -141,6 +166,8 @@ def main(args):
                         help="time between 2 acquisition")
     parser.add_argument("--output", "-o", dest="filename", required=True,
                         help="pattern of the file name output, including the extension (ex: acq-.tiff)")
+    parser.add_argument("--refocus", dest="refocus", type=float,
+                        help="time (s) after which the optical focus is checked again (default: never)")
 
     options = parser.parse_args(args[1:])
 
@@ -148,7 +175,8 @@ def main(args):
         if "." not in options.filename[-5:]:
             raise ValueError("output argument must contain extension, but got '%s'" % (options.filename,))
 
-        n = acquire_timelapse(options.num, options.period, options.filename)
+        n = acquire_timelapse(options.num, options.period, options.filename,
+                              options.refocus)
     except Exception:
         logging.exception("Unexpected error while performing action.")
         return 127
@@ -30,6 +30,7 @@ from Pyro4.core import isasync
 import collections
 from concurrent import futures
 from concurrent.futures import CancelledError
+import itertools
 import logging
 import math
 from odemis import model
@@ -91,13 +92,16 @@ def estimateTime(streams):
     streams (list of Stream): the streams to acquire
     return (0 <= float): estimated time in s.
     """
-    tot_time = 0
     # We don't use mergeStreams() as it creates new streams at every call, and
     # anyway sum of each stream should give already a good estimation.
-    for s in streams:
-        tot_time += s.estimateAcquisitionTime()
+    # Streams which use different hardware are acquired simultaneously.
+    # The optical path switch cost is not estimated, as it's called for every
+    # change of settings, and would need to read the whole hardware state.
+    streams, reqs = _order_streams(streams)
+    resources = {s: _get_stream_resources(s, reqs[s]) for s in streams}
+    durations = {s: s.estimateAcquisitionTime() for s in streams}
 
-    return tot_time
+    return _estimate_schedule_end(streams, resources, durations)
 
 def computeThumbnail(streamTree, acqTask):
     """
@@ -131,6 +135,233 @@ def computeThumbnail(streamTree, acqTask):
     iim.metadata[model.MD_DESCRIPTION] = "Composited image preview"
     return iim
 
+# Estimated time (in s) to change a hardware setting between two streams, for
+# each type of resource. Used to find the best order to acquire the streams.
+# For the optical path, it's only used when the optical path manager cannot
+# estimate it.
+TRANSITION_COSTS = {
+    "path": 5,  # optical path (can involve several slow actuators)
+    "filter": 1,  # filter wheel
+    "light": 0.1,  # light source
+}
+
+# Maximum number of streams of the same type for which all the possible orders
+# are tried. Above, a (greedy) nearest neighbour ordering is used.
+MAX_PERMUTATION_STREAMS = 6
+
+
+def _get_stream_requirements(stream, opm=None):
+    """
+    Lists the hardware settings that a stream needs during its acquisition
+    stream (acq.stream.Stream): a stream to acquire
+    opm (OpticalPathManager or None): the optical path manager to use, if the
+      stream doesn't have any.
+    returns (dict tuple -> value): resource -> setting. The resource is a tuple
+      which starts with the type of resource (see TRANSITION_COSTS).
+    """
+    req = {}
+    opm = getattr(stream, "_opm", None) or opm
+    if opm is not None:
+        try:
+            req[("path",)] = opm.guessMode(stream)
+        except LookupError:
+            pass  # No specific optical path needed
+
+    if isinstance(stream, FluoStream):
+        req[("filter", stream._em_filter.name)] = stream.emission.value
+        req[("light", stream._emitter.name)] = stream.excitation.value
+
+    return req
+
+
+def _estimate_path_costs(streams, reqs, opm=None):
+    """
+    Estimates the time needed to switch to each optical path mode used by the
+    streams, from the current position of the hardware.
+    streams (list of Streams): the streams to acquire
+    reqs (dict Stream -> dict): the requirements of each stream
+    opm (OpticalPathManager or None): the optical path manager to use, if the
+      stream doesn't have any.
+    returns (dict str -> float): optical path mode -> time (in s). The modes
+      for which it couldn't be estimated are not present.
+    """
+    costs = {}
+    for s in streams:
+        mode = reqs[s].get(("path",))
+        if mode is None or mode in costs:
+            continue
+        sopm = getattr(s, "_opm", None) or opm
+        try:
+            costs[mode] = sopm.estimateSetPathTime(mode)
+        except Exception:
+            logging.debug("Failed to estimate time to switch to path %s", mode, exc_info=True)
+    return costs
+
+
+def _transition_cost(prev_req, req, path_costs=None):
+    """
+    Estimates the time needed to change the hardware settings between two streams
+    prev_req (None or dict): requirements of the previous stream, as returned
+      by _get_stream_requirements(). If None, the hardware state is unknown.
+    req (dict): requirements of the next stream
+    path_costs (None or dict str -> float): time to switch to each optical
+      path mode, as returned by _estimate_path_costs()
+    returns (0 <= float): cost (in s)
+    """
+    if prev_req is None:
+        return 0
+    cost = 0
+    for r, v in req.items():
+        if r in prev_req and prev_req[r] != v:
+            if r[0] == "path" and path_costs:
+                # The estimations are from the current position, so one of the
+                # two modes is likely the current one. The move between the
+                # two modes takes about as long as the longest of the two.
+                dflt = TRANSITION_COSTS["path"]
+                cost += max(path_costs.get(prev_req[r], dflt), path_costs.get(v, dflt))
+            else:
+                cost += TRANSITION_COSTS[r[0]]
+    return cost
+
+
+def _order_group(streams, reqs, prev_req, path_costs=None):
+    """
+    Find the order of streams which minimises the cost of the hardware changes
+    streams (list of Streams): the streams to order, by order of preference
+      (used when multiple orders have the same cost)
+    reqs (dict Stream -> dict): the requirements of each stream
+    prev_req (None or dict): the requirements of the stream acquired just before
+    path_costs (None or dict str -> float): time to switch to each optical
+      path mode, as returned by _estimate_path_costs()
+    returns (list of Streams): the same streams, in the best order found
+    """
+    if len(streams) <= 1:
+        return list(streams)
+
+    def seq_cost(seq):
+        cost = 0
+        prev = prev_req
+        for s in seq:
+            cost += _transition_cost(prev, reqs[s], path_costs)
+            prev = reqs[s]
+        return cost
+
+    if len(streams) <= MAX_PERMUTATION_STREAMS:
+        # Try every possibility. The first one is the original order, and
+        # it's only replaced if another one is strictly better.
+        best, best_cost = None, float("inf")
+        for seq in itertools.permutations(streams):
+            cost = seq_cost(seq)
+            if cost < best_cost:
+                best, best_cost = seq, cost
+        return list(best)
+    else:
+        # Greedy: always pick the cheapest stream to go to
+        left = list(streams)
+        ordered = []
+        prev = prev_req
+        while left:
+            nxt = min(left, key=lambda s: _transition_cost(prev, reqs[s], path_costs))
+            left.remove(nxt)
+            ordered.append(nxt)
+            prev = reqs[nxt]
+        return ordered
+
+
+def _order_streams(streams, opm=None, estimate_path=False):
+    """
+    Sort the streams in the best order for the acquisition. The streams are
+    first sorted by type (see _weight_stream()), as it's important for the
+    quality of the acquisition. Then inside each group of the same type, they
+    are ordered so that the hardware changes are the shortest.
+    streams (list of Streams): the streams to acquire
+    opm (OpticalPathManager or None): the optical path manager to use, if the
+      streams don't have any.
+    estimate_path (bool): if True, the time to switch the optical path is
+      estimated by the optical path manager (which needs to read the state of
+      the hardware), otherwise, a fixed cost is used.
+    returns:
+      (list of Streams): the streams, in order of acquisition
+      (dict Stream -> dict): the hardware requirements of each stream
+    """
+    reqs = {s: _get_stream_requirements(s, opm) for s in streams}
+    if estimate_path:
+        path_costs = _estimate_path_costs(streams, reqs, opm)
+    else:
+        path_costs = None
+    weighted = sorted(streams, key=_weight_stream, reverse=True)
+
+    ordered = []
+    prev_req = None
+    for _, group in itertools.groupby(weighted, key=lambda s: int(_weight_stream(s))):
+        ordered.extend(_order_group(list(group), reqs, prev_req, path_costs))
+        prev_req = reqs[ordered[-1]]
+
+    return ordered, reqs
+
+
+def _get_stream_resources(stream, req=None):
+    """
+    Lists the hardware used by a stream during its acquisition. Two streams
+    which have some resources in common cannot be acquired simultaneously.
+    stream (acq.stream.Stream): a stream to acquire
+    req (None or dict): the requirements of the stream, as returned by
+      _get_stream_requirements()
+    returns (set of str): the names of the resources (mostly components)
+    """
+    res = set()
+    for attr in ("_detector", "_emitter", "_focuser", "_em_filter", "_ccd",
+                 "_sstage", "_main_det", "_rep_det"):
+        comp = getattr(stream, attr, None)
+        if isinstance(comp, model.ComponentBase):
+            res.add(comp.name)
+            # The e-beam would excite (and bleach) the sample during the
+            # fluorescence acquisition
+            if getattr(comp, "role", None) == "e-beam":
+                res.add("sample excitation")
+
+    if isinstance(stream, FluoStream):
+        res.add("sample excitation")
+
+    # The optical path is shared by all the streams which need one
+    if req and ("path",) in req:
+        res.add("optical path")
+
+    # Multiple detector streams: also all the hardware of the sub-streams
+    for s in getattr(stream, "streams", []):
+        res |= _get_stream_resources(s)
+
+    return res
+
+
+def _estimate_schedule_end(streams, resources, durations, known_ends=None, now=0):
+    """
+    Estimates when the acquisition of all the streams will be finished. The
+    streams are started in order, as soon as all the previous streams using the
+    same resources are finished.
+    streams (list of Streams): the streams, in order of acquisition
+    resources (dict Stream -> set): the resources used by each stream
+    durations (dict Stream -> float): the estimated duration of each stream
+    known_ends (None or dict Stream -> float): the (expected) end time of the
+      streams already started
+    now (float): the time the acquisition of the not-yet started streams can
+      start
+    returns (float): the (expected) end time of the acquisition
+    """
+    ends = dict(known_ends or {})
+    start = now
+    for s in streams:
+        if s in ends:
+            continue
+        # Don't start before the previous stream
+        for o, e in ends.items():
+            if resources[o] & resources[s]:
+                start = max(start, e)
+        ends[s] = start + durations[s]
+
+    return max([now] + ends.values())
+
+
 def _weight_stream(stream):
     """
     Defines how much a stream is of priority (should be done first) for
@@ -176,21 +407,29 @@ class AcquisitionTask(object):
         self._opm = opm
 
         # order the streams for optimal acquisition
-        self._streams = sorted(streams, key=_weight_stream, reverse=True)
+        self._streams, self._requirements = _order_streams(streams, opm, estimate_path=True)
+
+        # hardware used by each stream, to know which streams can run in parallel
+        self._resources = {s: _get_stream_resources(s, self._requirements[s])
+                           for s in self._streams}
 
         # get the estimated time for each streams
         self._streamTimes = {} # Stream -> float (estimated time)
         for s in streams:
             self._streamTimes[s] = s.estimateAcquisitionTime()
 
-        self._streams_left = set(self._streams) # just for progress update
-        self._current_stream = None
-        self._current_future = None
+        self._lock = threading.Lock()
+        self._started = set()  # Streams already started
+        self._running = {}  # Stream -> Future: acquisitions in progress
+        self._stream_ends = {}  # Stream -> float: (expected) end time of the started streams
+        self._executor = None
         self._cancelled = False
 
     def run(self):
         """
         Runs the acquisition
+        The streams are started in order, but a stream doesn't wait for the
+        previous ones to be finished if they don't use the same hardware.
         returns:
             (list of DataArrays): all the raw data acquired
             (Exception or None): exception raised during the acquisition
@@ -198,60 +437,141 @@ class AcquisitionTask(object):
             Exception: if it failed before any result were acquired
         """
         exp = None
-        assert(self._current_stream is None) # Task should be used only once
-        expected_time = sum(self._streamTimes.values())
+        assert(self._executor is None) # Task should be used only once
         # no need to set the start time of the future: it's automatically done
         # when setting its state to running.
-        self._future.set_progress(end=time.time() + expected_time)
+        self._update_progress()
+
+        # The executor takes care of running simultaneously only the streams
+        # which do not use the same hardware.
+        self._executor = model.ParallelThreadPoolExecutor()
+        fstreams = collections.OrderedDict()  # Stream -> Future
+        for s in self._streams:
+            fstreams[s] = self._executor.submit(self._resources[s], self._acquire_stream, s)
 
         raw_images = {} # stream -> list of raw images
         try:
-            for s in self._streams:
-
-                # Get the future of the acquisition, depending on the Stream type
-                if hasattr(s, "acquire"):
-                    f = s.acquire()
-                else: # fall-back to old style stream
-                    f = _futures.wrapSimpleStreamIntoFuture(s)
-                self._current_future = f
-                self._current_stream = s
-                self._streams_left.discard(s)
-
-                # in case acquisition was cancelled, before the future was set
-                if self._cancelled:
-                    f.cancel()
-                    raise CancelledError()
-
-                # If it's a ProgressiveFuture, listen to the time update
-                try:
-                    f.add_update_callback(self._on_progress_update)
-                except AttributeError:
-                    pass # not a ProgressiveFuture, fine
-
+            for s, f in fstreams.items():
                 # Wait for the acquisition to be finished.
                 # Will pass down exceptions, included in case it's cancelled
                 raw_images[s] = f.result()
 
-                # update the time left
-                expected_time -= self._streamTimes[s]
-                self._future.set_progress(end=time.time() + expected_time)
-
             # Update metadata using OverlayStream (if there was one)
             self._adjust_metadata(raw_images)
 
         except CancelledError:
             raise
         except Exception as e:
+            # Stop all the other acquisitions (and pass the results of the
+            # ones already finished)
+            self._cancelled = True
+            self._cancel_running()
+            for s, f in fstreams.items():
+                try:
+                    if s not in raw_images:
+                        raw_images[s] = f.result()
+                except Exception:
+                    pass
+
             # If no acquisition yet => just raise the exception,
             # otherwise, the results we got might already be useful
             if not raw_images:
                 raise
             exp = e
+        finally:
+            self._executor.shutdown(wait=False)
 
         # merge all the raw data (= list of DataArrays) into one long list
         ret = sum(raw_images.values(), [])
         return ret, exp
 
+    def _acquire_stream(self, s):
+        """
+        Acquires one stream, and blocks until it's done
+        s (Stream): the stream to acquire
+        returns (list of DataArrays): the raw data of the stream
+        raises:
+            CancelledError: if the acquisition was cancelled
+            Exception: if the acquisition failed
+        """
+        if self._cancelled:
+            raise CancelledError()
+
+        # Get the future of the acquisition, depending on the Stream type
+        if hasattr(s, "acquire"):
+            f = s.acquire()
+        else: # fall-back to old style stream
+            f = _futures.wrapSimpleStreamIntoFuture(s)
+
+        with self._lock:
+            self._started.add(s)
+            self._running[s] = f
+            self._stream_ends[s] = time.time() + self._streamTimes[s]
+
+        try:
+            # in case acquisition was cancelled, before the future was set
+            if self._cancelled:
+                f.cancel()
+                raise CancelledError()
+
+            # Get the hardware ready for the next stream, if it's not going to
+            # disturb any of the streams being acquired
+            i = self._streams.index(s)
+            if i + 1 < len(self._streams):
+                nxt = self._streams[i + 1]
+                with self._lock:
+                    busy = any(self._resources[o] & self._resources[nxt]
+                               for o in self._running if o is not s)
+                if nxt not in self._started and not busy:
+                    self._prepare_next(s, nxt)
+
+            # If it's a ProgressiveFuture, listen to the time update
+            try:
+                f.add_update_callback(self._on_progress_update)
+            except AttributeError:
+                pass # not a ProgressiveFuture, fine
+
+            return f.result()
+        finally:
+            with self._lock:
+                del self._running[s]
+                self._stream_ends[s] = time.time()
+            self._update_progress()
+
+    def _update_progress(self):
+        """
+        Update the end time of the whole acquisition, based on the streams
+        started, and the estimated times of the other ones.
+        """
+        with self._lock:
+            known_ends = dict(self._stream_ends)
+        end = _estimate_schedule_end(self._streams, self._resources,
+                                     self._streamTimes, known_ends, time.time())
+        self._future.set_progress(end=end)
+
+    def _prepare_next(self, current, nxt):
+        """
+        Start preparing the next stream (ie, change the optical path), while
+        the current stream is acquiring. It's only done if the current stream
+        doesn't depend on the optical path, as otherwise it would disturb its
+        acquisition.
+        current (Stream): the stream being acquired
+        nxt (Stream): the stream which will be acquired next
+        """
+        if ("path",) in self._requirements[current]:
+            return  # The optical path must not change during the acquisition
+        if ("path",) not in self._requirements[nxt]:
+            return  # Nothing to prepare in advance
+
+        logging.debug("Preparing stream %s during acquisition of %s",
+                      nxt.name.value, current.name.value)
+        try:
+            # The preparation runs in the background, and the stream will
+            # wait for it when starting its acquisition.
+            nxt.prepare()
+        except Exception:
+            logging.warning("Failed to prepare stream %s", nxt.name.value, exc_info=True)
+
     def _adjust_metadata(self, raw_data):
         """
         Update/adjust the metadata of the raw data received based on global
@@ -290,16 +610,32 @@ class AcquisitionTask(object):
 
     def _on_progress_update(self, f, start, end):
         """
-        Called when the current future has made a progress (and so it should
+        Called when the future of a stream has made a progress (and so it should
         provide a better time estimation).
         """
-        if self._current_future != f:
-            logging.warning("Progress update not from the current future: %s instead of %s",
-                            f, self._current_future)
-            return
+        with self._lock:
+            for s, fs in self._running.items():
+                if fs == f:
+                    self._stream_ends[s] = end
+                    break
+            else:
+                logging.warning("Progress update not from a current future: %s", f)
+                return
 
-        total_end = end + sum(self._streamTimes[s] for s in self._streams_left)
-        self._future.set_progress(end=total_end)
+        self._update_progress()
+
+    def _cancel_running(self):
+        """
+        Cancel all the stream acquisitions in progress
+        returns (bool): True if at least one acquisition was cancelled
+        """
+        with self._lock:
+            running = list(self._running.values())
+
+        cancelled = False
+        for f in running:
+            cancelled = f.cancel() or cancelled
+        return cancelled
 
     def cancel(self, future):
         """
@@ -308,13 +644,12 @@ class AcquisitionTask(object):
         # put the cancel flag
         self._cancelled = True
 
-        if self._current_future is not None:
-            cancelled = self._current_future.cancel()
-        else:
-            cancelled = False
+        cancelled = self._cancel_running()
 
         # Report it's too late for cancellation (and so result will come)
-        if not cancelled and not self._streams_left:
+        with self._lock:
+            all_started = len(self._started) == len(self._streams)
+        if not cancelled and all_started:
             return False
 
         return True
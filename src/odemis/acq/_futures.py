@@ -143,6 +143,10 @@ class SimpleStreamFuture(futures.Future):
         """
         called when a new image is generated, indicating end of acquisition
         """
+        # Partial image (progressive scanning) => wait for the complete one
+        if model.MD_VALID_ROWS in image.metadata:
+            return
+
         # Very unlikely, but make really sure we didn't get an image from a
         # previous subscription (with wrong HW settings)
         try:
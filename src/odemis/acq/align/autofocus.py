@@ -23,38 +23,31 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import collections
+from concurrent import futures
 from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, \
     RUNNING
 import logging
+import math
 import numpy
 from odemis import model
 from odemis.acq._futures import executeTask
 from odemis.model import InstantaneousFuture
+import odemis.util.focus as ufocus
 from odemis.util.img import Subtract
-from scipy import ndimage
 import threading
 import time
 
-import cv2
-
 
 MAX_STEPS_NUMBER = 100  # Max steps to perform autofocus
 MAX_BS_NUMBER = 1  # Maximum number of applying binary search with a smaller max_step
 
+# Autofocus methods
+MTD_BINARY = 0  # Move, stop, acquire... with a dichotomy search
+MTD_SWEEP = 1  # Acquire continuously while the focus moves at constant speed
 
-def _convertRBGToGrayscale(image):
-    """
-    Quick and dirty convertion of RGB data to grayscale
-    image (numpy array of shape YX3)
-    return (numpy array of shape YX)
-    """
-    r, g, b = image[:, :, 0], image[:, :, 1], image[:, :, 2]
-    gray = numpy.empty(image.shape[0:2], dtype="uint16")
-    gray[...] = r
-    gray += g
-    gray += b
-
-    return gray
+SWEEP_FRAMES = 30  # Number of frames to acquire during each sweep
+SWEEP_FINE_WIDTH = 4  # Width of the next sweep, in number of frames spacing of the previous one
+MAX_SWEEPS = 6  # Maximum number of sweeps to perform autofocus
 
 
 def MeasureSEMFocus(image):
@@ -64,12 +57,7 @@ def MeasureSEMFocus(image):
     image (model.DataArray): SEM image
     returns (float): The focus level of the SEM image (higher is better)
     """
-    # Handle RGB image
-    if len(image.shape) == 3:
-        # TODO find faster/better solution
-        image = _convertRBGToGrayscale(image)
-
-    return ndimage.standard_deviation(image)
+    return ufocus.MeasureFocus(image, ufocus.FM_STD)
 
 
 def MeasureOpticalFocus(image):
@@ -79,12 +67,7 @@ def MeasureOpticalFocus(image):
     image (model.DataArray): Optical image
     returns (float): The focus level of the optical image (higher is better)
     """
-    # Handle RGB image
-    if len(image.shape) == 3:
-        # TODO find faster/better solution
-        image = _convertRBGToGrayscale(image)
-
-    return cv2.Laplacian(image, cv2.CV_64F).var()
+    return ufocus.MeasureFocus(image, ufocus.FM_LAPLACIAN)
 
 
 def AcquireNoBackground(ccd, dfbkg=None):
@@ -118,6 +101,49 @@ def _discard_data(df, data):
     pass
 
 
+def _getDepthOfField(detector, emt):
+    """
+    Finds the depth of field of the imaging system
+    detector: model.DigitalCamera or model.Detector
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    returns (0<float): depth of field (m)
+    """
+    avail_depths = (detector, emt)
+    if model.hasVA(emt, "dwellTime"):
+        # Hack in case of using the e-beam with a DigitalCamera detector.
+        # All the digital cameras have a depthOfField, which is updated based
+        # on the optical lens properties... but the depthOfField in this
+        # case depends on the e-beam lens.
+        avail_depths = (emt, detector)
+    for c in avail_depths:
+        if model.hasVA(c, "depthOfField"):
+            dof = c.depthOfField.value
+            break
+    else:
+        logging.debug("No depth of field info found")
+        dof = 1e-6  # m, not too bad value
+    logging.debug("Depth of field is %f", dof)
+    return dof
+
+
+def _getFocusMeasure(detector):
+    """
+    Picks the function to measure the focus level of the images of a detector
+    detector: model.DigitalCamera or model.Detector
+    returns (callable DataArray -> float): the focus measure function
+    """
+    # Pick measurement method based on the heuristics that SEM detectors
+    # are typically just a point (ie, shape == data depth).
+    # TODO: is this working as expected? Alternatively, we could check
+    # MD_DET_TYPE.
+    if len(detector.shape) > 1:
+        logging.debug("Using Optical method to estimate focus")
+        return MeasureOpticalFocus
+    else:
+        logging.debug("Using SEM method to estimate focus")
+        return MeasureSEMFocus
+
+
 def _DoAutoFocus(future, detector, emt, focus, dfbkg, good_focus):
     """
     Iteratively acquires an optical image, measures its focus level and adjusts
@@ -153,21 +179,7 @@ def _DoAutoFocus(future, detector, emt, focus, dfbkg, good_focus):
 
     try:
         # use the .depthOfField on detector or emitter as maximum stepsize
-        avail_depths = (detector, emt)
-        if model.hasVA(emt, "dwellTime"):
-            # Hack in case of using the e-beam with a DigitalCamera detector.
-            # All the digital cameras have a depthOfField, which is updated based
-            # on the optical lens properties... but the depthOfField in this
-            # case depends on the e-beam lens.
-            avail_depths = (emt, detector)
-        for c in avail_depths:
-            if model.hasVA(c, "depthOfField"):
-                dof = c.depthOfField.value
-                break
-        else:
-            logging.debug("No depth of field info found")
-            dof = 1e-6  # m, not too bad value
-        logging.debug("Depth of field is %f", dof)
+        dof = _getDepthOfField(detector, emt)
         min_step = dof / 2
 
         rng = focus.axes["z"].range
@@ -185,16 +197,7 @@ def _DoAutoFocus(future, detector, emt, focus, dfbkg, good_focus):
         best_fm = 0
         last_pos = None
 
-        # Pick measurement method based on the heuristics that SEM detectors
-        # are typically just a point (ie, shape == data depth).
-        # TODO: is this working as expected? Alternatively, we could check
-        # MD_DET_TYPE.
-        if len(detector.shape) > 1:
-            logging.debug("Using Optical method to estimate focus")
-            Measure = MeasureOpticalFocus
-        else:
-            logging.debug("Using SEM method to estimate focus")
-            Measure = MeasureSEMFocus
+        Measure = _getFocusMeasure(detector)
 
         step_factor = 2 ** 7
         if good_focus is not None:
@@ -317,6 +320,201 @@ def _DoAutoFocus(future, detector, emt, focus, dfbkg, good_focus):
             future._autofocus_state = FINISHED
 
 
+def _fitFocusPeak(positions, levels):
+    """
+    Finds the position of the maximum of the focus level curve, by fitting a
+    parabola on the points around the best measured focus level.
+    positions (list of floats): focus positions, in increasing order
+    levels (list of floats): focus level at each position
+    returns:
+        (float): position of the peak
+        (float): focus level at the peak
+    """
+    positions = numpy.asarray(positions)
+    levels = numpy.asarray(levels)
+    i = int(numpy.argmax(levels))
+    sl = slice(max(0, i - 2), i + 3)
+    pos, lvl = positions[sl], levels[sl]
+    if len(pos) < 3:
+        return float(positions[i]), float(levels[i])
+
+    # Center and scale the positions, to keep the fit well conditioned
+    scale = (pos[-1] - pos[0]) / 2 or 1
+    x = (pos - positions[i]) / scale
+    a, b, c = numpy.polyfit(x, lvl, 2)
+    if a >= 0:  # Not a peak (flat or noisy curve) => keep the best measured
+        return float(positions[i]), float(levels[i])
+
+    xp = min(max(x[0], -b / (2 * a)), x[-1])
+    return float(positions[i] + xp * scale), float(numpy.polyval((a, b, c), xp))
+
+
+def _sweepFocus(future, detector, focus, start, end, period, measure, bkg=None):
+    """
+    Moves the focus at constant speed while acquiring images, and measures the
+    focus level of each of them.
+    future (model.ProgressiveFuture): Progressive future of the autofocus
+    detector: model.DigitalCamera or model.Detector
+    focus (model.Actuator): The focus actuator, with a speed VA
+    start (float): the focus position at the beginning of the sweep
+    end (float): the focus position at the end of the sweep
+    period (0<float): expected time between two frames (s)
+    measure (callable DataArray -> float): focus measure function
+    bkg (None or DataArray): background image to subtract from each image
+    returns:
+        (list of floats): focus positions of each frame, in increasing order
+        (list of floats): focus level of each frame
+        (float): time between two frames actually measured (s)
+    raises:
+        CancelledError if cancelled
+    """
+    focus.moveAbsSync({"z": start})
+    # Move slow enough to get the requested number of frames
+    srng = focus.speed.range
+    speed = abs(end - start) / (SWEEP_FRAMES * period)
+    speed = min(max(srng[0], speed), srng[1])
+    focus.speed.value = dict(focus.speed.value, z=speed)
+    logging.debug("Sweeping focus from %g to %g at %g m/s", start, end, speed)
+
+    frames = []  # (time of reception, DataArray)
+    def on_data(df, data):
+        frames.append((time.time(), data))
+
+    # The focus position is linearly interpolated between each known position
+    pos_samples = []  # (time, position)
+    def on_position(pos):
+        pos_samples.append((time.time(), pos["z"]))
+
+    detector.data.subscribe(on_data)
+    try:
+        pos_samples.append((time.time(), focus.position.value["z"]))
+        focus.position.subscribe(on_position)
+        f = focus.moveAbs({"z": end})
+        while True:
+            try:
+                f.result(timeout=0.1)
+                break
+            except futures.TimeoutError:
+                if future._autofocus_state == CANCELLED:
+                    f.cancel()
+                    focus.stop()
+                    raise CancelledError()
+        pos_samples.append((time.time(), focus.position.value["z"]))
+    finally:
+        detector.data.unsubscribe(on_data)
+        focus.position.unsubscribe(on_position)
+
+    # Find the time of the middle of the exposure of each frame
+    frame_times = []
+    for trecv, da in frames:
+        exp = da.metadata.get(model.MD_EXP_TIME, period)
+        if model.MD_ACQ_DATE in da.metadata:
+            frame_times.append(da.metadata[model.MD_ACQ_DATE] + exp / 2)
+        else:
+            frame_times.append(trecv - exp / 2)
+    if len(frames) >= 2:
+        period = (frames[-1][0] - frames[0][0]) / (len(frames) - 1)
+
+    # Only keep the frames acquired during the move
+    pos_samples.sort()
+    tstart, tend = pos_samples[0][0], pos_samples[-1][0]
+    frames = [(t, da) for t, (tr, da) in zip(frame_times, frames) if tstart <= t <= tend]
+    times = [t for t, da in frames]
+    positions = numpy.interp(times, [t for t, p in pos_samples],
+                             [p for t, p in pos_samples])
+
+    levels = []
+    for t, da in frames:
+        if bkg is not None:
+            da = Subtract(da, bkg)
+        levels.append(measure(da))
+
+    order = numpy.argsort(positions)
+    return positions[order].tolist(), [levels[i] for i in order], period
+
+
+def _DoSweepAutoFocus(future, detector, emt, focus, dfbkg, good_focus, period):
+    """
+    Sweeps the focus range while acquiring continuously, estimates the best
+    focus by fitting the focus levels, and then sweeps again a smaller range
+    around it with a smaller speed, until the frames are closer than the depth
+    of field.
+    Same arguments and return values as _DoAutoFocus(), and:
+    period (0<float): expected time between two frames (s)
+    """
+    logging.debug("Starting sweep Autofocus...")
+
+    orig_speed = focus.speed.value
+    best_pos = focus.position.value["z"]
+    try:
+        dof = _getDepthOfField(detector, emt)
+        Measure = _getFocusMeasure(detector)
+        rng = focus.axes["z"].range
+        center, width = (rng[0] + rng[1]) / 2, rng[1] - rng[0]
+        if good_focus is not None:
+            # Just look around the known good position
+            center, width = good_focus, width / 2 ** 4
+
+        bkg = None
+        if dfbkg is not None:
+            # The background doesn't depend on the focus, so acquire it just once
+            bkg = detector.data.get(asap=False)
+            dfbkg.subscribe(_discard_data)
+
+        try:
+            for i in range(MAX_SWEEPS):
+                tstart = time.time()
+                start, end = max(rng[0], center - width / 2), min(rng[1], center + width / 2)
+                # Start from the closest side
+                current = focus.position.value["z"]
+                if abs(current - end) < abs(current - start):
+                    start, end = end, start
+
+                pos, lvls, period = _sweepFocus(future, detector, focus, start, end,
+                                                period, Measure, bkg)
+                if len(pos) < 3:
+                    raise IOError("Only %d frames acquired during focus sweep" % (len(pos),))
+                center, best_fm = _fitFocusPeak(pos, lvls)
+                best_pos = center
+                spacing = abs(end - start) / (len(pos) - 1)
+                logging.debug("Sweep %d found focus level %g @ %g m (frames every %g m)",
+                              i, best_fm, center, spacing)
+
+                if future._autofocus_state == CANCELLED:
+                    raise CancelledError()
+                if spacing <= dof:
+                    break
+
+                # Expect the next sweeps to take the same time
+                width = SWEEP_FINE_WIDTH * spacing
+                nsweeps = math.ceil(math.log(spacing / dof) /
+                                    math.log(SWEEP_FRAMES / SWEEP_FINE_WIDTH))
+                future.set_progress(end=time.time() + (time.time() - tstart) * nsweeps)
+
+            focus.moveAbsSync({"z": best_pos})
+            # Measure the actual focus level at the final position
+            image = detector.data.get(asap=False)
+            if bkg is not None:
+                image = Subtract(image, bkg)
+            best_fm = Measure(image)
+        finally:
+            if dfbkg is not None:
+                dfbkg.unsubscribe(_discard_data)
+
+        logging.info("Auto focus found best level %g @ %g m", best_fm, best_pos)
+        return best_pos, best_fm
+
+    except CancelledError:
+        # Go to the best position known so far
+        focus.moveAbsSync({"z": best_pos})
+    finally:
+        focus.speed.value = orig_speed
+        with future._autofocus_lock:
+            if future._autofocus_state == CANCELLED:
+                raise CancelledError()
+            future._autofocus_state = FINISHED
+
+
 def _CancelAutoFocus(future):
     """
     Canceller of _DoAutoFocus task.
@@ -340,7 +538,7 @@ def estimateAutoFocusTime(exposure_time, steps=MAX_STEPS_NUMBER):
     return steps * exposure_time
 
 
-def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None):
+def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None, method=MTD_BINARY):
     """
     Wrapper for DoAutoFocus. It provides the ability to check the progress of autofocus 
     procedure or even cancel it.
@@ -354,6 +552,9 @@ def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None):
      performed.
     good_focus (float): if provided, an already known good focus position to be
       taken into consideration while autofocusing
+    method (MTD_*): MTD_BINARY to acquire images at fixed focus positions,
+      MTD_SWEEP to acquire images while the focus moves (faster, but requires
+      a focus actuator with a speed VA).
     returns (model.ProgressiveFuture):  Progress of DoAutoFocus, whose result() will return:
             Focus position (m)
             Focus level
@@ -370,17 +571,27 @@ def AutoFocus(detector, emt, focus, dfbkg=None, good_focus=None):
         # thing the caller will care about.
         et = 1
 
+    if method == MTD_SWEEP and not model.hasVA(focus, "speed"):
+        logging.info("Focus actuator %s has no speed, will use binary search",
+                     focus.name)
+        method = MTD_BINARY
+
+    steps = SWEEP_FRAMES * 3 if method == MTD_SWEEP else MAX_STEPS_NUMBER
     f = model.ProgressiveFuture(start=est_start,
-                                end=est_start + estimateAutoFocusTime(et))
+                                end=est_start + estimateAutoFocusTime(et, steps))
     f._autofocus_state = RUNNING
     f._autofocus_lock = threading.Lock()
     f.task_canceller = _CancelAutoFocus
 
+    if method == MTD_SWEEP:
+        args = (f, _DoSweepAutoFocus, f, detector, emt, focus, dfbkg, good_focus, et)
+    else:
+        args = (f, _DoAutoFocus, f, detector, emt, focus, dfbkg, good_focus)
+
     # Run in separate thread
     autofocus_thread = threading.Thread(target=executeTask,
                                         name="Autofocus",
-                                        args=(f, _DoAutoFocus, f, detector, emt,
-                                              focus, dfbkg, good_focus))
+                                        args=args)
 
     autofocus_thread.start()
     return f
@@ -27,7 +27,6 @@ import logging
 import math
 from numpy import fft
 from numpy import histogram
-from numpy import unravel_index
 import numpy
 from odemis import model
 import operator
@@ -45,19 +44,11 @@ SHIFT_THRESHOLD = 0.04  # When to still perform the shift (percentage)
 DIFF_NUMBER = 0.95  # Number of values that should be within the allowed difference
 
 
-def DivideInNeighborhoods(data, number_of_spots, scale, sensitivity_limit=100):
+def _FilterImage(data):
     """
-    Given an image that includes N spots, divides it in N subimages with each of them
-    to include one spot. Briefly, it filters the image, finds the N “brightest” spots
-    and crops the region around them generating the subimages. This process is repeated
-    until image division is feasible.
+    Prepares the image for spot detection: removes the noise and the background
     data (model.DataArray): 2D array containing the intensity of each pixel
-    number_of_spots (int,int): The number of CL spots
-    scale (float): Distance between spots in optical grid (in pixels)
-    sensitivity_limit (int): Limit of sensitivity
-    returns subimages (List of DataArrays): One subimage per spot
-            subimage_coordinates (List of tuples): The coordinates of the center of each
-                                                subimage with respect to the overall image
+    returns (model.DataArray): the filtered image
     """
     # Denoise
     filtered_image = ndimage.median_filter(data, 3)
@@ -67,89 +58,176 @@ def DivideInNeighborhoods(data, number_of_spots, scale, sensitivity_limit=100):
     # spot
     filtered_image = _BandPassFilter(filtered_image, 1, 20)
 
-    image = model.DataArray(filtered_image, data.metadata)
-    avg_intensity = numpy.average(image)
+    return model.DataArray(filtered_image, data.metadata)
 
-    spot_factor = 10
-    step = 1
-    sensitivity = 4
 
+def _FindSpotCandidates(image, sensitivity_limit):
+    """
+    Finds all the local maxima of the image which could be a spot, and ranks
+    them by contrast.
+    image (model.DataArray): filtered image (cf _FilterImage())
+    sensitivity_limit (int): Limit of sensitivity. Only the maxima with a
+      contrast higher than the image range divided by this value are kept.
+    returns (list of tuple (int, tuple of slices)): index (in raster order)
+      and the position of each local maxima, ordered from the highest contrast
+      to the lowest one.
+    """
+    spot_factor = 10
     # After filtering based on optical scale there is no need to adjust
     # filter window size
     filter_window_size = 8
 
-    # Increase sensitivity until expected number of spots is detected
-    while sensitivity <= sensitivity_limit:
-        subimage_coordinates = []
-        subimages = []
-
-        i_max, j_max = unravel_index(image.argmax(), image.shape)
-        i_min, j_min = unravel_index(image.argmin(), image.shape)
-        max_diff = image[i_max, j_max] - image[i_min, j_min]
-        data_max = filters.maximum_filter(image, filter_window_size)
-        data_min = filters.minimum_filter(image, filter_window_size)
-
-        # Determine threshold
-        i = sensitivity
-        threshold = max_diff / i
-
-        # Filter the parts of the image with variance in intensity greater
-        # than the threshold
-        maxima = (image == data_max)
-        diff = ((data_max - data_min) > threshold)
-        maxima[diff == 0] = 0
-
-        labeled, num_objects = ndimage.label(maxima)
-
-        slices = ndimage.find_objects(labeled)
+    avg_intensity = numpy.average(image)
+    max_diff = image.max() - image.min()
+    # The filters are computed just once, and the threshold is only applied
+    # afterwards, by taking the best candidates.
+    data_max = filters.maximum_filter(image, filter_window_size)
+    data_min = filters.minimum_filter(image, filter_window_size)
+    contrast = data_max - data_min
+
+    # The maximum is also the maximum of the subimage, so it's at least needed
+    # that it's bright enough.
+    maxima = ((image == data_max) & (contrast > max_diff / sensitivity_limit) &
+              (image > spot_factor * avg_intensity))
+    labeled, num_objects = ndimage.label(maxima)
+    if num_objects == 0:
+        return []
+    slices = ndimage.find_objects(labeled)
+    # Only look at the maxima pixels, which is much faster than the whole image
+    obj_contrast = ndimage.maximum(contrast[maxima], labeled[maxima],
+                                   range(1, num_objects + 1))
+
+    candidates = []
+    for i, ((dy, dx), c) in enumerate(zip(slices, obj_contrast)):
+        subimage = image[int(dy.start - 2.5):int(dy.stop + 2.5),
+                         int(dx.start - 2.5):int(dx.stop + 2.5)]
+        if subimage.shape[0] == 0 or subimage.shape[1] == 0:
+            continue
+
+        if (subimage > spot_factor * avg_intensity).sum() < 6:
+            continue
+
+        candidates.append((c, i, (dy, dx)))
+
+    # Sort is stable, so same contrast are kept in raster order
+    candidates.sort(key=lambda c:-c[0])
+    return [(i, sl) for c, i, sl in candidates]
+
+
+def _SelectSpots(image, candidates, scale):
+    """
+    Crops the region around each spot
+    image (model.DataArray): filtered image
+    candidates (list of tuple (int, tuple of slices)): the spots to select
+    scale (float): Distance between spots in optical grid (in pixels)
+    returns subimages (List of DataArrays): One subimage per spot
+            subimage_coordinates (List of tuples): The coordinates of the center of each
+                                                subimage with respect to the overall image
+    """
+    subimage_coordinates = []
+    subimages = []
+    (x_center_last, y_center_last) = (-10, -10)
 
-        (x_center_last, y_center_last) = (-10, -10)
+    # Go through these parts (in raster order) and crop the subimages
+    for i, (dy, dx) in sorted(candidates):
+        x_center = (dx.start + dx.stop - 1) / 2
+        y_center = (dy.start + dy.stop - 1) / 2
 
-        # Go through these parts and crop the subimages based on the neighborhood_size
-        # value
-        for dy, dx in slices:
-            x_center = (dx.start + dx.stop - 1) / 2
-            y_center = (dy.start + dy.stop - 1) / 2
+        subimage = image[int(dy.start - 2.5):int(dy.stop + 2.5),
+                         int(dx.start - 2.5):int(dx.stop + 2.5)]
 
-            # Make sure we don't detect spots on the top of each other
-            tab = tuple(map(operator.sub, (x_center_last, y_center_last),
-                            (x_center, y_center)))
+        # if spots detected too close keep the brightest one
+        if subimages and (math.hypot(x_center_last - x_center,
+                                     y_center_last - y_center) < (scale / 2)):
+            if numpy.sum(subimage) > numpy.sum(subimages[-1]):
+                subimages[-1] = subimage
+                subimage_coordinates[-1] = (x_center, y_center)
+        else:
+            subimage_coordinates.append((x_center, y_center))
+            subimages.append(subimage)
 
-            subimage = image[int(dy.start - 2.5):int(dy.stop + 2.5),
-                             int(dx.start - 2.5):int(dx.stop + 2.5)]
+        (x_center_last, y_center_last) = (x_center, y_center)
 
-            if subimage.shape[0] == 0 or subimage.shape[1] == 0:
-                continue
+    return subimages, subimage_coordinates
 
-            if (subimage > spot_factor * avg_intensity).sum() < 6:
-                continue
 
-            # if spots detected too close keep the brightest one
-            if (len(subimages) > 0) and (math.hypot(tab[0], tab[1]) < (scale / 2)):
-                if numpy.sum(subimage) > numpy.sum(subimages[len(subimages) - 1]):
-                    subimages.pop()
-                    subimage_coordinates.pop()
-                    subimage_coordinates.append((x_center, y_center))
-                    subimages.append(subimage)
-            else:
-                subimage_coordinates.append((x_center, y_center))
-                subimages.append(subimage)
+def _DetectSpots(data, number_of_spots, scale, sensitivity_limit=100):
+    """
+    Finds the N best spots of an image.
+    Same arguments as DivideInNeighborhoods()
+    returns image (model.DataArray): the filtered image
+            subimages (List of DataArrays): One subimage per spot
+            subimage_coordinates (List of tuples): The coordinates of the center of each
+                                                subimage with respect to the overall image
+    """
+    image = _FilterImage(data)
+    candidates = _FindSpotCandidates(image, sensitivity_limit)
 
-            (x_center_last, y_center_last) = (x_center, y_center)
+    # Take the best spots, and as long as some of them are discarded, take
+    # the next best ones.
+    expected_spots = numpy.prod(number_of_spots)
+    n = min(expected_spots, len(candidates))
+    while True:
+        subimages, subimage_coordinates = _SelectSpots(image, candidates[:n], scale)
 
         # Take care of outliers
-        expected_spots = numpy.prod(number_of_spots)
         clean_subimages, clean_subimage_coordinates = FilterOutliers(image, subimages,
                                                                      subimage_coordinates,
                                                                      expected_spots)
-        if len(clean_subimages) >= numpy.prod(number_of_spots):
+        if len(clean_subimages) >= expected_spots or n >= len(candidates):
             break
+        n = min(len(candidates), n + max(1, expected_spots - len(clean_subimages)))
 
-        if sensitivity > 4:
-            step = 4
-        sensitivity += step
+    return image, clean_subimages, clean_subimage_coordinates
 
-    return clean_subimages, clean_subimage_coordinates
+
+def DivideInNeighborhoods(data, number_of_spots, scale, sensitivity_limit=100):
+    """
+    Given an image that includes N spots, divides it in N subimages with each of them
+    to include one spot. Briefly, it filters the image, finds the N “brightest” spots
+    and crops the region around them generating the subimages. If some spots
+    are discarded (eg, cosmic rays, or too close spots), the next brightest ones
+    are used.
+    data (model.DataArray): 2D array containing the intensity of each pixel
+    number_of_spots (int,int): The number of CL spots
+    scale (float): Distance between spots in optical grid (in pixels)
+    sensitivity_limit (int): Limit of sensitivity
+    returns subimages (List of DataArrays): One subimage per spot
+            subimage_coordinates (List of tuples): The coordinates of the center of each
+                                                subimage with respect to the overall image
+    """
+    image, subimages, subimage_coordinates = _DetectSpots(data, number_of_spots,
+                                                          scale, sensitivity_limit)
+    return subimages, subimage_coordinates
+
+
+def FindSpotCenters(data, number_of_spots, scale, sensitivity_limit=100):
+    """
+    Finds the position of the N spots of an image. It's similar to calling
+    DivideInNeighborhoods(), FindCenterCoordinates() on each subimage, and
+    ReconstructCoordinates(), but faster, although less precise, as the center
+    is the centroid of each spot.
+    Same arguments as DivideInNeighborhoods()
+    returns (List of tuples): Coordinates of the spots in the image (in px)
+    """
+    image, subimages, subimage_coordinates = _DetectSpots(data, number_of_spots,
+                                                          scale, sensitivity_limit)
+    if not subimage_coordinates:
+        return []
+
+    # Compute the centroid of all the spots at once, on a small window around
+    # each spot.
+    labels = numpy.zeros(image.shape, dtype=numpy.int32)
+    hw = max(2, int(scale / 4))
+    for i, (x, y) in enumerate(subimage_coordinates):
+        x, y = int(round(x)), int(round(y))
+        labels[max(0, y - hw):y + hw + 1, max(0, x - hw):x + hw + 1] = i + 1
+
+    signal = numpy.clip(image, 0, None)
+    centers = ndimage.center_of_mass(signal, labels, range(1, len(subimage_coordinates) + 1))
+    # Spot without any signal => keep the maximum position
+    return [(c[1], c[0]) if not any(math.isnan(v) for v in c) else sc
+            for c, sc in zip(centers, subimage_coordinates)]
 
 
 def ReconstructCoordinates(subimage_coordinates, spot_coordinates):
@@ -238,7 +316,8 @@ def FilterOutliers(image, subimages, subimage_coordinates, expected_spots):
     return clean_subimages, clean_subimage_coordinates
 
 
-def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_allowed_diff):
+def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_allowed_diff,
+                     guess_transform=None):
     """
     Orders the list of spot coordinates of the grid in the electron image in order to
     match the corresponding spot coordinates generated by FindCenterCoordinates.
@@ -246,6 +325,10 @@ def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_a
     electron_coordinates (List of tuples): Coordinates of spots in electron image
     guess_scale (float): Guess scaling for the first transformation
     max_allowed_diff (float): Maximum allowed difference in electron coordinates
+    guess_transform (None or array of shape 2x3): Affine transformation from
+      optical to electron coordinates, used for the first transformation
+      instead of just the guess scaling (eg, the result of a previous match,
+      see EstimateAffineTransform()).
     returns (List of tuples): Ordered list of coordinates in electron image with respect
                                 to the order in the electron image
             (List of tuples): List of coordinates in optical image corresponding to the
@@ -262,7 +345,12 @@ def MatchCoordinates(input_coordinates, electron_coordinates, guess_scale, max_a
         return [], []
 
     # Informed guess
-    guess_coordinates = _TransformCoordinates(optical_coordinates, (0, 0), 0, (guess_scale, guess_scale))
+    if guess_transform is None:
+        guess_coordinates = _TransformCoordinates(optical_coordinates, (0, 0), 0, (guess_scale, guess_scale))
+    else:
+        oc = numpy.asarray(optical_coordinates, dtype=numpy.float64)
+        gt = numpy.asarray(guess_transform, dtype=numpy.float64)
+        guess_coordinates = [tuple(c) for c in oc.dot(gt[:, :2].T) + gt[:, 2]]
 
     # Overlay center
     guess_center = numpy.mean(guess_coordinates, 0) - numpy.mean(electron_coordinates, 0)
@@ -340,6 +428,25 @@ def _KNNsearch(x_coordinates, y_coordinates):
     return list_index
 
 
+def EstimateAffineTransform(src_coordinates, dst_coordinates):
+    """
+    Computes the affine transformation which best maps (least squares) a list
+    of coordinates onto another one.
+    src_coordinates (List of tuples): Coordinates to transform
+    dst_coordinates (List of tuples): Corresponding target coordinates
+    returns (array of shape 2x3): the matrix A, so that dst = A . (x, y, 1)
+    raises ValueError: if there are not enough coordinates
+    """
+    src = numpy.asarray(src_coordinates, dtype=numpy.float64)
+    dst = numpy.asarray(dst_coordinates, dtype=numpy.float64)
+    if len(src) != len(dst) or len(src) < 3:
+        raise ValueError("Need at least 3 pairs of coordinates, but got %d and %d"
+                         % (len(src), len(dst)))
+    x_array = numpy.column_stack((src, numpy.ones(len(src))))
+    a = numpy.linalg.lstsq(x_array, dst)[0]
+    return a.T
+
+
 def _TransformCoordinates(x_coordinates, translation, rotation, scale):
     """
     Transforms the x_coordinates according to the parameters.
@@ -42,6 +42,13 @@ from .images import GridScanner
 
 MAX_TRIALS_NUMBER = 2  # Maximum number of scan grid repetitions
 
+# (repetitions, e-beam pixel size, e-beam scale, e-beam rotation, optical
+# pixel size) -> (time, affine transform (2x3 array) from optical to electron
+# coordinates) found during the last successful overlay with these settings.
+# Used as starting guess, if not older than TRANSFORM_MAX_AGE.
+_last_transforms = {}
+TRANSFORM_MAX_AGE = 600  # s, after which the sample/stage has likely moved too much
+
 
 def FindOverlay(repetitions, dwell_time, max_allowed_diff, escan, ccd, detector, skew=False, bgsub=False):
     """
@@ -73,6 +80,7 @@ def FindOverlay(repetitions, dwell_time, max_allowed_diff, escan, ccd, detector,
     f.task_canceller = _CancelFindOverlay
     f._overlay_lock = threading.Lock()
     f._done = threading.Event()
+    f._timings = {}  # phase name -> time spent (s)
 
     # Create scanner for scan grid
     f._scanner = GridScanner(repetitions, dwell_time, escan, ccd, detector, bgsub)
@@ -98,6 +106,7 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
     DivideInNeighborhoods->FindCenterCoordinates-> ReconstructCoordinates->MatchCoordinates->
     CalculateTransform). In case matching the coordinates is infeasible, it automatically
     repeats grid scan -and thus all steps until matching- with different parameters.
+    The time spent in each phase is logged (and stored in future._timings).
     future (model.ProgressiveFuture): Progressive future provided by the wrapper
     repetitions (tuple of ints): The number of CL spots are used
     dwell_time (float): Time to scan each spot (in s)
@@ -117,6 +126,8 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
     """
     logging.debug("Starting Overlay...")
 
+    timings = future._timings
+    scanner = future._scanner
     try:
         # Repeat until we can find overlay (matching coordinates is feasible)
         for trial in range(MAX_TRIALS_NUMBER):
@@ -126,98 +137,36 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
 
             # Update progress of the future (it may be the second trial)
             future.set_progress(end=time.time() +
-                                estimateOverlayTime(future._scanner.dwell_time,
+                                estimateOverlayTime(scanner.dwell_time,
                                                     repetitions))
 
             # Wait for ScanGrid to finish
-            optical_image, electron_coordinates, electron_scale = future._scanner.DoAcquisition()
+            tstart = time.time()
+            optical_image, electron_coordinates, electron_scale = scanner.DoAcquisition()
+            _addPhaseTime(timings, "scan", tstart)
             if future._find_overlay_state == CANCELLED:
                 raise CancelledError()
 
             # Update remaining time to 6secs (hardcoded estimation)
             future.set_progress(end=time.time() + 6)
 
-            # Check if ScanGrid gave one image or list of images
-            # If it is a list, follow the "one image per spot" procedure
-            logging.debug("Isolating spots...")
-            if isinstance(optical_image, list):
-                opt_img_shape = optical_image[0].shape
-                subimages = []
-                subimage_coordinates = []
-                for img in optical_image:
-                    subspots, subspot_coordinates = coordinates.DivideInNeighborhoods(img, (1, 1), img.shape[0] / 2)
-                    subimages.append(subspots[0])
-                    subimage_coordinates.append(subspot_coordinates[0])
-            else:
-                # Distance between spots in the optical image (in optical pixels)
-                optical_dist = escan.pixelSize.value[0] * electron_scale[0] / optical_image.metadata[model.MD_PIXEL_SIZE][0]
-                opt_img_shape = optical_image.shape
-
-                # Isolate spots
-                if future._find_overlay_state == CANCELLED:
-                    raise CancelledError()
-                subimages, subimage_coordinates = coordinates.DivideInNeighborhoods(optical_image, repetitions, optical_dist)
-
-            if not subimages:
-                raise ValueError("Overlay failure")
-
-            # Find the centers of the spots
-            if future._find_overlay_state == CANCELLED:
-                raise CancelledError()
-            logging.debug("Finding spot centers with %d subimages...", len(subimages))
-            spot_coordinates = [spot.FindCenterCoordinates(i) for i in subimages]
-
-            # Reconstruct the optical coordinates
-            if future._find_overlay_state == CANCELLED:
-                raise CancelledError()
-            optical_coordinates = coordinates.ReconstructCoordinates(subimage_coordinates, spot_coordinates)
-
-            # Check if SEM calibration is correct. If this is not the case
-            # generate a warning message and provide the ratio of X/Y scale.
-            ratio = _computeGridRatio(optical_coordinates, repetitions)
-            if not (0.9 < ratio < 1.1):
-                logging.warning("SEM may needs calibration. X/Y ratio is %f.", ratio)
-            else:
-                logging.info("SEM X/Y ratio is %f.", ratio)
-
-            opt_offset = (opt_img_shape[1] / 2, opt_img_shape[0] / 2)
-
-            optical_coordinates = [(x - opt_offset[0], y - opt_offset[1]) for x, y in optical_coordinates]
-
-            # TODO: Make function for scale calculation
-            # Estimate the scale by measuring the distance between the first
-            # two spots in optical and electron coordinates.
-            #  * For electrons, it's easy as we've placed them.
-            #  * For optical, we pick one spot, and measure the distance to the
-            #    closest spot. Should be more precise than previous estimation.
-            p1 = optical_coordinates[0]
-            def dist_to_p1(p):
-                diff = [a - b for a, b in zip(p1, p)]
-                return math.hypot(*diff)
-            optical_dist = min(dist_to_p1(p) for p in optical_coordinates[1:])
-            scale = electron_scale[0] / optical_dist
-
-            # max_allowed_diff in pixels
-            max_allowed_diff_px = max_allowed_diff / escan.pixelSize.value[0]
-
-            # Match the electron to optical coordinates
-            if future._find_overlay_state == CANCELLED:
-                raise CancelledError()
-
-            logging.debug("Matching coordinates...")
-            known_ec, known_oc = coordinates.MatchCoordinates(optical_coordinates,
-                                                              electron_coordinates,
-                                                              scale,
-                                                              max_allowed_diff_px)
+            known_ec, known_oc = _matchGrid(future, optical_image, electron_coordinates,
+                                            electron_scale, repetitions,
+                                            max_allowed_diff, escan, timings)
             if known_ec:
                 break
             else:
                 if trial < MAX_TRIALS_NUMBER - 1:
-                    future._scanner.dwell_time = future._scanner.dwell_time * 1.2 + 0.1
-                    logging.warning("Trying with dwell time = %g s...", future._scanner.dwell_time)
+                    with future._overlay_lock:
+                        if future._find_overlay_state == CANCELLED:
+                            raise CancelledError()
+                        scanner = GridScanner(repetitions, scanner.dwell_time * 1.2 + 0.1,
+                                              escan, ccd, detector, scanner.bgsub)
+                        future._scanner = scanner
+                    logging.warning("Trying with dwell time = %g s...", scanner.dwell_time)
         else:
             # Make failure report
-            _MakeReport(optical_image, repetitions, escan.magnification.value, escan.pixelSize.value, dwell_time, electron_coordinates)
+            _MakeReport(optical_image, repetitions, escan.magnification.value, escan.pixelSize.value, scanner.dwell_time, electron_coordinates)
             raise ValueError("Overlay failure")
 
         # Calculate transformation parameters
@@ -228,11 +177,12 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
         future.set_progress(end=time.time() + 1)
 
         logging.debug("Calculating transformation...")
+        tstart = time.time()
         try:
             ret = transform.CalculateTransform(known_ec, known_oc, skew)
         except ValueError as exp:
             # Make failure report
-            _MakeReport(optical_image, repetitions, escan.magnification.value, escan.pixelSize.value, dwell_time, electron_coordinates)
+            _MakeReport(optical_image, repetitions, escan.magnification.value, escan.pixelSize.value, scanner.dwell_time, electron_coordinates)
             raise ValueError("Overlay failure: %s" % (exp,))
 
         if future._find_overlay_state == CANCELLED:
@@ -243,9 +193,11 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
             transform_d, skew_d = _transformMetadata(optical_image, ret, escan, ccd, skew)
             transform_data = (transform_d, skew_d)
         else:
-            transform_d = _transformMetadata(optical_image, ret, escan, ccd, skew)  # Also indicate which dwell time eventually worked
+            transform_d = _transformMetadata(optical_image, ret, escan, ccd, skew)
             transform_data = transform_d
-        transform_d[model.MD_DWELL_TIME] = dwell_time
+        # Also indicate which dwell time eventually worked
+        transform_d[model.MD_DWELL_TIME] = scanner.dwell_time
+        _addPhaseTime(timings, "transform", tstart)
 
         logging.debug("Overlay done.")
         return ret, transform_data
@@ -255,6 +207,8 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
         logging.debug("Finding overlay failed", exc_info=1)
         raise exp
     finally:
+        logging.info("Overlay time per phase: %s",
+                     ", ".join("%s = %.3f s" % (p, t) for p, t in sorted(timings.items())))
         with future._overlay_lock:
             future._done.set()
             if future._find_overlay_state == CANCELLED:
@@ -262,6 +216,160 @@ def _DoFindOverlay(future, repetitions, dwell_time, max_allowed_diff, escan,
             future._find_overlay_state = FINISHED
 
 
+def _addPhaseTime(timings, phase, start):
+    """
+    Account the time spent in a phase since the given start
+    timings (dict str -> float): phase name -> time spent (s), updated
+    phase (str): name of the phase
+    start (float): time at which the phase started
+    """
+    timings[phase] = timings.get(phase, 0) + (time.time() - start)
+
+
+def _matchGrid(future, optical_image, electron_coordinates, electron_scale,
+               repetitions, max_allowed_diff, escan, timings):
+    """
+    Finds the spots in the optical image, and match them to the electron
+    coordinates of the grid.
+    future (model.ProgressiveFuture): the overlay future, to check cancellation
+    optical_image, electron_coordinates, electron_scale: as returned by
+      GridScanner.DoAcquisition()
+    repetitions, max_allowed_diff, escan: cf _DoFindOverlay
+    timings (dict str -> float): phase name -> time spent (s), updated
+    returns (list of tuples, list of tuples): the known electron coordinates
+      and the corresponding optical coordinates. Both empty if no match found.
+    raises:
+            CancelledError if cancelled
+            ValueError if no spot found
+    """
+    tstart = time.time()
+    # Check if ScanGrid gave one image or list of images
+    # If it is a list, follow the "one image per spot" procedure
+    logging.debug("Isolating spots...")
+    if isinstance(optical_image, list):
+        opt_img_shape = optical_image[0].shape
+        opt_pxs = optical_image[0].metadata.get(model.MD_PIXEL_SIZE)
+        subimages = []
+        subimage_coordinates = []
+        for img in optical_image:
+            subspots, subspot_coordinates = coordinates.DivideInNeighborhoods(img, (1, 1), img.shape[0] / 2)
+            subimages.append(subspots[0])
+            subimage_coordinates.append(subspot_coordinates[0])
+    else:
+        # Distance between spots in the optical image (in optical pixels)
+        opt_pxs = optical_image.metadata[model.MD_PIXEL_SIZE]
+        optical_dist = escan.pixelSize.value[0] * electron_scale[0] / opt_pxs[0]
+        opt_img_shape = optical_image.shape
+
+        # Isolate spots
+        if future._find_overlay_state == CANCELLED:
+            raise CancelledError()
+        subimages, subimage_coordinates = coordinates.DivideInNeighborhoods(optical_image, repetitions, optical_dist)
+
+    if not subimages:
+        raise ValueError("Overlay failure")
+
+    # Find the centers of the spots
+    if future._find_overlay_state == CANCELLED:
+        raise CancelledError()
+    logging.debug("Finding spot centers with %d subimages...", len(subimages))
+    spot_coordinates = [spot.FindCenterCoordinates(i) for i in subimages]
+
+    # Reconstruct the optical coordinates
+    if future._find_overlay_state == CANCELLED:
+        raise CancelledError()
+    optical_coordinates = coordinates.ReconstructCoordinates(subimage_coordinates, spot_coordinates)
+    _addPhaseTime(timings, "spot detection", tstart)
+
+    tstart = time.time()
+    # Check if SEM calibration is correct. If this is not the case
+    # generate a warning message and provide the ratio of X/Y scale.
+    ratio = _computeGridRatio(optical_coordinates, repetitions)
+    if not (0.9 < ratio < 1.1):
+        logging.warning("SEM may needs calibration. X/Y ratio is %f.", ratio)
+    else:
+        logging.info("SEM X/Y ratio is %f.", ratio)
+
+    opt_offset = (opt_img_shape[1] / 2, opt_img_shape[0] / 2)
+
+    optical_coordinates = [(x - opt_offset[0], y - opt_offset[1]) for x, y in optical_coordinates]
+
+    # TODO: Make function for scale calculation
+    # Estimate the scale by measuring the distance between the first
+    # two spots in optical and electron coordinates.
+    #  * For electrons, it's easy as we've placed them.
+    #  * For optical, we pick one spot, and measure the distance to the
+    #    closest spot. Should be more precise than previous estimation.
+    p1 = optical_coordinates[0]
+    def dist_to_p1(p):
+        diff = [a - b for a, b in zip(p1, p)]
+        return math.hypot(*diff)
+    optical_dist = min(dist_to_p1(p) for p in optical_coordinates[1:])
+    scale = electron_scale[0] / optical_dist
+
+    # max_allowed_diff in pixels
+    max_allowed_diff_px = max_allowed_diff / escan.pixelSize.value[0]
+
+    # Match the electron to optical coordinates
+    if future._find_overlay_state == CANCELLED:
+        raise CancelledError()
+
+    # The transform found recently with the same settings is normally a
+    # much better guess than just the scale (ie, it also knows the rotation).
+    cache_key = _getTransformKey(repetitions, escan, opt_pxs)
+    guess = None
+    if cache_key in _last_transforms:
+        tfound, guess = _last_transforms[cache_key]
+        if time.time() - tfound > TRANSFORM_MAX_AGE:
+            logging.debug("Previous overlay is too old to be used")
+            del _last_transforms[cache_key]
+            guess = None
+    known_ec, known_oc = [], []
+    if guess is not None:
+        logging.debug("Matching coordinates, starting from previous overlay...")
+        known_ec, known_oc = coordinates.MatchCoordinates(optical_coordinates,
+                                                          electron_coordinates,
+                                                          scale,
+                                                          max_allowed_diff_px,
+                                                          guess_transform=guess)
+        if not known_ec:
+            logging.info("Failed to match coordinates from previous overlay, will try from scratch")
+
+    if not known_ec:
+        logging.debug("Matching coordinates...")
+        known_ec, known_oc = coordinates.MatchCoordinates(optical_coordinates,
+                                                          electron_coordinates,
+                                                          scale,
+                                                          max_allowed_diff_px)
+
+    if known_ec:
+        try:
+            _last_transforms[cache_key] = (time.time(),
+                                           coordinates.EstimateAffineTransform(known_oc, known_ec))
+        except ValueError:
+            logging.debug("Not enough coordinates to store the transform")
+    _addPhaseTime(timings, "matching", tstart)
+
+    return known_ec, known_oc
+
+
+def _getTransformKey(repetitions, escan, opt_pxs):
+    """
+    Computes the key of the settings for which the transform found is valid
+    repetitions (tuple of ints): The number of CL spots
+    escan (model.Emitter): The e-beam scanner
+    opt_pxs (None or tuple of floats): The optical pixel size
+    returns (tuple): key for _last_transforms
+    """
+    if model.hasVA(escan, "rotation"):
+        rotation = escan.rotation.value
+    else:
+        rotation = None
+    return (tuple(repetitions), tuple(escan.pixelSize.value),
+            tuple(escan.scale.value), rotation,
+            tuple(opt_pxs) if opt_pxs else None)
+
+
 def _CancelFindOverlay(future):
     """
     Canceller of _DoFindOverlay task.
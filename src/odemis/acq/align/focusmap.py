@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the
+terms  of the GNU General Public License version 2 as published by the Free
+Software  Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY
+WARRANTY;  without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+PARTICULAR  PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+"""
+
+# Focus map: the focus position as a function of the stage position. It allows
+# to run autofocus only on a few positions of the sample, and then predict the
+# focus on any position of the area.
+
+from __future__ import division
+
+from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, \
+    RUNNING
+import logging
+import numpy
+from odemis import model
+from odemis.acq._futures import executeTask
+from scipy import interpolate
+import threading
+import time
+
+from . import autofocus
+
+
+# Surface fitted on the focus positions
+FIT_PLANE = "plane"  # z = a*x + b*y + c (sample tilt)
+FIT_SPLINE = "spline"  # plane + thin plate spline (sample tilt + bending)
+
+MOVE_STAGE_TIME = 2  # s, rough estimation of the time to move to a grid point
+
+
+class FocusMap(object):
+    """
+    Predicts the focus position for any stage position, based on a few focus
+    positions measured at different stage positions.
+    A global offset can be applied, to compensate for the drift of the focus
+    (eg, thermal expansion), by revalidating the focus at just one position.
+    """
+
+    def __init__(self, points=None, fit=FIT_PLANE, validity=None):
+        """
+        points (None or list of tuple of 3 floats): stage X, stage Y, focus Z
+          of the positions where the focus is known.
+        fit (FIT_*): type of surface fitted on the focus positions
+        validity (None or 0<float): duration (in s) after which the focus
+          should be revalidated. If None, it never needs to be revalidated.
+        """
+        if fit not in (FIT_PLANE, FIT_SPLINE):
+            raise ValueError("Unknown fit type %s" % (fit,))
+        self._fit = fit
+        self.validity = validity
+        self._points = []
+        self.offset = 0  # m, added to all the predicted focus positions
+        self._last_validation = time.time()
+
+        # Fitted surface
+        self._center = (0, 0)
+        self._plane = (0, 0, 0)
+        self._rbf = None
+
+        if points:
+            for x, y, z in points:
+                self._points.append((x, y, z))
+            self._fitSurface()
+
+    @property
+    def points(self):
+        """
+        (list of tuple of 3 floats): X, Y, Z of the measured focus positions
+        """
+        return list(self._points)
+
+    def add(self, x, y, z):
+        """
+        Add a new measured focus position. The map is updated immediately.
+        x, y (floats): stage position
+        z (float): good focus position
+        """
+        # The map is updated with the (non-drifted) position
+        self._points.append((x, y, z - self.offset))
+        self._fitSurface()
+        self._last_validation = time.time()
+
+    def _fitSurface(self):
+        """
+        Update the surface to fit the points
+        """
+        pts = numpy.array(self._points, dtype=numpy.float64)
+        # Center the coordinates, to keep the fitting well conditioned
+        self._center = pts[:, 0].mean(), pts[:, 1].mean()
+        x = pts[:, 0] - self._center[0]
+        y = pts[:, 1] - self._center[1]
+        z = pts[:, 2]
+
+        # Plane, with least squares. With less than 3 points, it gives the
+        # flattest solution, which is a good guess anyway.
+        a = numpy.column_stack((x, y, numpy.ones_like(x)))
+        self._plane = tuple(numpy.linalg.lstsq(a, z)[0])
+
+        self._rbf = None
+        if self._fit == FIT_SPLINE and len(self._points) >= 4:
+            # Interpolate the remaining difference to the plane
+            dz = z - a.dot(self._plane)
+            try:
+                self._rbf = interpolate.Rbf(x, y, dz, function="thin_plate")
+            except numpy.linalg.LinAlgError:
+                # Happens when several points are at the same position
+                logging.warning("Failed to fit spline on focus positions, will use a plane")
+
+    def predict(self, x, y):
+        """
+        Estimate the focus position
+        x, y (floats): stage position
+        return (float): good focus position
+        raise LookupError: if the focus map has no point
+        """
+        if not self._points:
+            raise LookupError("No focus position known")
+
+        cx, cy = x - self._center[0], y - self._center[1]
+        a, b, c = self._plane
+        z = a * cx + b * cy + c
+        if self._rbf is not None:
+            z += float(self._rbf(cx, cy))
+        return z + self.offset
+
+    def needsValidation(self):
+        """
+        return (bool): True if the focus was measured for too long ago, and
+          should be revalidated (see validate()).
+        """
+        if self.validity is None:
+            return False
+        return time.time() > self._last_validation + self.validity
+
+    def validate(self, x, y, z):
+        """
+        Update the offset, based on a new focus position measured. The shape
+        of the map is kept, and it is just shifted.
+        x, y (floats): stage position
+        z (float): good focus position
+        """
+        pz = self.predict(x, y)
+        self.offset += z - pz
+        self._last_validation = time.time()
+        logging.debug("Focus map moved by %g m, offset is now %g m", z - pz, self.offset)
+
+
+def _getStagePos(stage):
+    pos = stage.position.value
+    return pos["x"], pos["y"]
+
+
+def _estimateAutoFocusTime(detector, emt):
+    """
+    returns (float): a rough estimation of the time (s) of one autofocus
+    """
+    if model.hasVA(emt, "dwellTime"):
+        et = emt.dwellTime.value * numpy.prod(emt.resolution.value)
+    elif model.hasVA(detector, "exposureTime"):
+        et = detector.exposureTime.value
+    else:
+        et = 1
+    return autofocus.estimateAutoFocusTime(et)
+
+
+def AcquireFocusMap(stage, focus, detector, emt, area, grid=(3, 3),
+                    dfbkg=None, fit=FIT_PLANE, validity=None,
+                    method=autofocus.MTD_BINARY):
+    """
+    Run autofocus on a grid of stage positions, and build a focus map from the
+    focus positions found. At the end, the stage is moved back to its original
+    position.
+    stage (model.Actuator): the stage, with x and y axes
+    focus (model.Actuator): the focus actuator, with a z axis
+    detector (model.DigitalCamera or model.Detector): detector to run the
+      autofocus on
+    emt (None or model.Emitter): In case of a SED this is the scanner used
+    area (tuple of 4 floats): xmin, ymin, xmax, ymax of the stage positions to
+      cover
+    grid (tuple of 2 ints): number of positions along x and y
+    dfbkg, method: passed to AutoFocus()
+    fit, validity: passed to FocusMap()
+    returns (model.ProgressiveFuture): Progress of the acquisition, whose
+      result() will return a FocusMap
+    """
+    npos = grid[0] * grid[1]
+    if npos < 1:
+        raise ValueError("Grid must have at least one position, but got %s" % (grid,))
+
+    est_start = time.time() + 0.1
+    dur = npos * (_estimateAutoFocusTime(detector, emt) + MOVE_STAGE_TIME)
+    f = model.ProgressiveFuture(start=est_start, end=est_start + dur)
+    f._focusmap_state = RUNNING
+    f._focusmap_lock = threading.Lock()
+    f._subfuture = model.InstantaneousFuture()
+    f.task_canceller = _CancelAcquireFocusMap
+
+    focus_thread = threading.Thread(target=executeTask,
+                                    name="Focus map acquisition",
+                                    args=(f, _DoAcquireFocusMap, f, stage, focus,
+                                          detector, emt, area, grid, dfbkg, fit,
+                                          validity, method))
+    focus_thread.start()
+    return f
+
+
+def _gridPositions(area, grid):
+    """
+    Computes the positions of the grid, in the order to scan them (in a
+    serpentine way, to minimise the stage moves)
+    area (tuple of 4 floats): xmin, ymin, xmax, ymax
+    grid (tuple of 2 ints): number of positions along x and y
+    returns (list of tuple of 2 floats): the x, y positions
+    """
+    xmin, ymin, xmax, ymax = area
+    # With only one position on an axis, take the center
+    xs = numpy.linspace(xmin, xmax, grid[0]) if grid[0] > 1 else [(xmin + xmax) / 2]
+    ys = numpy.linspace(ymin, ymax, grid[1]) if grid[1] > 1 else [(ymin + ymax) / 2]
+    pos = []
+    for i, y in enumerate(ys):
+        row = xs if i % 2 == 0 else xs[::-1]
+        pos.extend((float(x), float(y)) for x in row)
+    return pos
+
+
+def _DoAcquireFocusMap(future, stage, focus, detector, emt, area, grid, dfbkg,
+                       fit, validity, method):
+    """
+    cf AcquireFocusMap
+    returns (FocusMap)
+    """
+    orig_pos = stage.position.value
+    fmap = FocusMap(fit=fit, validity=validity)
+    positions = _gridPositions(area, grid)
+    try:
+        for i, (x, y) in enumerate(positions):
+            tstart = time.time()
+            stage.moveAbsSync({"x": x, "y": y})
+            if future._focusmap_state == CANCELLED:
+                raise CancelledError()
+
+            # Start from the focus expected from the positions already known
+            try:
+                good_focus = fmap.predict(x, y)
+            except LookupError:
+                good_focus = None
+
+            with future._focusmap_lock:
+                if future._focusmap_state == CANCELLED:
+                    raise CancelledError()
+                future._subfuture = autofocus.AutoFocus(detector, emt, focus, dfbkg,
+                                                        good_focus=good_focus,
+                                                        method=method)
+            z, lvl = future._subfuture.result()
+            logging.debug("Focus at %g, %g is %g m (level = %g)", x, y, z, lvl)
+            fmap.add(x, y, z)
+
+            # Expect the next positions to take the same time
+            left = len(positions) - i - 1
+            future.set_progress(end=time.time() + (time.time() - tstart) * left)
+
+        return fmap
+    finally:
+        stage.moveAbsSync({"x": orig_pos["x"], "y": orig_pos["y"]})
+        with future._focusmap_lock:
+            if future._focusmap_state == CANCELLED:
+                raise CancelledError()
+            future._focusmap_state = FINISHED
+
+
+def _CancelAcquireFocusMap(future):
+    """
+    Canceller of _DoAcquireFocusMap task.
+    """
+    logging.debug("Cancelling focus map acquisition...")
+
+    with future._focusmap_lock:
+        if future._focusmap_state == FINISHED:
+            return False
+        future._focusmap_state = CANCELLED
+        future._subfuture.cancel()
+        logging.debug("Focus map acquisition cancellation requested.")
+
+    return True
+
+
+def ValidateFocusMap(fmap, stage, focus, detector, emt, dfbkg=None,
+                     method=autofocus.MTD_BINARY):
+    """
+    Run autofocus at the current stage position, starting from the focus
+    predicted, and update the focus map offset with the result.
+    fmap (FocusMap): the focus map to update
+    stage, focus, detector, emt: cf AcquireFocusMap
+    dfbkg, method: passed to AutoFocus()
+    returns (model.ProgressiveFuture): Progress of the validation, whose
+      result() will return the focus position and the focus level
+    """
+    est_start = time.time() + 0.1
+    f = model.ProgressiveFuture(start=est_start,
+                                end=est_start + _estimateAutoFocusTime(detector, emt))
+    f._focusmap_state = RUNNING
+    f._focusmap_lock = threading.Lock()
+    f._subfuture = model.InstantaneousFuture()
+    f.task_canceller = _CancelAcquireFocusMap
+
+    focus_thread = threading.Thread(target=executeTask,
+                                    name="Focus map validation",
+                                    args=(f, _DoValidateFocusMap, f, fmap, stage,
+                                          focus, detector, emt, dfbkg, method))
+    focus_thread.start()
+    return f
+
+
+def _DoValidateFocusMap(future, fmap, stage, focus, detector, emt, dfbkg, method):
+    """
+    cf ValidateFocusMap
+    returns (float, float): focus position and focus level
+    """
+    try:
+        x, y = _getStagePos(stage)
+        with future._focusmap_lock:
+            if future._focusmap_state == CANCELLED:
+                raise CancelledError()
+            future._subfuture = autofocus.AutoFocus(detector, emt, focus, dfbkg,
+                                                    good_focus=fmap.predict(x, y),
+                                                    method=method)
+        z, lvl = future._subfuture.result()
+        fmap.validate(x, y, z)
+        return z, lvl
+    finally:
+        with future._focusmap_lock:
+            if future._focusmap_state == CANCELLED:
+                raise CancelledError()
+            future._focusmap_state = FINISHED
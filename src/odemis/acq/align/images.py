@@ -57,6 +57,7 @@ class GridScanner(object):
         self._spot_images = []
 
         self._hw_settings = ()
+        self._layout = None  # Grid layout computed by PrepareAcquisition()
 
     def _save_hw_settings(self):
         scale = self.escan.scale.value
@@ -227,25 +228,13 @@ class GridScanner(object):
 
         return self._optical_image, electron_coordinates, scale
 
-    def DoAcquisition(self):
+    def PrepareAcquisition(self):
         """
-        Uses the e-beam to scan the rectangular grid consisted of the given number
-        of spots and acquires the corresponding CCD image
-        repetitions (tuple of ints): The number of CL spots are used
-        dwell_time (float): Time to scan each spot #s
-        escan (model.Emitter): The e-beam scanner
-        ccd (model.DigitalCamera): The CCD
-        detector (model.Detector): The electron detector
-        returns (DataArray or list of DataArrays): 2D array containing the
-                     the spotted optical image, or a list of 2D images
-                     containing the optical image for each spot.
-                (List of tuples):  Coordinates of spots in electron image
-                (Tuple of floats): Scaling of electron image (in optical px)
+        Computes the layout of the grid to scan, based on the current hardware
+        settings. It only reads the hardware settings, so it can be called
+        while other computations take place, to shorten DoAcquisition().
+        The layout is used by the next call to DoAcquisition() only.
         """
-        self._save_hw_settings()
-        self._acq_state = RUNNING
-        self._ccd_done.clear()
-
         escan = self.escan
         rep = self.repetitions
 
@@ -288,14 +277,42 @@ class GridScanner(object):
         # Check if the exposure time to be used in the grid scan is
         # within the range of the camera
         # TODO handle similar case in the SpotAcquisition
-        dwell_time = self.dwell_time
-        et = numpy.prod(self.repetitions) * dwell_time
+        et = numpy.prod(self.repetitions) * self.dwell_time
         max_et = self.ccd.exposureTime.range[1]
 
+        # If the distance between e-beam spots is below the size of a spot,
+        # use the “one image per spot” procedure
+        spot_mode = ((spot_dist[0] < SPOT_SIZE) or (spot_dist[1] < SPOT_SIZE) or
+                     (et > max_et))
+        self._layout = (electron_coordinates, scale, spot_mode, self.dwell_time)
+
+    def DoAcquisition(self):
+        """
+        Uses the e-beam to scan the rectangular grid consisted of the given number
+        of spots and acquires the corresponding CCD image
+        repetitions (tuple of ints): The number of CL spots are used
+        dwell_time (float): Time to scan each spot #s
+        escan (model.Emitter): The e-beam scanner
+        ccd (model.DigitalCamera): The CCD
+        detector (model.Detector): The electron detector
+        returns (DataArray or list of DataArrays): 2D array containing the
+                     the spotted optical image, or a list of 2D images
+                     containing the optical image for each spot.
+                (List of tuples):  Coordinates of spots in electron image
+                (Tuple of floats): Scaling of electron image (in optical px)
+        """
+        self._save_hw_settings()
+        self._acq_state = RUNNING
+        self._ccd_done.clear()
+
         try:
-            # If the distance between e-beam spots is below the size of a spot,
-            # use the “one image per spot” procedure
-            if (spot_dist[0] < SPOT_SIZE) or (spot_dist[1] < SPOT_SIZE) or (et > max_et):
+            # Compute the layout, unless already prepared for the same dwell time
+            if self._layout is None or self._layout[3] != self.dwell_time:
+                self.PrepareAcquisition()
+            electron_coordinates, scale, spot_mode, _ = self._layout
+            self._layout = None
+
+            if spot_mode:
                 return self._doSpotAcquisition(electron_coordinates, scale)
             else:
                 return self._doWholeAcquisition(electron_coordinates, scale)
@@ -118,6 +118,39 @@ class TestAutofocus(unittest.TestCase):
         self.assertAlmostEqual(foc_pos, self._opt_good_focus, 3)
         self.assertGreater(foc_lev, 0)
 
+    @timeout(1000)
+    def test_autofocus_opt_sweep(self):
+        """
+        Test AutoFocus on CCD, while moving the focus continuously, and compare
+        its speed with the standard method
+        """
+        focus = self.focus
+        ebeam = self.ebeam
+        ccd = self.ccd
+        ccd.exposureTime.value = ccd.exposureTime.range[0]
+        dur = {}
+        for mtd in (autofocus.MTD_BINARY, autofocus.MTD_SWEEP):
+            focus.moveAbs({"z": self._opt_good_focus - 400e-6}).result()
+            tstart = time.time()
+            future_focus = align.AutoFocus(ccd, ebeam, focus, method=mtd)
+            foc_pos, foc_lev = future_focus.result(timeout=900)
+            dur[mtd] = time.time() - tstart
+            self.assertAlmostEqual(foc_pos, self._opt_good_focus, 3)
+            self.assertGreater(foc_lev, 0)
+
+        logging.info("Autofocus took %g s with binary search, and %g s with sweep",
+                     dur[autofocus.MTD_BINARY], dur[autofocus.MTD_SWEEP])
+
+    def test_fit_focus_peak(self):
+        """
+        Test the peak of the focus level curve is found between the measurements
+        """
+        pos = [i * 1e-6 for i in range(20)]
+        lvls = [100 - ((p - 8.3e-6) * 1e6) ** 2 for p in pos]
+        fpos, flvl = autofocus._fitFocusPeak(pos, lvls)
+        self.assertAlmostEqual(fpos, 8.3e-6)
+        self.assertAlmostEqual(flvl, 100)
+
     @timeout(1000)
     def test_autofocus_sem(self):
         """
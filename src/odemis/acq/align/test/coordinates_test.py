@@ -30,6 +30,7 @@ from odemis.acq.align import transform
 from odemis.dataio import hdf5
 from odemis.util import spot
 import operator
+import time
 import unittest
 
 
@@ -145,6 +146,37 @@ class TestDivideInNeighborhoods(unittest.TestCase):
 
         self.assertEqual(len(subimages), 99)
 
+    def test_find_spot_centers(self):
+        """
+        Compare FindSpotCenters to DivideInNeighborhoods + FindCenterCoordinates
+        """
+        for fn, nspots in (("grid_10x10.h5", 100), ("grid_cosmic_ray.h5", 99)):
+            grid_data = hdf5.read_data(fn)
+            C, T, Z, Y, X = grid_data[0].shape
+            grid_data[0].shape = Y, X
+
+            # Add Gaussian noise
+            noise = random.normal(0, 40, grid_data[0].size)
+            noise_array = noise.reshape(grid_data[0].shape[0], grid_data[0].shape[1])
+            noisy_grid_data = grid_data[0] + noise_array
+
+            tstart = time.time()
+            subimages, subimage_coordinates = coordinates.DivideInNeighborhoods(noisy_grid_data, (10, 10), 40)
+            spot_coordinates = [spot.FindCenterCoordinates(i) for i in subimages]
+            optical_coordinates = coordinates.ReconstructCoordinates(subimage_coordinates, spot_coordinates)
+            dur_full = time.time() - tstart
+
+            tstart = time.time()
+            centers = coordinates.FindSpotCenters(noisy_grid_data, (10, 10), 40)
+            dur_centroid = time.time() - tstart
+
+            logging.info("Finding %d spots took %g s with radial symmetry, and %g s with centroid",
+                         len(centers), dur_full, dur_centroid)
+            self.assertEqual(len(optical_coordinates), nspots)
+            self.assertEqual(len(centers), nspots)
+            for oc, c in zip(optical_coordinates, centers):
+                self.assertLess(math.hypot(oc[0] - c[0], oc[1] - c[1]), 1.5)
+
 # @unittest.skip("skip")
 class TestMatchCoordinates(unittest.TestCase):
     """
@@ -226,6 +258,29 @@ class TestMatchCoordinates(unittest.TestCase):
             (calc_translation_x, calc_translation_y), (calc_scaling_x, calc_scaling_y), calc_rotation = transform.CalculateTransform(known_optical_coordinates, known_estimated_coordinates)
             numpy.testing.assert_almost_equal((calc_translation_x, calc_translation_y, calc_scaling_x, calc_scaling_y, calc_rotation), (translation_x, translation_y, scale_x, scale_y, rotation), 1)
 
+    def test_match_coordinates_guess_transform_10x10(self):
+        """
+        Test MatchCoordinates starting from the transform of a previous match
+        """
+        electron_coordinates = self.electron_coordinates_10x10
+        optical_coordinates = coordinates._TransformCoordinates(electron_coordinates, (self.translation_x, self.translation_y), self.rotation, (self.scale_x, self.scale_y))
+
+        # The transform estimated is exactly the inverse one
+        guess = coordinates.EstimateAffineTransform(optical_coordinates, electron_coordinates)
+        self.assertEqual(guess.shape, (2, 3))
+        oc = numpy.array(optical_coordinates)
+        numpy.testing.assert_almost_equal(oc.dot(guess[:, :2].T) + guess[:, 2], electron_coordinates)
+
+        shuffled_coordinates = list(optical_coordinates)
+        shuffle(shuffled_coordinates)
+        known_estimated_coordinates, known_optical_coordinates = coordinates.MatchCoordinates(shuffled_coordinates, electron_coordinates, 0.25, 0.25,
+                                                                                              guess_transform=guess)
+        self.assertEqual(sorted(zip(known_optical_coordinates, known_estimated_coordinates)),
+                         sorted(zip(optical_coordinates, electron_coordinates)))
+
+        with self.assertRaises(ValueError):
+            coordinates.EstimateAffineTransform(optical_coordinates[:2], electron_coordinates[:2])
+
     def test_match_coordinates_shuffled__distorted_3x3(self):
         """
         Test MatchCoordinates for shuffled and distorted optical coordinates, comparing the order of the shuffled optical list and the estimated coordinates
@@ -86,6 +86,26 @@ class TestOverlay(unittest.TestCase):
         self.assertEqual(len(t), 5)
         self.assertIn(model.MD_PIXEL_SIZE_COR, opt_md)
         self.assertIn(model.MD_SHEAR_COR, sem_md)
+        # Time spent in each phase is reported
+        self.assertIn("scan", f._timings)
+        self.assertIn("matching", f._timings)
+
+    # @unittest.skip("skip")
+    def test_transform_key(self):
+        """
+        The previous transform is only reused with the same e-beam settings
+        """
+        from odemis.acq.align import find_overlay
+        orig_scale = self.ebeam.scale.value
+        key1 = find_overlay._getTransformKey((4, 4), self.ebeam, (1e-6, 1e-6))
+        self.assertEqual(key1, find_overlay._getTransformKey((4, 4), self.ebeam, (1e-6, 1e-6)))
+        self.assertNotEqual(key1, find_overlay._getTransformKey((4, 4), self.ebeam, (2e-6, 2e-6)))
+        try:
+            self.ebeam.scale.value = (orig_scale[0] * 2, orig_scale[1] * 2)
+            key2 = find_overlay._getTransformKey((4, 4), self.ebeam, (1e-6, 1e-6))
+            self.assertNotEqual(key1, key2)
+        finally:
+            self.ebeam.scale.value = orig_scale
 
     # @unittest.skip("skip")
     def test_find_overlay_failure(self):
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+from odemis.acq.align import focusmap
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+def tilted_focus(x, y):
+    return 5e-3 + 1e-3 * x - 2e-3 * y
+
+
+class TestFocusMap(unittest.TestCase):
+    """
+    Test the FocusMap prediction (without hardware)
+    """
+
+    def test_plane(self):
+        pts = [(x, y, tilted_focus(x, y)) for x in (0, 1e-3, 2e-3) for y in (0, 1e-3)]
+        fmap = focusmap.FocusMap(pts)
+        for x, y in ((0.5e-3, 0.2e-3), (5e-3, -3e-3), (1e-3, 1e-3)):
+            self.assertAlmostEqual(fmap.predict(x, y), tilted_focus(x, y))
+
+        # Just one point => constant focus
+        fmap = focusmap.FocusMap()
+        with self.assertRaises(LookupError):
+            fmap.predict(0, 0)
+        fmap.add(1e-3, 1e-3, 6e-3)
+        self.assertAlmostEqual(fmap.predict(0, 0), 6e-3)
+
+    def test_spline(self):
+        # A sample slightly bent in the middle
+        pts = [(x, y, tilted_focus(x, y)) for x in (0, 1e-3, 2e-3) for y in (0, 1e-3, 2e-3)]
+        pts[4] = (1e-3, 1e-3, tilted_focus(1e-3, 1e-3) + 2e-6)
+        fmap_plane = focusmap.FocusMap(pts, fit=focusmap.FIT_PLANE)
+        fmap_spline = focusmap.FocusMap(pts, fit=focusmap.FIT_SPLINE)
+        for x, y, z in pts:
+            self.assertAlmostEqual(fmap_spline.predict(x, y), z)
+        self.assertNotAlmostEqual(fmap_plane.predict(1e-3, 1e-3), pts[4][2], places=7)
+
+    def test_validate(self):
+        pts = [(x, y, tilted_focus(x, y)) for x in (0, 1e-3) for y in (0, 1e-3)]
+        fmap = focusmap.FocusMap(pts, validity=0.1)
+        self.assertFalse(fmap.needsValidation())
+        time.sleep(0.2)
+        self.assertTrue(fmap.needsValidation())
+
+        # The focus drifted by 3 µm
+        fmap.validate(0.5e-3, 0.5e-3, tilted_focus(0.5e-3, 0.5e-3) + 3e-6)
+        self.assertFalse(fmap.needsValidation())
+        self.assertAlmostEqual(fmap.predict(2e-3, 0), tilted_focus(2e-3, 0) + 3e-6)
+
+        # A new point takes into account the drift
+        fmap.add(2e-3, 2e-3, tilted_focus(2e-3, 2e-3) + 3e-6)
+        self.assertAlmostEqual(fmap.predict(0, 2e-3), tilted_focus(0, 2e-3) + 3e-6)
+
+    def test_grid(self):
+        pos = focusmap._gridPositions((0, 0, 2, 1), (3, 2))
+        self.assertEqual(pos, [(0, 0), (1, 0), (2, 0), (2, 1), (1, 1), (0, 1)])
+        pos = focusmap._gridPositions((0, 0, 2, 1), (1, 1))
+        self.assertEqual(pos, [(1, 0.5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
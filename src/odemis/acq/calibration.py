@@ -176,18 +176,23 @@ def get_spectrum_efficiency(das):
     return ret
 
 
-def compensate_spectrum_efficiency(data, bckg=None, coef=None):
+# Maximum size of a block of data processed at once when compensating a
+# spectrum, to limit the memory used by temporary arrays.
+CALIB_CHUNK_SIZE = 16 * 2 ** 20  # B
+
+
+def _get_compensation_factors(data, bckg=None, coef=None):
     """
-    Apply the efficiency compensation factors to the given data.
-    If the wavelength of the calibration doesn't cover the whole data wavelength,
-    the missing wavelength is filled by the same value as the border. Wavelength
-    in-between points is linearly interpolated.
+    Computes the background and coefficient for each wavelength of the data.
     data (DataArray of at least 5 dims): the original data. Need MD_WL_* metadata
     bckg (None or DataArray of at least 5 dims): the background data, with TZXY = 1111
       Need MD_WL_* metadata.
     coef (None or DataArray of at least 5 dims): the coeficient data, with TZXY = 1111
       Need MD_WL_* metadata.
-    returns (DataArray): same shape as original data. Can have dtype=float
+    returns:
+      bckg (None or ndarray of shape C1111): the background to subtract
+      coef (None or ndarray of shape C1111): the factor for each wavelength
+    raise ValueError: if the calibration data doesn't fit the data
     """
     # Need to get the calibration data for each wavelength of the data
     wl_data = spectrum.get_wavelength_per_pixel(data)
@@ -209,11 +214,11 @@ def compensate_spectrum_efficiency(data, bckg=None, coef=None):
                             "while the spectrum is between %g->%g nm.",
                             wl_bckg[0] * 1e9, wl_bckg[-1] * 1e9,
                             wl_data[0] * 1e9, wl_data[-1] * 1e9)
-
-        data = img.Subtract(data, bckg)
+        bckg = numpy.asarray(bckg)
 
     # We could be more clever if calib has a MD_WL_POLYNOMIAL, but it's very
     # unlikely the calibration is in this form anyway.
+    calib_fitted = None
     if coef is not None:
         if coef.shape[1:] != (1, 1, 1, 1):
             raise ValueError("coef should have shape C1111")
@@ -230,7 +235,85 @@ def compensate_spectrum_efficiency(data, bckg=None, coef=None):
         calib_fitted = numpy.interp(wl_data, wl_coef, coef[:, 0, 0, 0, 0])
         calib_fitted.shape += (1, 1, 1, 1) # put TZYX dims
 
-        # Compensate the data
-        data = data * calib_fitted # will keep metadata from data
+    return bckg, calib_fitted
+
+
+def compensate_spectrum_efficiency(data, bckg=None, coef=None, dtype=None, index=None):
+    """
+    Apply the efficiency compensation factors to the given data.
+    If the wavelength of the calibration doesn't cover the whole data wavelength,
+    the missing wavelength is filled by the same value as the border. Wavelength
+    in-between points is linearly interpolated.
+    The data is processed by blocks of lines, directly into the output array, so
+    that no temporary array of the size of the data is needed.
+    data (DataArray of at least 5 dims): the original data. Need MD_WL_* metadata
+    bckg (None or DataArray of at least 5 dims): the background data, with TZXY = 1111
+      Need MD_WL_* metadata.
+    coef (None or DataArray of at least 5 dims): the coeficient data, with TZXY = 1111
+      Need MD_WL_* metadata.
+    dtype (None or numpy.dtype): type of the output. If None, it's the same as
+      the data when only the background is subtracted, and float64 when the
+      efficiency is compensated. Use float32 to save memory.
+    index (None or tuple of slices/ints): to compute only a part of the data,
+      the index to apply on the TZYX dims. The C dim is always fully computed.
+    returns (DataArray): same shape as original data (or the index). Can have
+      dtype=float
+    """
+    bckg, calib_fitted = _get_compensation_factors(data, bckg, coef)
+
+    if index is not None:
+        data = data[(slice(None),) + tuple(index)]
 
-    return data
+    if bckg is None and calib_fitted is None:
+        if dtype is None:
+            return data
+        return data.astype(dtype)
+
+    # Make the factors fit the dims of the data (which might have been reduced)
+    fshape = data.shape[:1] + (1,) * (data.ndim - 1)
+    if bckg is not None:
+        bckg = bckg.reshape(fshape)
+    if calib_fitted is not None:
+        calib_fitted = calib_fitted.reshape(fshape)
+
+    if dtype is None:
+        dtype = numpy.result_type(*[d for d in (data, bckg, calib_fitted) if d is not None])
+    dtype = numpy.dtype(dtype)
+    out = model.DataArray(numpy.empty(data.shape, dtype=dtype), data.metadata.copy())
+
+    # Process the data by blocks along the Y dim (or whichever dim is just
+    # before the last one, but never the C dim).
+    if data.ndim > 1:
+        axis = max(1, data.ndim - 2)
+        alen = data.shape[axis]
+        line_size = (data.size // max(1, alen)) * max(data.dtype.itemsize, dtype.itemsize)
+        nlines = max(1, CALIB_CHUNK_SIZE // max(1, line_size))
+    else:
+        axis = 0
+        alen = nlines = 1
+
+    # Same as img.Subtract(): avoid underflow if the data is unsigned
+    clip = data.dtype.kind in "bu"
+
+    for i in range(0, alen, nlines):
+        if data.ndim > 1:
+            sl = [slice(None)] * data.ndim
+            sl[axis] = slice(i, i + nlines)
+            sl = tuple(sl)
+            d, o = data[sl], out[sl]
+        else:
+            d, o = data, out
+
+        if bckg is not None:
+            if clip:
+                numpy.maximum(d, bckg, out=o, casting="unsafe")
+                numpy.subtract(o, bckg, out=o, casting="unsafe")
+            else:
+                numpy.subtract(d, bckg, out=o, casting="unsafe")
+        else:
+            o[...] = d
+
+        if calib_fitted is not None:
+            numpy.multiply(o, calib_fitted, out=o, casting="unsafe")
+
+    return out
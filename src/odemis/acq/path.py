@@ -22,10 +22,12 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 
 from __future__ import division
 
+import collections
 from concurrent.futures.thread import ThreadPoolExecutor
 import copy
 import logging
 import math
+import numbers
 from odemis import model
 from odemis.acq import stream
 from odemis.model import isasync
@@ -182,6 +184,10 @@ SPARC2_MODES = {
 
 ALIGN_MODES = {'mirror-align', 'chamber-view', 'fiber-align', 'spec-focus', 'spec-fiber-focus'}
 
+# Duration of a move for which no speed is known (eg, filter wheel, selector),
+# used to estimate the time to change the optical path.
+DEFAULT_MOVE_DURATION = 2  # s
+
 
 # TODO: Could be moved to util
 def affectsGraph(microscope):
@@ -195,6 +201,31 @@ def affectsGraph(microscope):
     return graph
 
 
+def _createPositionListener(positions, name):
+    """
+    Creates a listener to a position VA, which stores the value in a dict
+    positions (dict str -> value): where to store the position
+    name (str): the key to store the position
+    return (callable): the listener
+    """
+    # Note: it doesn't reference the OpticalPathManager, to not create any cycle
+    def onPosition(pos):
+        positions[name] = pos
+    return onPosition
+
+
+def _isSamePosition(current, target):
+    """
+    Check whether an axis is at the given position
+    current (value): the current position
+    target (value): the requested position
+    return (bool): True if the positions are (almost) the same
+    """
+    if isinstance(current, numbers.Real) and isinstance(target, numbers.Real):
+        return abs(current - target) <= 1e-9 + 1e-6 * abs(target)
+    return current == target
+
+
 class OpticalPathManager(object):
     """
     The purpose of this module is setting the physical components contained in
@@ -227,6 +258,21 @@ class OpticalPathManager(object):
             if hasattr(comp, 'axes') and isinstance(comp.axes, dict):
                 self._actuators.append(comp)
 
+        # Last known position of each actuator, kept up-to-date by subscribing
+        # to their .position, to avoid reading them remotely at every change
+        self._positions = {}  # str (name) -> dict (str -> value)
+        self._pos_listeners = []  # to keep a reference to the listeners
+        for comp in self._actuators:
+            if not model.hasVA(comp, "position"):
+                continue
+            l = _createPositionListener(self._positions, comp.name)
+            try:
+                comp.position.subscribe(l, init=True)
+            except Exception:
+                logging.warning("Failed to follow the position of %s", comp.name, exc_info=True)
+                continue
+            self._pos_listeners.append((comp, l))
+
         # last known axes position
         self._stored = {}
         self._last_mode = None  # previous mode that was set
@@ -277,6 +323,11 @@ class OpticalPathManager(object):
 
     def __del__(self):
         logging.debug("Ending path manager")
+        for comp, l in self._pos_listeners:
+            try:
+                comp.position.unsubscribe(l)
+            except Exception:
+                logging.debug("Failed to unsubscribe from position of %s", comp.name)
         self._executor.shutdown(wait=False)
 
     def _getComponent(self, role):
@@ -302,12 +353,117 @@ class OpticalPathManager(object):
 
         return f
 
+    def _getPosition(self, comp):
+        """
+        Return the (cached) position of an actuator
+        comp (Actuator)
+        return (dict str -> value): axis name -> position
+        """
+        try:
+            return self._positions[comp.name]
+        except KeyError:
+            return comp.position.value
+
     def _doSetPath(self, path):
         """
         Given a particular mode it sets all the necessary components of the
         optical path (found through the microscope component) to the
         corresponding positions.
+        Only the axes which are not already at the right position are moved,
+        and all the components are moved simultaneously.
+        path (stream.Stream or str): The stream or the optical path mode
+        raises:
+                ValueError if the given mode does not exist
+                IOError if a detector is missing
+        """
+        mode, moves, powers, stored = self._planPath(path)
+
+        for comp, pos in powers:
+            try:
+                if pos == 'on':
+                    comp.power.value = comp.power.range[1]
+                else:
+                    comp.power.value = comp.power.range[0]
+                logging.debug("Updating power of comp %s to %f", comp.name, comp.power.value)
+            except AttributeError:
+                logging.debug("Could not retrieve power range of %s component", comp.name)
+
+        fmoves = []  # moves in progress
+        for comp, mv in moves:
+            logging.debug("Moving %s to %s", comp.name, mv)
+            fmoves.append(comp.moveAbs(mv))
+
+        # Save last mode, and the positions to restore later
+        self._stored = stored
+        self._last_mode = mode
+
+        # wait for all the moves to be completed
+        for f in fmoves:
+            try:
+                f.result()
+            except IOError as e:
+                logging.debug("Actuator move failed giving the error %s", e)
+
+        # The position updates are received asynchronously, so make sure the
+        # cache is up-to-date before the next path change
+        for comp, mv in moves:
+            if comp.name in self._positions:
+                self._positions[comp.name] = comp.position.value
+
+    def estimateSetPathTime(self, path):
+        """
+        Estimate the time it will take to change the optical path to the given
+        mode, from the current positions of the actuators.
+        path (stream.Stream or str): The stream or the optical path mode
+        return (0 <= float): estimated duration (in s). 0 if no move is needed.
+        raises:
+                ValueError if the given mode does not exist
+        """
+        _, moves, _, _ = self._planPath(path)
+        # All the components move simultaneously, so the longest one counts
+        dur = 0
+        for comp, mv in moves:
+            dur = max(dur, self._estimateMoveTime(comp, mv))
+        return dur
+
+    def _estimateMoveTime(self, comp, mv):
+        """
+        Estimate the time for an actuator to move to a position
+        comp (Actuator)
+        mv (dict str -> value): axis -> absolute position
+        return (0 <= float): estimated duration (in s)
+        """
+        speed = {}
+        if model.hasVA(comp, "speed"):
+            try:
+                speed = comp.speed.value
+            except Exception:
+                logging.debug("Failed to read speed of %s", comp.name)
+        pos = self._getPosition(comp)
+
+        dur = 0
+        for axis, p in mv.items():
+            try:
+                d = abs(p - pos[axis])
+                dur = max(dur, d / speed[axis])
+            except (KeyError, TypeError, ZeroDivisionError):
+                # Not a continuous axis, or no speed known
+                dur = max(dur, DEFAULT_MOVE_DURATION)
+        return dur
+
+    def _planPath(self, path):
+        """
+        Computes all the changes needed to go to the given mode, from the
+        current position of the actuators. Nothing is changed.
         path (stream.Stream or str): The stream or the optical path mode
+        return:
+           mode (str): the mode to go to
+           moves (list of (Actuator, dict str -> value)): the absolute moves
+             needed (only the axes which are not already at the position)
+           powers (list of (Component, str)): the components whose power must
+             be changed to 'on' or 'off'
+           stored (dict str -> value): the positions to save, to be restored
+             later
         raises:
                 ValueError if the given mode does not exist
                 IOError if a detector is missing
@@ -328,7 +484,9 @@ class OpticalPathManager(object):
         logging.debug("Going to optical path '%s', with target detector %s.", mode, target)
 
         modeconf = self._modes[mode][1]
-        fmoves = []  # moves in progress
+        stored = dict(self._stored)
+        powers = []
+        moves = []  # list of (comp, dict), in order of application
         for comp_role, conf in modeconf.items():
             # Try to access the component needed
             try:
@@ -341,14 +499,7 @@ class OpticalPathManager(object):
             for axis, pos in conf.items():
                 if axis == "power":
                     if model.hasVA(comp, "power"):
-                        try:
-                            if pos == 'on':
-                                comp.power.value = comp.power.range[1]
-                            else:
-                                comp.power.value = comp.power.range[0]
-                            logging.debug("Updating power of comp %s to %f", comp.name, comp.power.value)
-                        except AttributeError:
-                            logging.debug("Could not retrieve power range of %s component", comp_role)
+                        powers.append((comp, pos))
                     continue
                 if isinstance(pos, str) and pos.startswith("MD:"):
                     pos = self.mdToValue(comp, pos[3:])[axis]
@@ -364,7 +515,7 @@ class OpticalPathManager(object):
                                 # Just to store current band in order to restore
                                 # it once we leave this mode
                                 if self._last_mode not in ALIGN_MODES:
-                                    self._stored[axis] = comp.position.value[axis]
+                                    stored[axis] = self._getPosition(comp)[axis]
                                 break
                         else:
                             logging.debug("Choice %s is not present in %s axis", pos, axis)
@@ -378,9 +529,9 @@ class OpticalPathManager(object):
                         if pos == "mirror":
                             # Store current grating (if we use one at the moment)
                             # to restore it once we use a normal grating again
-                            if choices[comp.position.value[axis]] != "mirror":
-                                self._stored[axis] = comp.position.value[axis]
-                                self._stored['wavelength'] = comp.position.value['wavelength']
+                            if choices[self._getPosition(comp)[axis]] != "mirror":
+                                stored[axis] = self._getPosition(comp)[axis]
+                                stored['wavelength'] = self._getPosition(comp)['wavelength']
                             # Use the special "mirror" grating, if it exists
                             for key, value in choices.items():
                                 if value == "mirror":
@@ -391,23 +542,23 @@ class OpticalPathManager(object):
                                 axis = 'wavelength'
                                 pos = 0
                         elif pos == GRATING_NOT_MIRROR:
-                            if choices[comp.position.value[axis]] == "mirror":
+                            if choices[self._getPosition(comp)[axis]] == "mirror":
                                 # if there is a grating stored use this one
                                 # otherwise find the non-mirror grating
-                                if axis in self._stored:
-                                    pos = self._stored[axis]
+                                if axis in stored:
+                                    pos = stored[axis]
                                 else:
                                     pos = self.findNonMirror(choices)
-                                if 'wavelength' in self._stored:
-                                    mv['wavelength'] = self._stored['wavelength']
+                                if 'wavelength' in stored:
+                                    mv['wavelength'] = stored['wavelength']
                             else:
-                                pos = comp.position.value[axis]  # no change
+                                pos = self._getPosition(comp)[axis]  # no change
                             try:
-                                del self._stored[axis]
+                                del stored[axis]
                             except KeyError:
                                 pass
                             try:
-                                del self._stored['wavelength']
+                                del stored['wavelength']
                             except KeyError:
                                 pass
                         else:
@@ -416,7 +567,7 @@ class OpticalPathManager(object):
                     elif axis == "slit-in":
                         if self._last_mode not in ALIGN_MODES:
                             # TODO: save also the component
-                            self._stored[axis] = comp.position.value[axis]
+                            stored[axis] = self._getPosition(comp)[axis]
                     elif hasattr(comp.axes[axis], "choices") and isinstance(comp.axes[axis].choices, dict):
                         choices = comp.axes[axis].choices
                         for key, value in choices.items():
@@ -427,38 +578,56 @@ class OpticalPathManager(object):
                 else:
                     logging.debug("Not moving axis %s.%s as it is not present", comp_role, axis)
 
-            try:
-                fmoves.append(comp.moveAbs(mv))
-            except AttributeError:
+            if not hasattr(comp, "moveAbs"):
                 logging.debug("%s not an actuator", comp_role)
+                continue
+            moves.append((comp, mv))
 
         # Now take care of the selectors based on the target detector
-        fmoves.extend(self.selectorsToPath(target))
+        moves.extend(self._selectorsToPathMoves(target, {}))
 
         # If we are about to leave alignment modes, restore values
         if self._last_mode in ALIGN_MODES and mode not in ALIGN_MODES:
-            if 'band' in self._stored:
+            if 'band' in stored:
                 try:
                     flter = self._getComponent("filter")
-                    fmoves.append(flter.moveAbs({"band": self._stored['band']}))
+                    moves.append((flter, {"band": stored['band']}))
                 except LookupError:
                     logging.debug("No filter component available")
-            if 'slit-in' in self._stored:
+            if 'slit-in' in stored:
                 try:
                     spectrograph = self._getComponent("spectrograph")
-                    fmoves.append(spectrograph.moveAbs({"slit-in": self._stored['slit-in']}))
+                    moves.append((spectrograph, {"slit-in": stored['slit-in']}))
                 except LookupError:
                     logging.debug("No spectrograph component available")
 
-        # Save last mode
-        self._last_mode = mode
+        return mode, self._filterMoves(moves), powers, stored
 
-        # wait for all the moves to be completed
-        for f in fmoves:
-            try:
-                f.result()
-            except IOError as e:
-                logging.debug("Actuator move failed giving the error %s", e)
+    def _filterMoves(self, moves):
+        """
+        Merge the moves per actuator, and drop the axes already at the requested
+        position.
+        moves (list of (Actuator, dict str -> value)): absolute moves, in order.
+          In case of multiple moves of the same axis, the last one is used.
+        return (list of (Actuator, dict str -> value)): the moves needed
+        """
+        merged = collections.OrderedDict()  # str (name) -> (comp, dict)
+        for comp, mv in moves:
+            if comp.name not in merged:
+                merged[comp.name] = (comp, {})
+            merged[comp.name][1].update(mv)
+
+        needed = []
+        for comp, mv in merged.values():
+            pos = self._getPosition(comp)
+            mv = {a: p for a, p in mv.items()
+                  if a not in pos or not _isSamePosition(pos[a], p)}
+            if mv:
+                needed.append((comp, mv))
+            else:
+                logging.debug("%s already at the right position", comp.name)
+
+        return needed
 
     def selectorsToPath(self, target):
         """
@@ -468,6 +637,19 @@ class OpticalPathManager(object):
         return (list of futures)
         """
         fmoves = []
+        for comp, mv in self._selectorsToPathMoves(target, {}):
+            fmoves.append(comp.moveAbs(mv))
+        return fmoves
+
+    def _selectorsToPathMoves(self, target, mds):
+        """
+        Computes the moves of the selectors so the optical path leads to the
+        target component (usually a detector).
+        target (str): component name
+        mds (dict str -> dict): cache of the metadata of the actuators (updated)
+        return (list of (Actuator, dict str -> value)): the moves to do
+        """
+        moves = []
         for comp in self._actuators:
             # TODO: pre-cache this as comp/target -> axis/pos
             mv = {}
@@ -478,7 +660,11 @@ class OpticalPathManager(object):
                             # set the position so it points to the target
                             mv[an] = pos
 
-            comp_md = comp.getMetadata()
+            try:
+                comp_md = mds[comp.name]
+            except KeyError:
+                comp_md = comp.getMetadata()
+                mds[comp.name] = comp_md
             if target in comp_md.get(model.MD_FAV_POS_ACTIVE_DEST, {}):
                 mv.update(comp_md[model.MD_FAV_POS_ACTIVE])
             elif target in comp_md.get(model.MD_FAV_POS_DEACTIVE_DEST, {}):
@@ -486,11 +672,11 @@ class OpticalPathManager(object):
 
             if mv:
                 logging.debug("Move %s added so %s targets to %s", mv, comp.name, target)
-                fmoves.append(comp.moveAbs(mv))
+                moves.append((comp, mv))
                 # make sure this component is also on the optical path
-                fmoves.extend(self.selectorsToPath(comp.name))
+                moves.extend(self._selectorsToPathMoves(comp.name, mds))
 
-        return fmoves
+        return moves
 
     def guessMode(self, guess_stream):
         """
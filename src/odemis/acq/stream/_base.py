@@ -21,15 +21,14 @@ import collections
 import functools
 import logging
 import math
+import multiprocessing
 import numbers
 import numpy
 from odemis import model
 from odemis.model import (MD_POS, MD_PIXEL_SIZE, MD_ROTATION, MD_ACQ_DATE,
                           MD_SHEAR, VigilantAttribute, VigilantAttributeBase)
-from odemis.util import img
-import threading
+from odemis.util import img, scheduler
 import time
-import weakref
 from odemis.model import isasync
 
 
@@ -37,6 +36,12 @@ from odemis.model import isasync
 # to identify a ROI which must still be defined by the user
 UNDEFINED_ROI = (0, 0, 0, 0)
 
+# The projections (image, histogram) of all the streams are computed by the
+# same threads. They mostly run numpy code, so more threads than CPUs would
+# just contend for the GIL.
+PROJECTION_THREADS = max(2, min(4, multiprocessing.cpu_count()))
+_projection_scheduler = scheduler.Scheduler(PROJECTION_THREADS, "Projection")
+
 
 class Stream(object):
     """ A stream combines a Detector, its associated Dataflow and an Emitter.
@@ -94,12 +99,11 @@ class Stream(object):
         # TODO: We need to reorganise everything so that the
         # image display is done via a dataflow (in a separate thread), instead
         # of a VA.
-        self._im_needs_recompute = threading.Event()
-        self._imthread = threading.Thread(target=self._image_thread,
-                                          args=(weakref.ref(self),),
-                                          name="Image computation")
-        self._imthread.daemon = True
-        self._imthread.start()
+        # The image is computed by the threads shared by all the streams, and
+        # at most at 10 Hz.
+        self._im_job = _projection_scheduler.createJob(self._updateImage,
+                                                       "image of %s" % (name,),
+                                                       min_period=0.1)
 
         # list of DataArray received and used to generate the image
         # every time it's modified, image is also modified
@@ -114,6 +118,9 @@ class Stream(object):
 
         # DataArray or None: RGB projection of the raw data
         self.image = model.VigilantAttribute(None)
+        # Projection of the frame being acquired, to only project the new rows
+        # when a partial frame is updated: (frame key, RGB ndarray, rows projected)
+        self._partial_proj = None
 
         # indicating if stream has already been prepared
         self._prepared = False
@@ -720,53 +727,74 @@ class Stream(object):
         md[model.MD_DIMS] = "YXC" # RGB format
         return model.DataArray(rgbim, md)
 
-    def _shouldUpdateImage(self):
+    @staticmethod
+    def _getValidData(data):
         """
-        Ensures that the image VA will be updated in the "near future".
+        Give the part of the data which has been acquired
+        data (DataArray): complete or partial frame (with MD_VALID_ROWS)
+        return (DataArray): the data, restricted to the valid rows
         """
-        # If the previous request is still being processed, the event
-        # synchronization allows to delay it (without accumulation).
-        self._im_needs_recompute.set()
+        nrows = data.metadata.get(model.MD_VALID_ROWS)
+        if nrows is None:
+            return data
+        return data[:nrows]
 
-    @staticmethod
-    def _image_thread(wstream):
-        """ Called as a separate thread, and recomputes the image whenever it receives an event
-        asking for it.
+    def _projectPartialXY2RGB(self, data, tint=(255, 255, 255)):
+        """
+        Project a partially acquired 2D spatial DataArray into a RGB
+          representation. If the previous call was on the same frame, only the
+          newly acquired rows are projected.
+        data (DataArray): 2D DataArray with MD_VALID_ROWS
+        tint ((int, int, int)): colouration of the image, in RGB.
+        return (DataArray): 3D DataArray (with MD_VALID_ROWS)
+        """
+        nrows = data.metadata[model.MD_VALID_ROWS]
+        irange = self._getDisplayIRange()
+        key = (data.metadata.get(MD_ACQ_DATE), data.shape, tuple(irange), tuple(tint))
+        if self._partial_proj and self._partial_proj[0] == key:
+            _, rgbim, start = self._partial_proj
+            start = min(start, nrows)
+        else:
+            rgbim = numpy.zeros(data.shape + (3,), dtype=numpy.uint8)
+            start = 0
+
+        if nrows > start:
+            rgbim[start:nrows] = img.DataArray2RGB(data[start:nrows], irange, tint)
+        self._partial_proj = (key, rgbim, nrows)
 
-        Args:
-            wstream (Weakref to a Stream): the stream to follow
+        md = self._find_metadata(data.metadata)
+        md[model.MD_DIMS] = "YXC" # RGB format
+        md[model.MD_VALID_ROWS] = nrows
+        return model.DataArray(rgbim, md)
 
+    def _shouldUpdateImage(self):
+        """
+        Ensures that the image VA will be updated in the "near future".
         """
+        # If the previous request is still waiting, it's just run once (with
+        # the highest priority)
+        self._im_job.request(priority=(self._getProjectionPriority(), 0))
 
-        try:
-            stream = wstream()
-            im_needs_recompute = stream._im_needs_recompute
-            # Only hold a weakref to allow the stream to be garbage collected
-            # On GC, trigger im_needs_recompute so that the thread can end too
-            wstream = weakref.ref(stream, lambda o: im_needs_recompute.set())
-
-            tnext = 0
-            while True:
-                del stream
-                im_needs_recompute.wait()  # wait until a new image is available
-                stream = wstream()
-
-                if stream is None:
-                    logging.debug("Stream disappeared so ending image update thread")
-                    return
-
-                tnow = time.time()
-
-                # sleep a bit to avoid refreshing too fast
-                tsleep = tnext - tnow
-                if tsleep > 0.0001:
-                    time.sleep(tsleep)
-
-                tnext = time.time() + 0.1  # max 10 Hz
-                im_needs_recompute.clear()
-                stream._updateImage()
-        except Exception:
-            logging.exception("image update thread failed")
+    def _getProjectionPriority(self):
+        """
+        return (int): the lower, the sooner the projections of this stream are
+          computed, compared to the other streams. The active streams come
+          first, then the ones which should be updated (ie, visible).
+        """
+        if self.is_active.value:
+            return 0
+        elif self.should_update.value:
+            return 1
+        else:
+            return 2
+
+    def getProjectionStats(self):
+        """
+        Gives information on the computation of the projections, for profiling
+        return (dict str -> dict str -> number): projection name -> statistics
+          of its computation (cf util.scheduler.Job.getStats())
+        """
+        return {"image": self._im_job.getStats()}
 
     def _updateImage(self):
         """ Recomputes the image with all the raw data available
@@ -776,7 +804,12 @@ class Stream(object):
             return
 
         try:
-            self.image.value = self._projectXY2RGB(self.raw[0], self.tint.value)
+            data = self.raw[0]
+            if model.MD_VALID_ROWS in data.metadata:
+                self.image.value = self._projectPartialXY2RGB(data, self.tint.value)
+            else:
+                self._partial_proj = None
+                self.image.value = self._projectXY2RGB(data, self.tint.value)
         except Exception:
             logging.exception("Updating %s %s image", self.__class__.__name__, self.name.value)
 
@@ -813,6 +846,7 @@ class Stream(object):
             return
 
         data = self.raw[0] if data is None else data
+        data = self._getValidData(data)
         # Initially, _drange might be None, in which case it will be guessed
         hist, edges = img.histogram(data, irange=self._drange)
         if hist.size > 256:
@@ -422,8 +422,7 @@ class SpectrumSettingsStream(CCDSettingsStream):
         self.image.value = self.raw[0][0]
 
     # No histogram => no need to do anything to update it
-    @staticmethod
-    def _histogram_thread(wstream):
+    def _shouldUpdateHistogram(self):
         pass
 
 
@@ -28,13 +28,11 @@ from odemis.acq import drift
 from odemis.acq.align import FindEbeamCenter
 from odemis.model import MD_POS_COR
 from odemis.util import img, conversion, fluo
-import threading
 import time
-import weakref
 from odemis.model import isasync
 from concurrent.futures.thread import ThreadPoolExecutor
 
-from ._base import Stream, UNDEFINED_ROI
+from ._base import Stream, UNDEFINED_ROI, _projection_scheduler
 
 
 class LiveStream(Stream):
@@ -59,13 +57,10 @@ class LiveStream(Stream):
                                          range=((0, 0, 0, 0), (1, 1, 1, 1)),
                                          cls=(int, long, float))
 
-        # TODO: kill the thread when the stream is dereferenced
-        self._ht_needs_recompute = threading.Event()
-        self._hthread = threading.Thread(target=self._histogram_thread,
-                                         args=(weakref.ref(self),),
-                                         name="Histogram computation")
-        self._hthread.daemon = True
-        self._hthread.start()
+        # Computed by the projection threads, at most at 5 Hz
+        self._ht_job = _projection_scheduler.createJob(self._runHistogramUpdate,
+                                                       "histogram of %s" % (name,),
+                                                       min_period=0.2)
 
         self._prev_dur = None
         self._prep_future = model.InstantaneousFuture()
@@ -140,47 +135,31 @@ class LiveStream(Stream):
         """
         Ensures that the histogram VA will be updated in the "near future".
         """
-        # If the previous request is still being processed, the event
-        # synchronization allows to delay it (without accumulation).
-        self._ht_needs_recompute.set()
+        # If the previous request is still waiting, it's just run once.
+        # The image is more important, so it goes first.
+        self._ht_job.request(priority=(self._getProjectionPriority(), 1))
 
-    @staticmethod
-    def _histogram_thread(wstream):
+    def _runHistogramUpdate(self):
         """
-        Called as a separate thread, and recomputes the histogram whenever
-        it receives an event asking for it.
-        wself (Weakref to a stream): the stream to follow
+        Called by the projection scheduler, to recompute the histogram
         """
-        try:
-            stream = wstream()
-            ht_needs_recompute = stream._ht_needs_recompute
-            # Only hold a weakref to allow the stream to be garbage collected
-            # On GC, trigger im_needs_recompute so that the thread can end too
-            wstream = weakref.ref(stream, lambda o: ht_needs_recompute.set())
-
-            while True:
-                del stream
-                ht_needs_recompute.wait()  # wait until a new image is available
-                stream = wstream()
-                if stream is None:
-                    logging.debug("Stream disappeared so ending histrogram update thread")
-                    return
-                tstart = time.time()
-                ht_needs_recompute.clear()
-                stream._updateHistogram()
-                tend = time.time()
-
-                # sleep as much, to ensure we are not using too much CPU
-                tsleep = max(0.2, tend - tstart)  # max 5 Hz
-                time.sleep(tsleep)
-
-                # If still nothing to do, update the RGB image with the new B/C.
-                if not ht_needs_recompute.is_set() and stream.auto_bc.value:
-                    # Note that this can cause the .image to be updated even after the
-                    # stream is not active (but that can happen even without this).
-                    stream._shouldUpdateImage()
-        except Exception:
-            logging.exception("histrogram update thread failed")
+        tstart = time.time()
+        self._updateHistogram()
+        # Don't use too much CPU: wait at least as long as the computation
+        # before the next run (the period is counted from the start).
+        dur = time.time() - tstart
+        self._ht_job.min_period = dur + max(0.2, dur)  # max 5 Hz
+
+        # If still nothing to do, update the RGB image with the new B/C.
+        # Note that this can cause the .image to be updated even after the
+        # stream is not active (but that can happen even without this).
+        if not self._ht_job.isPending() and self.auto_bc.value:
+            self._shouldUpdateImage()
+
+    def getProjectionStats(self):
+        stats = super(LiveStream, self).getProjectionStats()
+        stats["histogram"] = self._ht_job.getStats()
+        return stats
 
     def _onNewData(self, dataflow, data):
         old_drange = self._drange
@@ -191,8 +170,13 @@ class LiveStream(Stream):
             self.raw[0] = data
 
         # Depth can change at each image (depends on hardware settings)
-        self._updateDRange(data)
-        if old_drange == self._drange:
+        self._updateDRange(self._getValidData(data))
+        if (model.MD_VALID_ROWS in data.metadata and
+            self.histogram._edges is not None):
+            # Partial frame: keep the histogram (and so the auto B/C) of the
+            # previous frame, so that only the new rows need to be projected
+            pass
+        elif old_drange == self._drange:
             # If different range, it will be immediately recomputed anyway
             self._shouldUpdateHistogram()
 
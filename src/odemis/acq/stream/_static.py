@@ -810,8 +810,14 @@ class StaticSpectrumStream(StaticStream):
                 {model.MD_WL_LIST, model.MD_WL_POLYNOMIAL}):
             raise ValueError("Spectrum data contains no wavelength information")
 
+        # When compensating, float32 is precise enough, and uses half the
+        # memory of float64. Otherwise, keep the type of the data.
+        dtype = numpy.float32 if coef is not None else None
+        # The whole cube is calibrated at once (ie, no index), as the projection,
+        # the histogram and the mean spectrum all need all the data anyway.
         # will raise an exception if incompatible
-        calibrated = calibration.compensate_spectrum_efficiency(data, bckg, coef)
+        calibrated = calibration.compensate_spectrum_efficiency(data, bckg, coef,
+                                                                dtype=dtype)
         self._calibrated = calibrated
 
     def _setBackground(self, bckg):
@@ -403,6 +403,8 @@ class MultipleDetectorStream(Stream):
         pass
 
     def _onMainImage(self, df, data):
+        if model.MD_VALID_ROWS in data.metadata:
+            return  # partial frame, the complete one will come later
         logging.debug("Main stream data received")
         if self._acq_min_date > data.metadata.get(model.MD_ACQ_DATE, 0):
             # This is a sign that the e-beam might have been at the wrong (old)
@@ -419,6 +421,8 @@ class MultipleDetectorStream(Stream):
             self._acq_main_complete.set()
 
     def _onRepetitionImage(self, df, data):
+        if model.MD_VALID_ROWS in data.metadata:
+            return  # partial frame, the complete one will come later
         logging.debug("Repetition stream data received")
         if self._acq_min_date > data.metadata.get(model.MD_ACQ_DATE, 0):
             # This is a sign that the e-beam might have been at the wrong (old)
@@ -43,8 +43,89 @@ SECOM_CONFIG = CONFIG_PATH + "sim/secom-sim.odm.yaml"
 class TestNoBackend(unittest.TestCase):
     # No backend, and only fake streams that don't generate anything
 
-    # TODO
-    pass
+    def test_order_group(self):
+        """
+        Check the streams are ordered to minimise the hardware changes
+        """
+        # The streams are only represented by their name
+        reqs = {"f1": {("filter", "f"): 1, ("light", "l"): "a"},
+                "f2": {("filter", "f"): 2, ("light", "l"): "b"},
+                "f3": {("filter", "f"): 1, ("light", "l"): "c"},
+                "f4": {("filter", "f"): 2, ("light", "l"): "d"},
+                }
+        streams = ["f1", "f2", "f3", "f4"]
+        ordered = acq._order_group(streams, reqs, None)
+        self.assertEqual(ordered, ["f1", "f3", "f2", "f4"])
+
+        # If the filter is already at 2, start with these streams
+        ordered = acq._order_group(streams, reqs, {("filter", "f"): 2})
+        self.assertEqual(ordered, ["f2", "f4", "f1", "f3"])
+
+        # Nothing to gain => keep the original order
+        reqs_same = {s: {} for s in streams}
+        ordered = acq._order_group(streams, reqs_same, None)
+        self.assertEqual(ordered, streams)
+
+        # Many streams => the filter should only change once
+        nstreams = acq.MAX_PERMUTATION_STREAMS + 4
+        streams = ["s%d" % i for i in range(nstreams)]
+        reqs = {s: {("filter", "f"): i % 2, ("light", "l"): i} for i, s in enumerate(streams)}
+        ordered = acq._order_group(streams, reqs, None)
+        self.assertEqual(set(ordered), set(streams))
+        nchanges = sum(1 for a, b in zip(ordered[:-1], ordered[1:])
+                       if reqs[a][("filter", "f")] != reqs[b][("filter", "f")])
+        self.assertEqual(nchanges, 1)
+
+    def test_path_cost(self):
+        """
+        Check the estimated time to switch optical path is used, when known
+        """
+        prev_req = {("path",): "ar"}
+        req = {("path",): "spectral"}
+        self.assertEqual(acq._transition_cost(prev_req, req),
+                         acq.TRANSITION_COSTS["path"])
+        self.assertEqual(acq._transition_cost(prev_req, req, {"ar": 0, "spectral": 12}), 12)
+        self.assertEqual(acq._transition_cost(prev_req, req, {"ar": 0.5, "spectral": 0}), 0.5)
+        # Unknown => fallback
+        self.assertEqual(acq._transition_cost(prev_req, req, {"ar": 0}),
+                         acq.TRANSITION_COSTS["path"])
+
+        # Without estimation, both orders are equivalent => original order.
+        # With estimation, it's better to first go to the mode close to the
+        # current one, and only once to the mode far away.
+        reqs = {"s1": {("path",): "far"},
+                "s2": {("path",): "close"},
+                }
+        prev_req = {("path",): "current"}
+        ordered = acq._order_group(["s1", "s2"], reqs, prev_req)
+        self.assertEqual(ordered, ["s1", "s2"])
+        path_costs = {"current": 0, "far": 10, "close": 1}
+        ordered = acq._order_group(["s1", "s2"], reqs, prev_req, path_costs)
+        self.assertEqual(ordered, ["s2", "s1"])
+
+    def test_schedule_end(self):
+        """
+        Check the streams using different hardware are expected to run in parallel
+        """
+        streams = ["sem", "ccd1", "ccd2", "ar"]
+        resources = {"sem": {"ebeam", "se"},
+                     "ccd1": {"ccd", "light"},
+                     "ccd2": {"ccd", "light"},
+                     "ar": {"ebeam", "ccd"}}
+        durations = {"sem": 2, "ccd1": 3, "ccd2": 4, "ar": 1}
+        # sem // (ccd1 -> ccd2) -> ar
+        end = acq._estimate_schedule_end(streams, resources, durations)
+        self.assertEqual(end, 3 + 4 + 1)
+
+        # Nothing in common => all in parallel
+        resources_ind = {s: {s} for s in streams}
+        end = acq._estimate_schedule_end(streams, resources_ind, durations)
+        self.assertEqual(end, 4)
+
+        # ccd1 already finished, and ccd2 is expected to finish at 12
+        end = acq._estimate_schedule_end(streams, resources, durations,
+                                         {"ccd1": 5, "ccd2": 12}, now=10)
+        self.assertEqual(end, 12 + 1)
 
 # @skip("simple")
 class SECOMTestCase(unittest.TestCase):
@@ -297,5 +297,50 @@ class TestSpectrum(unittest.TestCase):
             if wl <= wl_calib[0]:
                 self.assertEqual(vo * dcalib[0], vc)
 
+    def test_compensate_chunked(self):
+        """Test efficiency compensation in float32 and on part of the data"""
+        data = numpy.random.randint(0, 2000, (251, 1, 1, 200, 300)).astype(numpy.uint16)
+        wld = 433e-9 + numpy.array(range(data.shape[0])) * 0.1e-9
+        spec = model.DataArray(data, metadata={model.MD_WL_LIST: wld})
+
+        dbckg = numpy.random.randint(0, 100, (251, 1, 1, 1, 1)).astype(numpy.uint16)
+        bckg = model.DataArray(dbckg, metadata={model.MD_WL_LIST: wld})
+
+        dcalib = numpy.array([1, 1.3, 2, 3.5, 4, 5, 0.1, 6, 9.1], dtype=numpy.float)
+        dcalib.shape = (dcalib.shape[0], 1, 1, 1, 1)
+        wl_calib = 400e-9 + numpy.array(range(dcalib.shape[0])) * 10e-9
+        calib = model.DataArray(dcalib, metadata={model.MD_WL_LIST: wl_calib})
+
+        # Reference, computed on the whole data at once
+        calib_fitted = numpy.interp(wld, wl_calib, dcalib[:, 0, 0, 0, 0])
+        calib_fitted.shape += (1, 1, 1, 1)
+        exp = (numpy.maximum(data, dbckg) - dbckg) * calib_fitted
+
+        compensated = calibration.compensate_spectrum_efficiency(spec, bckg, calib,
+                                                                 dtype=numpy.float32)
+        self.assertEqual(compensated.dtype, numpy.float32)
+        self.assertEqual(spec.shape, compensated.shape)
+        numpy.testing.assert_equal(spec.metadata[model.MD_WL_LIST],
+                                   compensated.metadata[model.MD_WL_LIST])
+        numpy.testing.assert_allclose(compensated, exp, rtol=1e-6)
+
+        # Only subtracting the background keeps the same type
+        subtracted = calibration.compensate_spectrum_efficiency(spec, bckg)
+        self.assertEqual(subtracted.dtype, spec.dtype)
+        numpy.testing.assert_equal(subtracted, numpy.maximum(data, dbckg) - dbckg)
+
+        # Only one pixel
+        cpx = calibration.compensate_spectrum_efficiency(spec, bckg, calib,
+                                                         index=(0, 0, 10, 20))
+        self.assertEqual(cpx.shape, (data.shape[0],))
+        numpy.testing.assert_allclose(cpx, exp[:, 0, 0, 10, 20])
+
+        # Only one line
+        cline = calibration.compensate_spectrum_efficiency(spec, bckg, calib,
+                                                           index=(0, 0, slice(None), 20))
+        self.assertEqual(cline.shape, (data.shape[0], data.shape[-2]))
+        numpy.testing.assert_allclose(cline, exp[:, 0, 0, :, 20])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -27,6 +27,7 @@ import odemis
 from odemis.acq import path, stream
 from odemis.util import test
 import os
+import time
 import unittest
 from unittest.case import skip
 
@@ -138,6 +139,29 @@ class SimPathTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.optmngr.setPath("monochromator").result()
 
+#     @skip("simple")
+    def test_estimate_time(self):
+        """
+        Test estimating the time to change the optical path
+        """
+        self.optmngr.setPath("ar").result()
+        # Nothing to move => no time
+        self.assertEqual(self.optmngr.estimateSetPathTime("ar"), 0)
+
+        # Something to move => some time
+        dur = self.optmngr.estimateSetPathTime("mirror-align")
+        self.assertGreater(dur, 0)
+        self.optmngr.setPath("mirror-align").result()
+        self.assertEqual(self.optmngr.estimateSetPathTime("mirror-align"), 0)
+
+        # Going again to the same mode should be fast, as nothing moves
+        tstart = time.time()
+        self.optmngr.setPath("mirror-align").result()
+        self.assertLess(time.time() - tstart, 1)
+
+        with self.assertRaises(ValueError):
+            self.optmngr.estimateSetPathTime("ErrorMode")
+
 #     @skip("simple")
     def test_guess_mode(self):
         # test guess mode for ar
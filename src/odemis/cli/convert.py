@@ -29,6 +29,7 @@ import logging
 import numpy
 from odemis import dataio, model
 import odemis
+from odemis.acq import calibration
 from odemis.util import spectrum
 import os
 import sys
@@ -96,6 +97,38 @@ def open_ec(fn):
     return [da]
 
 
+def open_ec_file(fn):
+    """
+    Read a spectrum efficiency compensation from a file, either in CSV format
+    or as an acquisition file
+    return (DataArray): the spectrum efficiency compensation data
+    """
+    if fn.lower().endswith(".csv"):
+        return open_ec(fn)[0]
+    else:
+        data, _ = open_acq(fn)
+        return calibration.get_spectrum_efficiency(data)
+
+
+def compensate(data, coef):
+    """
+    Applies the spectrum efficiency compensation on all the spectrum data.
+    The other data is returned unchanged.
+    data (list of DataArrays)
+    coef (DataArray of shape C1111): the compensation coefficients
+    returns (list of DataArrays): the compensated data, in float32
+    """
+    ret = []
+    for da in data:
+        if (da.ndim == 5 and da.shape[0] > 1 and
+            set(da.metadata.keys()) & {model.MD_WL_LIST, model.MD_WL_POLYNOMIAL}):
+            logging.info("Compensating spectrum data of shape %s", da.shape)
+            da = calibration.compensate_spectrum_efficiency(da, coef=coef,
+                                                            dtype=numpy.float32)
+        ret.append(da)
+    return ret
+
+
 def save_acq(fn, data, thumbs):
     """
     Saves to a file the data and thumbnail
@@ -188,6 +221,11 @@ def main(args):
     parser.add_argument("--minus", "-m", dest="minus", action='append',
             help="name of an acquisition file whose data is subtracted from the input file.")
 
+    parser.add_argument("--compensate", "-c", dest="compensate",
+            help="name of a spectrum efficiency compensation file (in CSV "
+            "format or an acquisition file), which is applied on the spectrum "
+            "data of the input file.")
+
     # TODO: --export (spatial) image that defaults to a HFW corresponding to the
     # smallest image, and can be overridden by --hfw xxx (in µm).
     # TODO: --range parameter to select which image to select from the input
@@ -230,6 +268,13 @@ def main(args):
             sdata, sthumbs = open_acq(fn)
             data = minus(data, sdata)
 
+    if options.compensate:
+        if thumbs:
+            logging.info("Dropping thumbnail due to efficiency compensation")
+            thumbs = []
+        coef = open_ec_file(options.compensate)
+        data = compensate(data, coef)
+
     save_acq(outfn, data, thumbs)
 
     logging.info("Successfully generated file %s", outfn)
@@ -34,14 +34,19 @@ import logging
 import numbers
 from odemis import model, dataio, util
 import odemis
-from odemis.util import units
+from odemis.util import units, benchmark
 from odemis.util.conversion import convert_to_object
 from odemis.util.driver import BACKEND_RUNNING, \
     BACKEND_DEAD, BACKEND_STOPPED, get_backend_status, BACKEND_STARTING
+import Queue
 import sys
 import threading
+import time
 
 
+# Maximum memory used by the frames received, but not yet written to the file
+MAX_PENDING_FRAMES_SIZE = 1024 ** 3  # bytes
+
 status_to_xtcode = {BACKEND_RUNNING: 0,
                     BACKEND_DEAD: 1,
                     BACKEND_STOPPED: 2,
@@ -614,23 +619,20 @@ def stop_move():
     if error:
         raise IOError("Failed to stop all the actuators")
 
-def _get_big_image(df):
+def get_dataflow(component, df_name):
     """
-    Same as df.get(), but avoids "out of memory" errors more often in case of
-    really big images (>100 Mb)
-    df (Dataflow)
+    return (DataFlow): the dataflow of the component with the given name
+    raises ValueError: if the component has no such dataflow
     """
-    evt = threading.Event()
-    images = []
+    try:
+        df = getattr(component, df_name)
+    except AttributeError:
+        raise ValueError("Failed to find data-flow '%s' on component %s" % (df_name, component.name))
 
-    def get_data(dflow, da):
-        dflow.unsubscribe(get_data)
-        images.append(da)
-        evt.set()
+    if not isinstance(df, model.DataFlowBase):
+        raise ValueError("%s.%s is not a data-flow" % (component.name, df_name))
 
-    df.subscribe(get_data)
-    evt.wait()
-    return images[-1]
+    return df
 
 def acquire(comp_name, dataflow_names, filename):
     """
@@ -642,24 +644,11 @@ def acquire(comp_name, dataflow_names, filename):
     component = get_detector(comp_name)
 
     # check the dataflow exists
-    dataflows = []
-    for df_name in dataflow_names:
-        try:
-            df = getattr(component, df_name)
-        except AttributeError:
-            raise ValueError("Failed to find data-flow '%s' on component %s" % (df_name, comp_name))
-
-        if not isinstance(df, model.DataFlowBase):
-            raise ValueError("%s.%s is not a data-flow" % (comp_name, df_name))
-
-        dataflows.append(df)
+    dataflows = [get_dataflow(component, df_name) for df_name in dataflow_names]
 
     images = []
     for df in dataflows:
         try:
-            # Note: currently, get() uses Pyro, which is not as memory efficient
-            # as .subscribe(), which uses ZMQ. So would need to use
-            # _get_big_image() if very large image is requested.
             image = df.get()
         except Exception as exc:
             raise IOError("Failed to acquire image from component %s: %s" % (comp_name, exc))
@@ -690,6 +679,166 @@ def acquire(comp_name, dataflow_names, filename):
     except IOError as exc:
         raise IOError(u"Failed to save to '%s': %s" % (filename, exc))
 
+class FrameRecorder(object):
+    """
+    Receives the frames of a dataflow, and writes them to a file from a
+    separate thread, so that the reception is never blocked by the disk.
+    """
+
+    def __init__(self, writer, nframes=None, rate=None):
+        """
+        writer (dataio.*.FrameWriter): where to write the frames
+        nframes (None or 0<int): number of frames to record. If None, it's
+          unlimited.
+        rate (None or 0<float): maximum number of frames per second to record.
+          The frames received faster are skipped. If None, all the frames are
+          recorded.
+        """
+        self._writer = writer
+        self._nframes = nframes
+        self._period = 1 / rate if rate else 0
+        self._queue = Queue.Queue()  # DataArray or None (= end)
+        self._lock = threading.Lock()  # protects the counters and the queue
+        self._pending_size = 0  # bytes in the queue
+
+        self.finished = threading.Event()  # set when no more frames are accepted
+        self.error = None  # exception raised while writing
+        self.accepted = 0  # frames to be written
+        self.skipped = 0  # frames not written, due to the rate limit
+        self.dropped = 0  # frames not written, due to the writer being too slow
+        self.first_time = None  # reception time of the first accepted frame
+        self.last_time = None  # reception time of the last accepted frame
+
+        self._thread = threading.Thread(target=self._runWriter, name="Frame writer")
+        self._thread.start()
+
+    def on_data(self, df, data):
+        now = time.time()
+        with self._lock:
+            if self.finished.is_set():
+                return
+            if self.last_time is not None and now < self.last_time + self._period:
+                self.skipped += 1
+                return
+            if self._pending_size + data.nbytes > MAX_PENDING_FRAMES_SIZE:
+                self.dropped += 1
+                return
+
+            if self.first_time is None:
+                self.first_time = now
+            self.last_time = now
+            self.accepted += 1
+            self._pending_size += data.nbytes
+            self._queue.put(data)
+            if self._nframes and self.accepted >= self._nframes:
+                self.finished.set()
+
+    def _runWriter(self):
+        try:
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    return
+                with self._lock:
+                    self._pending_size -= data.nbytes
+                self._writer.append(data)
+        except Exception as exc:
+            logging.exception("Failed to write frame %d", self._writer.count)
+            with self._lock:
+                self.error = exc
+                self.finished.set()
+
+    def stop(self):
+        """
+        Stop accepting frames, and wait until all the frames are written
+        """
+        with self._lock:
+            self.finished.set()
+            self._queue.put(None)
+        self._thread.join()
+        self._writer.close()
+
+def acquire_frames(comp_name, df_name, filename, nframes=None, duration=None, rate=None):
+    """
+    Acquire a series of images from a dataflow, and write them to a file while
+    they are received, so that they don't need to fit in memory.
+    comp_name (string): name of the detector to find
+    df_name (string): name of the dataflow to access
+    filename (unicode): name of the output file (format depends on the extension,
+      only TIFF and HDF5 are supported)
+    nframes (None or 0<int): number of frames to record
+    duration (None or 0<float): maximum time (in s) to record
+    rate (None or 0<float): maximum number of frames per second to record
+    If nframes and duration are None, it records until it's interrupted.
+    """
+    component = get_detector(comp_name)
+    df = get_dataflow(component, df_name)
+
+    exporter = dataio.find_fittest_converter(filename)
+    if not hasattr(exporter, "FrameWriter"):
+        raise ValueError("Format %s doesn't support recording multiple frames" % (exporter.FORMAT,))
+    try:
+        writer = exporter.FrameWriter(filename)
+    except Exception as exc:
+        raise IOError(u"Failed to create file '%s': %s" % (filename, exc))
+
+    # The recorder takes care of dropping the frames, if it's too slow
+    df.max_discard = 0
+    recorder = FrameRecorder(writer, nframes, rate)
+    if nframes is None and duration is None:
+        logging.warning("Recording until interrupted with Ctrl+C")
+    tend = time.time() + duration if duration is not None else None
+    df.subscribe(recorder.on_data)
+    try:
+        # Note: wait() without timeout cannot be interrupted by Ctrl+C
+        while not recorder.finished.wait(0.1):
+            if tend is not None and time.time() > tend:
+                break
+    except KeyboardInterrupt:
+        logging.info("Recording interrupted")
+    finally:
+        df.unsubscribe(recorder.on_data)
+        recorder.stop()
+
+    if recorder.error is not None:
+        raise IOError(u"Failed to save to '%s': %s" % (filename, recorder.error))
+
+    if recorder.accepted > 1:
+        fps = (recorder.accepted - 1) / (recorder.last_time - recorder.first_time)
+    else:
+        fps = 0
+    print "Recorded %d frames at %g fps, %d frames skipped (rate limit), %d frames dropped" % (
+           writer.count, fps, recorder.skipped, recorder.dropped)
+    if recorder.dropped:
+        logging.warning("%d frames were dropped, as they could not be written fast enough",
+                        recorder.dropped)
+
+def bench_dataflow(names, duration=None, pretty=True):
+    """
+    Measure the performance of a dataflow, and print the results
+    names (list of str): name of the component (or simulator), optionally
+      followed by the name of the dataflow
+    duration (None or 0<float): time of the measurement (in s)
+    pretty (bool): if False, display the results in a machine-friendly way
+    """
+    if len(names) > 2:
+        raise ValueError("Benchmark accepts only one data-flow")
+    comp_name = names[0]
+    df_name = names[1] if len(names) == 2 else "data"
+    if duration is None:
+        duration = 5
+
+    if comp_name in benchmark.SIMULATORS:
+        results = benchmark.bench_simulator(comp_name, df_name, duration)
+    else:
+        component = get_detector(comp_name)
+        df = get_dataflow(component, df_name)
+        results = [("remote", benchmark.measure_dataflow(df, duration))]
+
+    for mode, res in results:
+        print benchmark.format_report(u"%s.%s (%s)" % (comp_name, df_name, mode),
+                                      res, pretty)
+
 def live_display(comp_name, df_name):
     """
     Acquire an image from one (or more) dataflow
@@ -817,6 +966,24 @@ def main(args):
                         help="name of the file where the image should be saved "
                         "after acquisition. The file format is derived from the extension "
                         "(TIFF and HDF5 are supported).")
+    dm_grp.add_argument("--frames", dest="frames", type=int, metavar="<n>",
+                        help="with --acquire, record a series of n images, "
+                        "written to the file while being acquired.")
+    dm_grp.add_argument("--duration", dest="duration", type=float, metavar="<s>",
+                        help="with --acquire, record a series of images "
+                        "during the given time (in seconds). With --bench-dataflow, "
+                        "duration of the measurement (default is 5 s).")
+    dm_grp.add_argument("--rate", dest="rate", type=float, metavar="<fps>",
+                        help="with --acquire, record a series of images, "
+                        "with at most the given number of frames per second. "
+                        "Without --frames or --duration, it records until Ctrl+C.")
+    dm_grpe.add_argument("--bench-dataflow", dest="benchdf", nargs="+",
+                         metavar=("<component>", "data-flow"),
+                         help="measure the frame rate, throughput, latency and "
+                         "jitter of a data-flow (default is \"data\"). The "
+                         "component can also be one of the simulators (%s), "
+                         "which run without back-end." %
+                         (", ".join(sorted(benchmark.SIMULATORS.keys())),))
     dm_grpe.add_argument("--live", dest="live", nargs="+",
                          metavar=("<component>", "data-flow"),
                          help="display and update an image on the screen (default data-flow is \"data\")")
@@ -858,12 +1025,23 @@ def main(args):
         options.list, options.stop, options.move,
         options.position, options.reference,
         options.listprop, options.setattr, options.upmd,
-        options.acquire, options.live)):
+        options.acquire, options.live, options.benchdf)):
         logging.error("No action specified.")
         return 127
     if options.acquire is not None and options.output is None:
         logging.error("Name of the output file must be specified.")
         return 127
+    record_series = any(o is not None for o in (options.frames, options.duration, options.rate))
+    if record_series and options.benchdf is None:
+        if options.acquire is None:
+            logging.error("--frames, --duration and --rate can only be used with --acquire.")
+            return 127
+        if len(options.acquire) > 2:
+            logging.error("A series of images can only be recorded from one data-flow.")
+            return 127
+        if any(o is not None and o <= 0 for o in (options.frames, options.duration, options.rate)):
+            logging.error("--frames, --duration and --rate must be positive.")
+            return 127
     if options.setattr:
         for l in options.setattr:
             if len(l) < 3 or (len(l) - 1) % 2 == 1:
@@ -890,6 +1068,11 @@ def main(args):
                 scan()
             return 0
 
+        # the simulators can be benchmarked without backend
+        if options.benchdf is not None and options.benchdf[0] in benchmark.SIMULATORS:
+            bench_dataflow(options.benchdf, options.duration, pretty=not options.machine)
+            return 0
+
         # check if there is already a backend running
         if status == BACKEND_STOPPED:
             raise IOError("No running back-end")
@@ -936,7 +1119,13 @@ def main(args):
             else:
                 dataflows = options.acquire[1:]
             filename = options.output.decode(sys.getfilesystemencoding())
-            acquire(component, dataflows, filename)
+            if record_series:
+                acquire_frames(component, dataflows[0], filename,
+                               options.frames, options.duration, options.rate)
+            else:
+                acquire(component, dataflows, filename)
+        elif options.benchdf is not None:
+            bench_dataflow(options.benchdf, options.duration, pretty=not options.machine)
         elif options.live is not None:
             component = options.live[0]
             if len(options.live) == 1:
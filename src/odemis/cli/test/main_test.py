@@ -29,6 +29,7 @@ import logging
 from odemis import model
 import odemis
 from odemis.cli import main
+from odemis.dataio import hdf5, tiff
 from odemis.util import test
 import os
 import re
@@ -336,6 +337,39 @@ class TestWithBackend(unittest.TestCase):
         im = Image.open(picture_name)
         self.assertEqual(im.format, "TIFF")
         self.assertEqual(im.size, size)
-    
+
+    def test_acquire_frames(self):
+        filename = "test-frames.h5"
+        nframes = 5
+
+        try:
+            cmdline = ["cli", "--acquire", "Camera", "--output=%s" % filename,
+                       "--frames", "%d" % nframes, "--duration", "30"]
+            ret = main.main(cmdline)
+        except SystemExit as exc:
+            ret = exc.code
+        self.assertEqual(ret, 0, "trying to run '%s'" % cmdline)
+
+        data = hdf5.read_data(filename)
+        self.assertEqual(len(data), 1)
+        self.assertEqual(data[0].shape[1], nframes)  # T dimension
+        os.remove(filename)
+
+    def test_acquire_frames_duration(self):
+        filename = "test-frames.tiff"
+
+        try:
+            cmdline = ["cli", "--acquire", "Camera", "--output=%s" % filename,
+                       "--duration", "2", "--rate", "2"]
+            ret = main.main(cmdline)
+        except SystemExit as exc:
+            ret = exc.code
+        self.assertEqual(ret, 0, "trying to run '%s'" % cmdline)
+
+        # With 2 fps during 2 s, there should be between 1 and 5 frames
+        data = tiff.read_data(filename)
+        self.assertTrue(1 <= len(data) <= 5, "got %d frames" % len(data))
+        os.remove(filename)
+
 if __name__ == "__main__":
     unittest.main()
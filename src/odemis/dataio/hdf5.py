@@ -1397,6 +1397,100 @@ def export(filename, data, thumbnail=None):
         data = [data]
     _saveAsHDF5(filename, data, thumbnail)
 
+
+class FrameWriter(object):
+    """
+    Writes a time series of images to an HDF5 file, one frame at a time, so
+    that the whole acquisition never needs to be in memory.
+    All the frames are stored in one acquisition, along the T dimension. They
+    must all have the same shape and dtype. The metadata is the one of the
+    first frame, and the duration between frames (MD_PIXEL_DUR) is the average
+    one, according to the MD_ACQ_DATE of the frames.
+    """
+
+    def __init__(self, filename, compressed=False):
+        """
+        filename (unicode): filename of the file to create (including path)
+        compressed (boolean): whether the file is compressed or not. It's
+          slower to write, so it's not recommended for high frame rates.
+        """
+        # h5py will extend the current file by default
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        self._file = h5py.File(filename, "w")
+        self._compression = "gzip" if compressed else None
+        self._dataset = None
+        self._first = None  # DataArray (5D) of the first frame
+        self._last_date = None
+        self._min = None
+        self._max = None
+        self.count = 0  # number of frames written
+
+    def append(self, data):
+        """
+        Write one more frame at the end of the file
+        data (model.DataArray): the frame, with T = 1 (and C, Z of the same
+          length as the first frame)
+        raises ValueError: if the frame doesn't fit the previous ones
+        """
+        if self._file is None:
+            raise ValueError("Frame writer is already closed")
+        da = _adjustDimensions(_mergeCorrectionMetadata(data))
+        if da.ndim != 5 or da.shape[1] != 1:
+            raise ValueError("Cannot append data of shape %s as one frame" % (data.shape,))
+
+        if self._dataset is None:
+            gi = self._file.create_group("Acquisition0/ImageData")
+            # Unlimited along T, and one chunk per frame
+            maxshape = da.shape[:1] + (None,) + da.shape[2:]
+            self._dataset = _create_image_dataset(gi, "Image", da, maxshape=maxshape,
+                                                  chunks=da.shape,
+                                                  compression=self._compression)
+            self._first = da
+        else:
+            if da.shape != self._first.shape or da.dtype != self._first.dtype:
+                raise ValueError("Frame of shape %s and type %s differs from the "
+                                 "first frame of shape %s and type %s" %
+                                 (da.shape, da.dtype, self._first.shape, self._first.dtype))
+            self._dataset.resize(self.count + 1, axis=1)
+            self._dataset[:, self.count:self.count + 1] = da
+
+        self.count += 1
+        self._last_date = da.metadata.get(model.MD_ACQ_DATE)
+        mn, mx = da.min(), da.max()
+        self._min = mn if self._min is None else min(self._min, mn)
+        self._max = mx if self._max is None else max(self._max, mx)
+
+    def close(self):
+        """
+        Write the metadata, and close the file. Nothing can be appended after.
+        """
+        if self._file is None:
+            return
+        try:
+            if self._dataset is not None:
+                md = self._first.metadata.copy()
+                md[model.MD_DIMS] = "CTZYX"
+                if (self.count > 1 and model.MD_ACQ_DATE in md and
+                    self._last_date is not None):
+                    md[model.MD_PIXEL_DUR] = ((self._last_date - md[model.MD_ACQ_DATE]) /
+                                              (self.count - 1))
+                header = model.DataArray(self._first, md)
+
+                ga = self._file["Acquisition0"]
+                _h5py_enum_commit(ga, "StateEnumeration", _dtstate)
+                if "IMAGE_MINMAXRANGE" in self._dataset.attrs:
+                    self._dataset.attrs["IMAGE_MINMAXRANGE"] = [self._min, self._max]
+                _add_image_info(ga["ImageData"], self._dataset, header)
+                _add_image_metadata(ga, header, None)
+                _add_svi_info(ga)
+        finally:
+            self._file.close()
+            self._file = None
+
+
 def read_data(filename):
     """
     Read an HDF5 file and return its content (skipping the thumbnail).
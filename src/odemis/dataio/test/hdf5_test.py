@@ -71,6 +71,35 @@ class TestHDF5IO(unittest.TestCase):
         self.assertEqual(im.shape, data.shape)
         self.assertEqual(im[white[-1:-3:-1]], data[white[-1:-3:-1]])
 
+    def testFrameWriter(self):
+        """Write a time series frame by frame"""
+        size = (256, 128)  # (width, height)
+        dtype = numpy.uint16
+        nframes = 5
+        tstart = time.time()
+        writer = hdf5.FrameWriter(FILENAME)
+        for i in range(nframes):
+            md = {model.MD_ACQ_DATE: tstart + i * 0.1,
+                  model.MD_PIXEL_SIZE: (1e-6, 1e-6)}
+            data = model.DataArray(numpy.zeros(size[::-1], dtype) + i, md)
+            writer.append(data)
+
+        # Frames of different shape cannot be appended
+        data = model.DataArray(numpy.zeros((12, 16), dtype))
+        self.assertRaises(ValueError, writer.append, data)
+        writer.close()
+        self.assertEqual(writer.count, nframes)
+
+        rdata = hdf5.read_data(FILENAME)
+        self.assertEqual(len(rdata), 1)
+        im = rdata[0]
+        self.assertEqual(im.shape, (1, nframes, 1) + size[::-1])
+        for i in range(nframes):
+            self.assertEqual(im[0, i, 0, 0, 0], i)
+        self.assertAlmostEqual(im.metadata[model.MD_ACQ_DATE], tstart)
+        self.assertAlmostEqual(im.metadata[model.MD_PIXEL_DUR], 0.1)
+        self.assertEqual(im.metadata[model.MD_PIXEL_SIZE], (1e-6, 1e-6))
+
     def testUnicodeName(self):
         """Try filename not fitting in ascii"""
         # create a simple greyscale image
@@ -1836,6 +1836,65 @@ def export(filename, data, thumbnail=None, compressed=True, multiple_files=False
         assert(isinstance(data, model.DataArray))
         _saveAsMultiTiffLT(filename, [data], thumbnail, compressed)
 
+
+class FrameWriter(object):
+    """
+    Writes a sequence of images to a multiple-page TIFF file, one frame at a
+    time, so that the whole acquisition never needs to be in memory.
+    Each frame is stored in its own page, with its own metadata (as TIFF tags).
+    As the OME-XML metadata has to be in the first page, while the number of
+    frames is only known at the end, none is written. So, when reading back
+    the file, each frame is a separate DataArray.
+    """
+
+    def __init__(self, filename, compressed=False):
+        """
+        filename (unicode): filename of the file to create (including path)
+        compressed (boolean): whether the file is LZW compressed or not. It's
+          slower to write, so it's not recommended for high frame rates.
+        """
+        self._file = TIFF.open(_ensure_fs_encoding(filename), mode='w')
+        self._compression = "lzw" if compressed else None
+        self.count = 0  # number of frames written
+
+    def append(self, data):
+        """
+        Write one more frame at the end of the file
+        data (model.DataArray): the frame, 2D (or with all the other dimensions
+          of length 1), or RGB with MD_DIMS = YXC.
+        raises ValueError: if the data cannot be stored as one frame
+        """
+        if self._file is None:
+            raise ValueError("Frame writer is already closed")
+        data = _mergeCorrectionMetadata(data)
+        tags = _convertToTiffTag(data.metadata)
+
+        write_rgb = (data.metadata.get(model.MD_DIMS) == 'YXC' and
+                     data.ndim == 3 and data.shape[-1] in (3, 4))
+        if not write_rgb:
+            if any(s != 1 for s in data.shape[:-2]):
+                raise ValueError("Cannot append data of shape %s as one frame" % (data.shape,))
+            data = data.reshape(data.shape[-2:])
+
+        for key, val in tags.items():
+            self._file.SetField(key, val)
+        if data.dtype in [numpy.int64, numpy.uint64]:
+            c = None  # libtiff doesn't support compression on these types
+        else:
+            c = self._compression
+        self._file.write_image(data, write_rgb=write_rgb, compression=c)
+        self.count += 1
+
+    def close(self):
+        """
+        Close the file. Nothing can be appended after.
+        """
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+
+
 def read_data(filename):
     """
     Read an TIFF file and return its content (skipping the thumbnail).
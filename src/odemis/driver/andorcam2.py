@@ -70,6 +70,15 @@ class AndorCapabilities(Structure):
                 ("EMGainCapability", c_uint32),
                 ("FTReadModes", c_uint32)]
 
+    # for the AcqModes field
+    ACQMODE_SINGLE = 1
+    ACQMODE_VIDEO = 2
+    ACQMODE_ACCUMULATE = 4
+    ACQMODE_KINETIC = 8
+    ACQMODE_FRAMETRANSFER = 16
+    ACQMODE_FASTKINETICS = 32
+    ACQMODE_OVERLAP = 64
+
     # for the Features field
     FEATURES_POLLING = 1
     FEATURES_EVENTS = 2
@@ -533,6 +542,12 @@ class AndorCam2(model.DigitalCamera):
 
         self._binning = (1, 1) # px, horizontal, vertical
         self._image_rect = (1, resolution[0], 1, resolution[1])
+        # needed for the resolution, as it depends on the binning
+        self._img_maxbin = self.GetMaximumBinnings(AndorV2DLL.RM_IMAGE)
+        self._fvb_supported = bool(self.GetCapabilities().ReadModes &
+                                   AndorCapabilities.READMODE_FVB)
+        self._ft_supported = bool(self.GetCapabilities().AcqModes &
+                                  AndorCapabilities.ACQMODE_FRAMETRANSFER)
         if resolution[1] == 1:
             # If limit is obvious, indicate it via the VA range
             min_res = (self.GetMinimumImageLength(), 1)
@@ -545,7 +560,11 @@ class AndorCam2(model.DigitalCamera):
                                              setter=self._setResolution)
         self._setResolution(self._transposeSizeToUser(resolution))
 
-        maxbin = self.GetMaximumBinnings(AndorV2DLL.RM_IMAGE)
+        maxbin = self._img_maxbin
+        if self._fvb_supported:
+            # Binning the whole height is done in the "full vertical binning"
+            # read mode, which is faster, and not limited by the image mode.
+            maxbin = (maxbin[0], max(maxbin[1], resolution[1]))
         self.binning = model.ResolutionVA(self._transposeSizeToUser(self._binning),
                                           (self._transposeSizeToUser((1, 1)),
                                            self._transposeSizeToUser(maxbin)),
@@ -649,6 +668,15 @@ class AndorCam2(model.DigitalCamera):
         self._late_events = collections.deque() # events which haven't been handled yet
         self._ready_for_acq_start = False
 
+        # If True, during a continuous acquisition, all the frames stored by
+        # the camera in its circular buffer are sent (with frame transfer, if
+        # available), instead of only the latest one. Frames are only dropped if
+        # they are not read before the circular buffer is full.
+        # Only taken into account when the acquisition starts.
+        self.burst = model.BooleanVA(False)
+        # Buffer where the burst images are read, reused as long as it's big enough
+        self._burst_buf = None
+
         self.data = AndorCam2DataFlow(self)
         # Convenience event for the user to connect and fire
         self.softwareTrigger = model.Event()
@@ -662,6 +690,7 @@ class AndorCam2(model.DigitalCamera):
         """
         # needed for the AOI
         self.atcore.SetReadMode(AndorV2DLL.RM_IMAGE)
+        self._read_mode = AndorV2DLL.RM_IMAGE
 
         # Doesn't seem to work for the clara (or single scan mode?)
 #        self.atcore.SetFilterMode(2) # 2 = on
@@ -964,6 +993,34 @@ class AndorCam2(model.DigitalCamera):
         self.atcore.GetAcquisitionTimings(byref(exposure), byref(accumulate), byref(kinetic))
         return exposure.value, accumulate.value, kinetic.value
 
+    def GetNumberNewImages(self):
+        """
+        return (int, int): index of the first and last images available in the
+          circular buffer (starting from 1 since the acquisition started). If
+          no image is available, last < first.
+        """
+        first, last = c_int32(), c_int32()
+        try:
+            self.atcore.GetNumberNewImages(byref(first), byref(last))
+        except AndorV2Error as (errno, strerr):
+            if errno == 20024:  # DRV_NO_NEW_DATA
+                return 1, 0
+            raise
+        return first.value, last.value
+
+    def GetImages16(self, first, last, cbuffer, size):
+        """
+        Read a series of images from the circular buffer
+        first, last (int): index of the first and last images to read
+        cbuffer (ctypes buffer): buffer to write the images (one after another)
+        size (int): number of pixels in the buffer
+        return (int, int): index of the first and last images actually read
+        """
+        validfirst, validlast = c_int32(), c_int32()
+        self.atcore.GetImages16(c_int32(first), c_int32(last), cbuffer,
+                                c_uint32(size), byref(validfirst), byref(validlast))
+        return validfirst.value, validlast.value
+
     def GetVersionInfo(self):
         """
         return (2-tuple string, string): the driver and sdk info
@@ -1331,7 +1388,10 @@ class AndorCam2(model.DigitalCamera):
         Called when "binning" VA is modified. It actually modifies the camera binning.
         """
         value = self._transposeSizeFromUser(value)
-        # TODO support "Full Vertical Binning" if binning[1] == size[1]
+        # A vertical binning bigger than the image mode supports is only
+        # possible with full vertical binning
+        if value[1] > self._img_maxbin[1] and not self._isFVB(value):
+            value = (value[0], self._img_maxbin[1])
         prev_binning = self._binning
         self._binning = value
 
@@ -1346,6 +1406,15 @@ class AndorCam2(model.DigitalCamera):
         self.resolution.value = self._transposeSizeToUser(self.resolutionFitter(new_resolution))
         return self._transposeSizeToUser(self._binning)
 
+    def _isFVB(self, binning):
+        """
+        binning (2-tuple of int): binning (not transposed)
+        return (bool): True if the binning can be done with the full vertical
+          binning read mode
+        """
+        return (self._fvb_supported and binning[0] == 1 and
+                binning[1] == self._shape[1])
+
     def _storeSize(self, size):
         """
         Check the size is correct (it should) and store it ready for SetImage
@@ -1401,6 +1470,11 @@ class AndorCam2(model.DigitalCamera):
         if (not caps.ReadModes & AndorCapabilities.READMODE_SUBIMAGE):
             return max_size
 
+        # Full vertical binning (only available in this read mode) always reads
+        # the whole width
+        if self._binning[1] > self._img_maxbin[1]:
+            return max_size
+
         # smaller than the whole sensor
         size = (min(size_req[0], max_size[0]), min(size_req[1], max_size[1]))
 
@@ -1546,8 +1620,21 @@ class AndorCam2(model.DigitalCamera):
                                     "1 is recommended on the iDus",
                                     self._binning[0])
 
-            logging.debug("Updating image settings")
-            self.atcore.SetImage(*new_image_settings)
+            # The full vertical binning read mode is faster than the image
+            # mode, and can bin the whole height, but it has no AOI.
+            if (self._isFVB(self._binning) and
+                self._image_rect[0:2] == (1, self._shape[0])):
+                read_mode = AndorV2DLL.RM_FULL_VERTICAL_BINNING
+            else:
+                read_mode = AndorV2DLL.RM_IMAGE
+            if self._read_mode != read_mode:
+                logging.debug("Updating read mode to %d", read_mode)
+                self.atcore.SetReadMode(read_mode)
+                self._read_mode = read_mode
+
+            if read_mode == AndorV2DLL.RM_IMAGE:
+                logging.debug("Updating image settings")
+                self.atcore.SetImage(*new_image_settings)
             # there is no metadata for the resolution
             self._metadata[model.MD_BINNING] = self._transposeSizeToUser(self._binning)
 
@@ -1708,8 +1795,14 @@ class AndorCam2(model.DigitalCamera):
                             self.acquire_must_stop.clear()
                             raise
                     # We don't use the kinetic mode as it might go faster than we can
-                    # process them.
+                    # process them. In burst mode, we rely on the fact that in
+                    # "run till abort" mode, the camera also stores all the
+                    # images in its circular buffer, and read them all at once.
+                    burst = self.burst.value
                     self.atcore.SetAcquisitionMode(AndorV2DLL.AM_VIDEO)
+                    if self._ft_supported:
+                        # Exposes the next frame during the readout
+                        self.atcore.SetFrameTransferMode(1 if burst else 0)
                     # Seems exposure needs to be re-set after setting acquisition mode
                     self._prev_settings[1] = None # 1 => exposure time
                     size = self._update_settings()
@@ -1717,6 +1810,8 @@ class AndorCam2(model.DigitalCamera):
                         self.hw_lock.acquire()
                         has_hw_lock = True
                     self.atcore.StartAcquisition()
+                    tseries = time.time()  # ~ start of the first image
+                    last_read = 0  # index of the last image read
 
                     exposure, accumulate, kinetic = self.GetAcquisitionTimings()
                     logging.debug("Accumulate time = %f, kinetic = %f", accumulate, kinetic)
@@ -1730,8 +1825,11 @@ class AndorCam2(model.DigitalCamera):
                 tstart = time.time()
                 tend = tstart + duration
                 metadata[model.MD_ACQ_DATE] = tstart # time at the beginning
-                cbuffer = self._allocate_buffer(size)
-                array = self._buffer_as_array(cbuffer, size, metadata)
+                if burst:
+                    cbuffer, array = None, None
+                else:
+                    cbuffer = self._allocate_buffer(size)
+                    array = self._buffer_as_array(cbuffer, size, metadata)
 
                 # we don't know when it started acquiring, so we just keep
                 # poking (to also be able to detect cancellation)
@@ -1753,9 +1851,14 @@ class AndorCam2(model.DigitalCamera):
                                     pass
                         else:
                             break # new image!
-                    # it might have acquired _several_ images in the time to process
-                    # one image. In this case we discard all but the last one.
-                    self.atcore.GetMostRecentImage16(cbuffer, c_uint32(size[0] * size[1]))
+                    if burst:
+                        arrays, last_read = self._readNewImages(size, metadata,
+                                                     tseries, kinetic, last_read)
+                    else:
+                        # it might have acquired _several_ images in the time to process
+                        # one image. In this case we discard all but the last one.
+                        self.atcore.GetMostRecentImage16(cbuffer, c_uint32(size[0] * size[1]))
+                        arrays = [self._transposeDAToUser(array)]
                 except AndorV2Error as (errno, strerr):
                     # try again up to 5 times
                     failures += 1
@@ -1782,9 +1885,11 @@ class AndorCam2(model.DigitalCamera):
                 else:
                     failures = 0
 
-                logging.debug("image acquired successfully after %g s", time.time() - tstart)
-                callback(self._transposeDAToUser(array))
-                del cbuffer, array
+                logging.debug("%d image(s) acquired successfully after %g s",
+                              len(arrays), time.time() - tstart)
+                while arrays:
+                    callback(arrays.pop(0))
+                del cbuffer, array, arrays
 
                 # force the GC to non-used buffers, for some reason, without this
                 # the GC runs only after we've managed to fill up the memory
@@ -1809,12 +1914,59 @@ class AndorCam2(model.DigitalCamera):
             if has_hw_lock:
                 self.hw_lock.release()
                 has_hw_lock = False
+            if self._ft_supported:
+                # Back to the default, for the other acquisition modes
+                try:
+                    self.atcore.SetFrameTransferMode(0)
+                except AndorV2Error:
+                    logging.warning("Failed to reset frame transfer mode", exc_info=True)
+            self._burst_buf = None
             self.atcore.FreeInternalMemory() # TODO not sure it's needed
             self.acquisition_lock.release()
             gc.collect()
             logging.debug("Acquisition thread closed")
             self.acquire_must_stop.clear()
 
+    def _readNewImages(self, size, metadata, tseries, period, last_read):
+        """
+        Reads at once all the new images available in the circular buffer
+        size (2-tuple of int): width, height of an image
+        metadata (dict): metadata of the images
+        tseries (float): time of the start of the first image of the series
+        period (float): time between the start of two images (s)
+        last_read (int): index of the last image read (0 if none)
+        return (list of DataArray, int): the images (in the user orientation),
+          and the index of the last image read
+        """
+        first, last = self.GetNumberNewImages()
+        if last < first:
+            return [], last_read
+        if first > last_read + 1:
+            logging.warning("Lost %d images, as the circular buffer was full",
+                            first - last_read - 1)
+
+        # All the images are read at once in the same buffer, which is reused
+        # for the next reads. Each image sent is a copy, so that keeping one
+        # image doesn't keep the whole buffer.
+        n = last - first + 1
+        npixels = size[0] * size[1]
+        buf = self._burst_buf
+        if buf is None or buf.shape[1:] != (size[1], size[0]) or buf.shape[0] < n:
+            buf = numpy.empty((n, size[1], size[0]), dtype=numpy.uint16)
+            self._burst_buf = buf
+        first, last = self.GetImages16(first, last,
+                                       buf.ctypes.data_as(POINTER(c_uint16)),
+                                       n * npixels)
+
+        arrays = []
+        for i in range(last - first + 1):
+            md = metadata.copy()
+            # The camera keeps the pace, so the date is based on the index
+            # (which starts at 1)
+            md[model.MD_ACQ_DATE] = tseries + (first + i - 1) * period
+            arrays.append(self._transposeDAToUser(model.DataArray(buf[i].copy(), md)))
+        return arrays, last
+
     def _acquire_thread_synchronized(self, callback):
         """
         The core of the acquisition thread. Runs until acquire_must_stop is set.
@@ -2340,6 +2492,12 @@ class FakeAndorV2DLL(object):
         self.acq_end = None
         self.acq_aborted = threading.Event()
 
+        # Circular buffer (in run till abort mode)
+        self.frametransfer = 0
+        self.circ_buffer_size = 64  # images
+        self.series_start = None  # time of the start of the first image
+        self.series_read = 0  # index of the last image read
+
     def Initialize(self, path):
         if not os.path.isdir(path):
             logging.warning("Trying to inialise simulator with an incorrect path: %s",
@@ -2382,8 +2540,13 @@ class FakeAndorV2DLL(object):
                          AndorCapabilities.FEATURES_MIDFANCONTROL |
                          AndorCapabilities.FEATURES_SHUTTER
                          )
+        caps.AcqModes = (AndorCapabilities.ACQMODE_SINGLE |
+                         AndorCapabilities.ACQMODE_VIDEO |
+                         AndorCapabilities.ACQMODE_FRAMETRANSFER
+                         )
         caps.CameraType = AndorCapabilities.CAMERATYPE_CLARA
-        caps.ReadModes = (AndorCapabilities.READMODE_SUBIMAGE
+        caps.ReadModes = (AndorCapabilities.READMODE_SUBIMAGE |
+                          AndorCapabilities.READMODE_FVB
                           )
 
     def GetCameraSerialNumber(self, p_serial):
@@ -2557,6 +2720,9 @@ class FakeAndorV2DLL(object):
         """
         self.acqmode = _val(mode)
 
+    def SetFrameTransferMode(self, mode):
+        self.frametransfer = _val(mode)
+
     def SetKineticCycleTime(self, t):
         self.kinetic = _val(t)
 
@@ -2568,9 +2734,17 @@ class FakeAndorV2DLL(object):
         self.binning = _val(binh), _val(binv)
         self.roi = (_val(h0), _val(hl), _val(v0), _val(vl))
 
+    def _getResolution(self):
+        """
+        return (2 ints): the size of the image read, for the current read mode
+        """
+        if self.readmode == AndorV2DLL.RM_FULL_VERTICAL_BINNING:
+            return self.shape[0], 1
+        return ((self.roi[1] - self.roi[0] + 1) // self.binning[0],
+                (self.roi[3] - self.roi[2] + 1) // self.binning[1])
+
     def _getReadout(self):
-        res = ((self.roi[1] - self.roi[0] + 1) // self.binning[0],
-               (self.roi[3] - self.roi[2] + 1) // self.binning[1])
+        res = self._getResolution()
         nb_pixels = res[0] * res[1]
         return self.pixelReadouts[self.hsspeed] * nb_pixels  # s
 
@@ -2584,6 +2758,10 @@ class FakeAndorV2DLL(object):
         kinetic.value = accumulate.value + self.kinetic
 
     def StartAcquisition(self):
+        if self.status != AndorV2DLL.DRV_ACQUIRING:
+            # New series (not just the next image in run till abort)
+            self.series_start = time.time()
+            self.series_read = 0
         self.status = AndorV2DLL.DRV_ACQUIRING
         duration = self.exposure + self._getReadout()
         self.acq_end = time.time() + duration
@@ -2627,15 +2805,57 @@ class FakeAndorV2DLL(object):
 
     def GetMostRecentImage16(self, cbuffer, size):
         p = cast(cbuffer, POINTER(c_uint16))
-        res = ((self.roi[1] - self.roi[0] + 1) // self.binning[0],
-               (self.roi[3] - self.roi[2] + 1) // self.binning[1])
+        res = self._getResolution()
         if res[0] * res[1] != size.value:
             raise ValueError("res %s != size %d" % (res, size.value))
-        # TODO: simulate binning by summing data and clipping
         ndbuffer = numpy.ctypeslib.as_array(p, (res[1], res[0]))
+        self._fillImage(ndbuffer)
+
+    def _fillImage(self, ndbuffer):
+        """
+        Copy the (fake) image corresponding to the current settings
+        ndbuffer (ndarray of shape (height, width)): where to copy the image
+        """
+        if self.readmode == AndorV2DLL.RM_FULL_VERTICAL_BINNING:
+            # Sum all the lines, and clip, like a real sensor
+            fvb = self._data.sum(axis=0, dtype=numpy.uint32)
+            ndbuffer[0] = numpy.minimum(fvb, 2 ** 16 - 1)
+            return
+
+        # TODO: simulate binning by summing data and clipping
         ndbuffer[...] = self._data[self.roi[2] - 1:self.roi[3]:self.binning[1],
                                    self.roi[0] - 1:self.roi[1]:self.binning[0]]
 
+    def GetNumberNewImages(self, p_first, p_last):
+        first = _deref(p_first, c_int32)
+        last = _deref(p_last, c_int32)
+        if self.status != AndorV2DLL.DRV_ACQUIRING:
+            raise AndorV2Error(20024, "No new data, simulated acquisition not running")
+
+        cycle = self.exposure + self._getReadout()
+        nimages = int((time.time() - self.series_start) / cycle)
+        if nimages <= self.series_read:
+            raise AndorV2Error(20024, "No new data, simulated acquisition still running")
+        first.value = max(self.series_read + 1, nimages - self.circ_buffer_size + 1)
+        last.value = nimages
+
+    def GetImages16(self, first, last, arr, size, p_validfirst, p_validlast):
+        validfirst = _deref(p_validfirst, c_int32)
+        validlast = _deref(p_validlast, c_int32)
+        first, last = _val(first), _val(last)
+        res = self._getResolution()
+        n = last - first + 1
+        if n * res[0] * res[1] != _val(size):
+            raise ValueError("%d images of res %s != size %d" % (n, res, _val(size)))
+
+        p = cast(arr, POINTER(c_uint16))
+        ndbuffer = numpy.ctypeslib.as_array(p, (n, res[1], res[0]))
+        for im in ndbuffer:
+            self._fillImage(im)
+        validfirst.value = first
+        validlast.value = last
+        self.series_read = max(self.series_read, last)
+
     def FreeInternalMemory(self):
         pass
 
@@ -77,6 +77,14 @@ PHR800LVMAX = 2400  # mV
 
 HOLDOFFMAX = 210480  # ns
 
+# T3 mode event records (cf ReadFiFo())
+T3_SPECIAL_CHAN = 0xf  # channel of the marker records
+T3_DTIME_MAX = 2 ** 12  # number of different start-stop times
+T3_WRAPAROUND = 2 ** 16  # sync counter overflow period
+
+# Number of records read at once (must be a multiple of 512)
+TTREAD_BLOCK = TTREADMAX // 2
+
 
 class PHError(Exception):
     def __init__(self, errno, strerror, *args, **kwargs):
@@ -206,8 +214,9 @@ class PH300(model.Detector):
 
         # TODO: metadata for indicating the range? cf WL_LIST?
 
-        # TODO: do we need TTTR mode?
+        # Histogram mode by default, and T3 mode for the continuous acquisition
         self.Initialise(MODE_HIST)
+        self._mode = MODE_HIST
         self._swVersion = self.GetLibraryVersion()
         self._metadata[model.MD_SW_VERSION] = self._swVersion
         mod, partnum, ver = self.GetHardwareInfo()
@@ -271,16 +280,18 @@ class PH300(model.Detector):
         self._setBinning(self.binning.value)
         self._setSyncOffset(self.syncOffset.value)
 
+        # If True, the measurement is not restarted for every dwell time, but
+        # keeps running (in T3 mode), and the histogram accumulated since the
+        # start of the acquisition is sent every refreshPeriod. So no count is
+        # lost between two histograms, and only the new events are transferred.
+        self.continuous = model.BooleanVA(False)
+        self.refreshPeriod = model.FloatContinuous(0.1, (0.01, 10), unit="s")
+
         # Wrapper for the dataflow
         self.data = BasicDataFlow(self)
-        # Note: Apparently, the hardware supports reading the data, while it's
-        # still accumulating (ie, the acquisition is still running).
-        # We don't support this feature for now, and if the user needs to see
-        # the data building up, it shouldn't be costly (in terms of overhead or
-        # noise) to just do multiple small acquisitions and do the accumulation
-        # in software.
-        # Alternatively, we could provide a second dataflow that sends the data
-        # while it's building up.
+        # Raw T3 records, as read from the device (1D array of uint32). It only
+        # receives data while .data is acquiring in continuous mode.
+        self.rawData = model.DataFlow()
 
         # Queue to control the acquisition thread:
         # * "S" to start
@@ -497,6 +508,14 @@ class PH300(model.Detector):
         self._dll.PH_GetHistogram(self._idx, buf_ct, block)
         return buf[:, :count]
 
+    def GetFlags(self):
+        """
+        return (int): the current status flags (bitfield of FLAG_*)
+        """
+        flags = c_int()
+        self._dll.PH_GetFlags(self._idx, byref(flags))
+        return flags.value
+
     def GetElapsedMeasTime(self):
         """
         return 0<=float: time since the measurement started (in s)
@@ -562,6 +581,26 @@ class PH300(model.Detector):
         self._metadata[model.MD_TIME_OFFSET] = offset
         return offset
 
+    def _setMode(self, mode):
+        """
+        Change the measurement mode of the device. As the initialisation resets
+        the device, all the settings are sent again.
+        Must not be called during a measurement.
+        mode (MODE_*): the new mode
+        """
+        if self._mode == mode:
+            return
+        logging.debug("Changing measurement mode to %d", mode)
+        self.Initialise(mode)
+        self._mode = mode
+        self.Calibrate()
+        self.SetSyncDiv(1)
+        self.SetOffset(0)
+        self.SetInputCFD(0, 100, 10)
+        self.SetInputCFD(1, 100, 10)
+        self._setBinning(self.binning.value)
+        self._setSyncOffset(self.syncOffset.value)
+
     # Acquisition methods
     def start_generate(self):
         self._genmsg.put("S")
@@ -637,58 +676,14 @@ class PH300(model.Detector):
 
                 # Keep acquiring
                 while True:
-                    tacq = self.dwellTime.value
-                    tstart = time.time()
-                    tend = tstart + tacq * 3 + 1  # Give a big margin for timeout
-
-                    # TODO: only allow to update the setting here (not during acq)
-                    md = self._metadata.copy()
-                    md[model.MD_ACQ_DATE] = tstart
-                    md[model.MD_DWELL_TIME] = tacq
-
-                    logging.debug("Starting new acquisition")
-                    # check if any message received before starting again
-                    if self._acq_should_stop():
-                        logging.debug("Acquisition stopped")
-                        break
-
-                    self.ClearHistMem()
-                    self.StartMeas(int(tacq * 1e3))
-
-                    # Wait for the acquisition to be done or until a stop or
-                    # terminate message comes
-                    must_stop = False
-                    try:
-                        now = tstart
-                        while now < tend:
-                            twait = max(1e-3, min((tend - now) / 2, tacq / 2))
-                            logging.debug("Waiting for %g s", twait)
-                            if self._acq_should_stop(twait):
-                                must_stop = True
-                                break
-
-                            # Is the data ready?
-                            if self.CTCStatus():
-                                logging.debug("acq still running")
-                                break
-                            now = time.time()
-                        else:
-                            logging.error("Acquisition timeout after %g s", tend - tstart)
-                            # TODO: try to reset the hardware?
-                            continue
-                    finally:
-                        # Must always be called, whether the measurement finished or not
-                        self.StopMeas()
-
+                    if self.continuous.value:
+                        must_stop = self._acquire_continuous()
+                    else:
+                        must_stop = self._acquire_histogram()
                     if must_stop:
                         logging.debug("Acquisition stopped")
                         break
 
-                    # Read data and pass it
-                    data = self.GetHistogram()
-                    da = model.DataArray(data, md)
-                    self.data.notify(da)
-
         except StopIteration:
             logging.debug("Acquisition thread requested to terminate")
         except Exception:
@@ -698,6 +693,122 @@ class PH300(model.Detector):
 
         logging.debug("Acquisition thread ended")
 
+    def _acquire_histogram(self):
+        """
+        Acquire one histogram, of the dwell time duration, and send it
+        return (bool): True if the acquisition must stop
+        raise StopIteration: if a terminate message was received
+        """
+        self._setMode(MODE_HIST)
+        tacq = self.dwellTime.value
+        tstart = time.time()
+        tend = tstart + tacq * 3 + 1  # Give a big margin for timeout
+
+        # TODO: only allow to update the setting here (not during acq)
+        md = self._metadata.copy()
+        md[model.MD_ACQ_DATE] = tstart
+        md[model.MD_DWELL_TIME] = tacq
+
+        logging.debug("Starting new acquisition")
+        # check if any message received before starting again
+        if self._acq_should_stop():
+            return True
+
+        self.ClearHistMem()
+        self.StartMeas(int(tacq * 1e3))
+
+        # Wait for the acquisition to be done or until a stop or
+        # terminate message comes
+        try:
+            now = tstart
+            while now < tend:
+                twait = max(1e-3, min((tend - now) / 2, tacq / 2))
+                logging.debug("Waiting for %g s", twait)
+                if self._acq_should_stop(twait):
+                    return True
+
+                # Is the data ready?
+                if self.CTCStatus():
+                    logging.debug("acq still running")
+                    break
+                now = time.time()
+            else:
+                logging.error("Acquisition timeout after %g s", tend - tstart)
+                # TODO: try to reset the hardware?
+                return False
+        finally:
+            # Must always be called, whether the measurement finished or not
+            self.StopMeas()
+
+        # Read data and pass it
+        data = self.GetHistogram()
+        da = model.DataArray(data, md)
+        self.data.notify(da)
+        return False
+
+    def _acquire_continuous(self):
+        """
+        Acquire in T3 mode, with the measurement running continuously, and send
+        every refreshPeriod the histogram accumulated since the start. The raw
+        records are also sent on .rawData as soon as they are read.
+        The histogram is computed from the start-stop time of the records, so
+        it contains at most T3_DTIME_MAX bins (the next ones are always 0).
+        return (bool): True if the acquisition must stop, False if it has to be
+          restarted (eg, the settings changed)
+        raise StopIteration: if a terminate message was received
+        """
+        if self._acq_should_stop():
+            return True
+
+        self._setMode(MODE_T3)
+        binning = self._curbin
+        hist = numpy.zeros((1, self.resolution.value[0]), dtype=numpy.uint32)
+        nbins = min(hist.shape[1], T3_DTIME_MAX)
+
+        tstart = time.time()
+        md = self._metadata.copy()
+        md[model.MD_ACQ_DATE] = tstart
+        rawmd = {model.MD_PIXEL_DUR: md[model.MD_PIXEL_DUR],
+                 model.MD_TIME_OFFSET: md[model.MD_TIME_OFFSET]}
+        tnext = tstart + self.refreshPeriod.value
+
+        logging.debug("Starting new continuous acquisition")
+        self.StartMeas(ACQTMAX)
+        try:
+            while True:
+                records = self.ReadFiFo(TTREAD_BLOCK)
+                now = time.time()
+                if records.size:
+                    hist[0, :nbins] += _t3_histogram(records)[:nbins]
+                    rawmd[model.MD_ACQ_DATE] = now
+                    self.rawData.notify(model.DataArray(records, rawmd.copy()))
+
+                if now >= tnext:
+                    md[model.MD_DWELL_TIME] = now - tstart
+                    self.data.notify(model.DataArray(hist.copy(), md.copy()))
+                    tnext = now + self.refreshPeriod.value
+
+                if not self.continuous.value or self._curbin != binning:
+                    return False
+
+                if records.size < TTREAD_BLOCK:
+                    # The FIFO is empty => check the state of the device, and
+                    # wait a little for new events (or a message)
+                    if self.GetFlags() & FLAG_FIFOFULL:
+                        logging.error("FIFO overrun, restarting acquisition")
+                        return False
+                    if self.CTCStatus():
+                        logging.info("Measurement reached the maximum time, restarting it")
+                        self.StopMeas()
+                        self.StartMeas(ACQTMAX)
+                    twait = min(max(1e-3, tnext - now), 10e-3)
+                else:
+                    twait = None
+                if self._acq_should_stop(twait):
+                    return True
+        finally:
+            self.StopMeas()
+
     @classmethod
     def scan(cls):
         """
@@ -722,6 +833,22 @@ class PH300(model.Detector):
         return dev
 
 
+def _t3_histogram(records):
+    """
+    Counts the photon events of T3 records, per start-stop time
+    records (ndarray of uint32): T3 records, as returned by ReadFiFo()
+    return (ndarray of uint32, shape T3_DTIME_MAX): number of events for each
+      start-stop time
+    """
+    # Photon records have channel 1 -> 4 (routing channel + 1), while the
+    # markers (including the sync counter overflows) have channel 15.
+    chan = records >> 28
+    dtime = (records[(chan >= 1) & (chan <= 4)] >> 16) & (T3_DTIME_MAX - 1)
+    counts = numpy.bincount(dtime.astype(numpy.intp), minlength=T3_DTIME_MAX)
+    # Same type as the histogram, to be able to add it in place
+    return counts.astype(numpy.uint32)
+
+
 class PH300RawDetector(model.Detector):
     """
     Represents a raw detector (eg, APD) accessed via PicoQuant PicoHarp 300.
@@ -838,6 +965,9 @@ class FakePHDLL(object):
         # start/ (expected) end time of the current acquisition (or None if not started)
         self._acq_start = None
         self._acq_end = None
+        # time up to which the events have been read (in T2/T3 modes)
+        self._last_read = None
+        self._evt_rate = 50000  # events/s in T2/T3 modes
 
     def PH_OpenDevice(self, i, sn_str):
         if i == self._idx:
@@ -909,10 +1039,12 @@ class FakePHDLL(object):
             raise PHError(-16, PHDLL.err_code[-16])
         self._acq_start = time.time()
         self._acq_end = self._acq_start + _val(tacq) * 1e-3
+        self._last_read = self._acq_start
 
     def PH_StopMeas(self, i):
         self._acq_start = None
         self._acq_end = None
+        self._last_read = None
 
     def PH_CTCStatus(self, i, p_ctcstatus):
         ctcstatus = _deref(p_ctcstatus, c_int)
@@ -942,3 +1074,32 @@ class FakePHDLL(object):
 
         # Old numpy doesn't support dtype argument for randint
         ndbuffer[...] = numpy.random.randint(0, maxval, n).astype(numpy.uint32)
+
+    def PH_GetFlags(self, i, p_flags):
+        flags = _deref(p_flags, c_int)
+        flags.value = 0
+
+    def PH_ReadFiFo(self, i, p_buffer, count, p_nactual):
+        nactual = _deref(p_nactual, c_int)
+        if self._mode not in (MODE_T2, MODE_T3) or self._last_read is None:
+            nactual.value = 0
+            return
+
+        # Generate the events which happened since the last read
+        now = min(self._acq_end, time.time())
+        n = min(_val(count), int((now - self._last_read) * self._evt_rate))
+        self._last_read += n / self._evt_rate
+
+        # Photons on channel 1, with an exponential decay of the start-stop
+        # time, followed by a sync counter overflow marker.
+        dtime = numpy.random.exponential(200, n).astype(numpy.uint32)
+        dtime = numpy.minimum(dtime, T3_DTIME_MAX - 1)
+        nsync = numpy.sort(numpy.random.randint(0, T3_WRAPAROUND, n)).astype(numpy.uint32)
+        records = (1 << 28) | (dtime << 16) | nsync
+        if n > 0:
+            records[-1] = T3_SPECIAL_CHAN << 28  # marker 0 = overflow
+
+        p = cast(p_buffer, POINTER(c_uint32))
+        ndbuffer = numpy.ctypeslib.as_array(p, (_val(count),))
+        ndbuffer[:n] = records
+        nactual.value = n
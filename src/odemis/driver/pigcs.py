@@ -734,15 +734,64 @@ class Controller(object):
         except IndexError:
             raise ValueError("Failed to parse answer from %s %d: '%s'" %
                              (com, axis, resp))
+        return self._convertValue(value_str)
+
+    @staticmethod
+    def _convertValue(value_str):
+        """
+        value_str (str): value as returned by the controller
+        returns (int or float or str): value converted depending on the type detected
+        """
         try:
-            value = int(value_str)
+            return int(value_str)
         except ValueError:
             try:
-                value = float(value_str)
+                return float(value_str)
             except ValueError:
-                value = value_str
+                return value_str
 
-        return value
+    def _parseAxesValue(self, com, resp, axes):
+        """
+        Parses the answer to a query with multiple axes
+        com (str): the command sent (only for the error messages)
+        resp (str or list of str): the answer, one line per axis
+        axes (set of int): the axes expected in the answer
+        returns (dict int -> int or float or str): axis -> value
+        """
+        if isinstance(resp, basestring):
+            resp = [resp]
+
+        values = {}
+        for l in resp:
+            try:
+                a, value_str = l.split("=")
+                values[int(a)] = self._convertValue(value_str)
+            except ValueError:
+                raise ValueError("Failed to parse answer from %s: '%s'" %
+                                 (com.encode('string_escape'), resp))
+
+        if set(values.keys()) != axes:
+            raise ValueError("Answer from %s has axes %s, while expected %s" %
+                             (com.encode('string_escape'), values.keys(), axes))
+        return values
+
+    def _readAxesValue(self, com, axes):
+        """
+        Returns the values for a command with multiple axes, in a single query.
+        Ex: POS? 1 2 -> 1=25.3 \n2=-0.2
+        com (str): the 4 letter command (including the ?)
+        axes (set of 1<int<16): axes number
+        returns (dict int -> int or float or str): axis -> value returned,
+          depending on the type detected
+        """
+        assert(axes and axes.issubset(self._channels))
+        assert(2 < len(com) < 8)
+        if com not in self._avail_cmds:
+            raise NotImplementedError("Command %s not supported by the controller" % (com,))
+
+        fullcom = "%s %s\n" % (com, " ".join("%d" % a for a in sorted(axes)))
+        resp = self._sendQueryCommand(fullcom)
+        return self._parseAxesValue(fullcom, resp, axes)
 
     def HasLimitSwitches(self, axis):
         """
@@ -863,6 +912,27 @@ class Controller(object):
         else:
             return self._readAxisValue("ONT?", axis) == 1
 
+    def GetOnTargetAxes(self, axes, check=True):
+        """
+        Report which of the given axes are on target, in a single query (for
+          closed-loop moves only)
+        axes (set of 1<int<16): axes number
+        returns (set of int): the axes on target
+        raise PIGCSError if check is True and an error on a controller happened
+        """
+        # ONT? (Get On Target State)
+        assert(axes and axes.issubset(self._channels))
+        com = "ONT? %s\n" % (" ".join("%d" % a for a in sorted(axes)),)
+        if check:
+            errs, resp = self._sendQueryCommand(["ERR?\n", com])
+            err = int(errs)
+            if err:
+                raise PIGCSError(err)
+        else:
+            resp = self._sendQueryCommand(com)
+        values = self._parseAxesValue(com, resp, axes)
+        return set(a for a, v in values.items() if v == 1)
+
     def GetErrorNum(self):
         """
         return (int): the error number (can be negative) of last error
@@ -1173,6 +1243,15 @@ class Controller(object):
         # POS? (GetRealPosition)
         return self._readAxisValue("POS?", axis)
 
+    def GetPositions(self, axes):
+        """
+        Get the position of multiple axes, in a single query (in "user" units)
+        axes (set of 1<int<16): axes number
+        return (dict int -> float): axis -> position
+        """
+        # POS? (GetRealPosition)
+        return self._readAxesValue("POS?", axes)
+
     def GetTargetPosition(self, axis):
         """
         Get the target position (in "user" units)
@@ -1460,6 +1539,14 @@ class Controller(object):
 
         return self._interpolatePosition(axis)
 
+    def getPositions(self, axes):
+        """
+        axes (set of int): the axes
+        return (dict int -> float): the current position of each given axis
+        """
+        # Controllers reading the sensor override it to use a single query
+        return {a: self.getPosition(a) for a in axes}
+
     def setSpeed(self, axis, speed):
         """
         Changes the move speed of the motor (for the next move).
@@ -1520,6 +1607,21 @@ class Controller(object):
         # takes more characters and for CL, we need a more clever code anyway
         return not axes.isdisjoint(self.GetMotionStatus())
 
+    def getMovingAxes(self, axes=None):
+        """
+        Indicate which of the motors are moving.
+        axes (None or set of int): axes to check whether for move, or all if None
+        return (set of int): the axes which are moving
+        raise PIGCSError if an error on a controller happened
+        """
+        if axes is None:
+            axes = self._channels
+        else:
+            assert axes.issubset(self._channels)
+
+        # Controllers which can report all the axes at once override it
+        return set(a for a in axes if self.isMoving({a}))
+
     def stopMotion(self):
         """
         Stop the motion on all axes immediately
@@ -1749,6 +1851,30 @@ class CLAbsController(Controller):
         self._lastpos[axis] = (pos, time.time())
         return pos
 
+    def getPositions(self, axes, maxage=0):
+        """
+        Find current position of multiple axes, reading all the ones not cached
+          in a single query.
+        axes (set of int)
+        maxage (0 < float): see getPosition()
+        return (dict int -> float): the current position of each given axis
+        """
+        pos = {}
+        if maxage > 0:
+            now = time.time()
+            for a in axes:
+                p, ts = self._lastpos[a]
+                if now - ts < maxage:
+                    pos[a] = p
+
+        toread = set(axes) - set(pos.keys())
+        if toread:
+            tread = time.time()
+            for a, p in self.GetPositions(toread).items():
+                pos[a] = p * self._upm[a]
+                self._lastpos[a] = (pos[a], tread)
+        return pos
+
     def isMoving(self, axes=None):
         """
         Indicate whether the motors are moving (ie, last requested move is over)
@@ -1756,6 +1882,12 @@ class CLAbsController(Controller):
         return (boolean): True if at least one of the axes is moving, False otherwise
         raise PIGCSError: if there is an error with the controller
         """
+        return bool(self.getMovingAxes(axes))
+
+    def getMovingAxes(self, axes=None):
+        """
+        See Controller.getMovingAxes
+        """
         if axes is None:
             axes = set(self._upm.keys())
         else:
@@ -1764,11 +1896,7 @@ class CLAbsController(Controller):
         # With servo on, it might constantly be _slightly_ moving (around the
         # target), so it's much better to use IsOnTarget info. The controller
         # needs to be correctly configured with the right window size.
-        for a in axes:
-            if not self.IsOnTarget(a):
-                return True
-
-        return False
+        return axes - self.GetOnTargetAxes(axes)
 
     # TODO allow to reference, but need to get multiple axes, and to check the
     # status, isMoving() cannot be used, but just GetMotionStatus()
@@ -2229,6 +2357,21 @@ class CLRelController(Controller):
         with self._pos_lock[axis]:
             return self.GetPosition(axis) * self._upm[axis]
 
+    def getPositions(self, axes):
+        """
+        Find current position of multiple axes, in a single query
+        return (dict int -> float): the current position of each given axis
+        """
+        # Always take the locks in the same order, to avoid dead-locks
+        locks = [self._pos_lock[a] for a in sorted(axes)]
+        for l in locks:
+            l.acquire()
+        try:
+            return {a: p * self._upm[a] for a, p in self.GetPositions(axes).items()}
+        finally:
+            for l in reversed(locks):
+                l.release()
+
     def getTargetPosition(self, axis):
         return self.GetTargetPosition(axis) * self._upm[axis]
 
@@ -2241,6 +2384,12 @@ class CLRelController(Controller):
         return (boolean): True if at least one of the axes is moving, False otherwise
         raise PIGCSError: if there is an error with the controller
         """
+        return bool(self.getMovingAxes(axes))
+
+    def getMovingAxes(self, axes=None):
+        """
+        See Controller.getMovingAxes
+        """
         if axes is None:
             axes = self._channels
         else:
@@ -2249,19 +2398,17 @@ class CLRelController(Controller):
         # With servo on, it might constantly be _slightly_ moving (around the
         # target), so it's much better to use IsOnTarget info. The controller
         # needs to be correctly configured with the right window size.
-        for a in axes:
-            # A merge of the query with error check causes a long delay (~40 ms)
-            # in the answer
-            if not self.IsOnTarget(a, check=False):
-                return True
+        # A merge of the query with error check causes a long delay (~40 ms)
+        # in the answer
+        moving = axes - self.GetOnTargetAxes(axes, check=False)
 
-        # Nothing is moving => turn off encoder (in a few seconds)
-        for a in axes:
-            # Note: this will also turn off the servo, which leads to relax mode
-            if self._auto_suspend:
+        # Not moving => turn off encoder (in a few seconds)
+        if self._auto_suspend:
+            for a in axes - moving:
+                # Note: this will also turn off the servo, which leads to relax mode
                 self._releaseAxis(a, self._auto_suspend)  # release in 10 s (5x the cost to start)
 
-        return False
+        return moving
 
 
         # TODO: handle the fact that if the stage reaches the physical limit without knowing,
@@ -2483,6 +2630,18 @@ class OLController(Controller):
 
     # TODO: call RelaxPiezos after the end of a move
 
+    def getMovingAxes(self, axes=None):
+        """
+        See Controller.getMovingAxes
+        """
+        if axes is None:
+            axes = self._channels
+        else:
+            assert axes.issubset(self._channels)
+
+        # The motion status contains all the axes at once
+        return axes & self.GetMotionStatus()
+
     def stopMotion(self):
         super(OLController, self).stopMotion()
         for c in self._channels:
@@ -2804,6 +2963,11 @@ class Bus(model.Actuator):
         # interfere with each other
         self._axis_moving_lock = threading.Lock()
 
+        # To be hold while reading the position, so that concurrent requests
+        # are coalesced into a single reading (cf _updatePosition())
+        self._pos_read_lock = threading.Lock()
+        self._pos_read_ts = {}  # axis name -> time the last position reading started
+
         # TODO: allow to override the unit (per axis)
         # RO, as to modify it the client must use .moveRel() or .moveAbs()
         self.position = model.VigilantAttribute({}, unit="m", readonly=True)
@@ -2844,28 +3008,58 @@ class Bus(model.Actuator):
         # will take care of executing axis move asynchronously
         self._executor = CancellableThreadPoolExecutor(max_workers=1) # one task at a time
 
-    def _updatePosition(self, axes=None):
+    def _axesPerController(self, axes):
+        """
+        Group axes by controller, so that they can be queried together
+        axes (set of str): axes names
+        return (dict Controller -> (dict int -> str)): controller -> channel -> axis name
+        """
+        ctrl_axes = {}
+        for an in axes:
+            controller, channel = self._axis_to_cc[an]
+            ctrl_axes.setdefault(controller, {})[channel] = an
+        return ctrl_axes
+
+    def _updatePosition(self, axes=None, maxage=0):
         """
         update the position VA
         axes (None or set of str): the axes to update (None indicates all of them)
+        maxage (0<=float): the axes whose position was read less than this
+          time (in s) ago are not read again.
+        Note: concurrent calls are coalesced, an axis whose reading has started
+          after this call is not read again.
         """
+        treq = time.time()
         if axes is None:
-            pos = {}
-        else:
-            pos = self.position._value.copy()
+            axes = set(self._axis_to_cc.keys())
 
-        npos = {}
-        for a, (controller, channel) in self._axis_to_cc.items():
-            if axes is None or a in axes:
+        with self._pos_read_lock:
+            tmin = treq - maxage
+            toread = set(an for an in axes if self._pos_read_ts.get(an, 0) < tmin)
+            if not toread:
+                logging.debug("Position of axes %s already up to date", axes)
+                return
+
+            npos = {}
+            # All the channels of the same controller are read in one query
+            for controller, ch_to_axis in self._axesPerController(toread).items():
+                tread = time.time()
                 try:
-                    npos[a] = controller.getPosition(channel)
+                    cpos = controller.getPositions(set(ch_to_axis.keys()))
                 except PIGCSError:
-                    logging.warning("Failed to update position of axis %s", a, exc_info=True)
+                    logging.warning("Failed to update position of axes %s",
+                                    ch_to_axis.values(), exc_info=True)
+                    continue
+                for c, p in cpos.items():
+                    an = ch_to_axis[c]
+                    npos[an] = p
+                    self._pos_read_ts[an] = tread
 
-        pos.update(self._applyInversion(npos))
-        logging.debug("Reporting new position at %s", pos)
+            pos = self.position._value.copy()
+            pos.update(self._applyInversion(npos))
+            logging.debug("Reporting new position at %s", pos)
 
-        self.position._set_value(pos, force_write=True)
+            self.position._set_value(pos, force_write=True)
 
     def _refreshPosition(self):
         """
@@ -2887,7 +3081,8 @@ class Bus(model.Actuator):
 
                 with self._axis_moving_lock:
                     logging.debug("Will refresh position of axes %s", self._cl_axes)
-                    self._updatePosition(self._cl_axes)
+                    # The axes which just finished moving have already been read
+                    self._updatePosition(self._cl_axes, maxage=1)
 
                 self._pos_needs_update.clear()
         except Exception:
@@ -2920,6 +3115,7 @@ class Bus(model.Actuator):
         f._moving_lock = threading.Lock()  # taken while moving
         f._must_stop = threading.Event()  # cancel of the current future requested
         f._was_stopped = False  # if cancel was successful
+        f._move_axes = axes  # axes moved
 
         f._update_axes = set()  # axes handled by the move, if update
         if update:
@@ -3084,6 +3280,7 @@ class Bus(model.Actuator):
         moving_axes = set(axes)
 
         need_pos_update = True
+        pipelined = False  # True if the next move takes over
 
         last_upd = time.time()
         dur = max(0.01, min(end - last_upd, 60))
@@ -3103,11 +3300,12 @@ class Bus(model.Actuator):
                     logging.debug("Ending move control early as next move is an update containing %s", moving_axes)
                     return
 
-                for an in moving_axes.copy():  # need copy to remove during iteration
-                    controller, channel = self._axis_to_cc[an]
-                    # TODO: change isMoving to report separate info on multiple channels
-                    if not controller.isMoving({channel}):
-                        moving_axes.discard(an)
+                # All the channels of the same controller are checked in one go
+                for controller, ch_to_axis in self._axesPerController(moving_axes).items():
+                    moving_chs = controller.getMovingAxes(set(ch_to_axis.keys()))
+                    for c, an in ch_to_axis.items():
+                        if c not in moving_chs:
+                            moving_axes.discard(an)
                 if not moving_axes:
                     # no more axes to wait for
                     break
@@ -3140,15 +3338,41 @@ class Bus(model.Actuator):
                     controller.stopMotion()
                 future._was_stopped = True
                 raise CancelledError()
+
+            # If the next move is already queued on all these axes (eg, it's
+            # the next point of a trajectory), it will update the position
+            # anyway => start it immediately.
+            nf = self._executor.get_next_future(future)
+            if nf is not None and set(axes) <= nf._move_axes:
+                logging.debug("Skipping position update as next move continues on %s", axes)
+                pipelined = True
+                # If it's cancelled before starting, it will not update it
+                nf.add_done_callback(lambda f, axes=set(axes): self._onPipelinedMoveDone(f, axes))
         except Exception:
             raise
         finally:
-            if need_pos_update:
+            if need_pos_update and not pipelined:
                 # Position update takes quite some time, which increases latency for
                 # the caller to know the move is done => only update the last axes
                 # moving (and don't notify the VA) and update the rest of axes in a
                 # separate thread
                 self._updatePosition(last_axes)
+            if not pipelined:
+                # The refresher would block the next move while reading
+                self._pos_needs_update.set()
+
+    def _onPipelinedMoveDone(self, future, axes):
+        """
+        Called when a move which followed directly another move is over.
+        Updates the position if it was cancelled before starting, as then
+        nothing read the position at the end of the previous move.
+        future (Future): the future of the move which followed
+        axes (set of str): the axes moved by the previous move
+        """
+        if future.cancelled() and not future._was_stopped:
+            logging.debug("Pipelined move cancelled before starting, updating position of %s", axes)
+            with self._axis_moving_lock:
+                self._updatePosition(axes)
             self._pos_needs_update.set()
 
     def _cancelCurrentMove(self, future):
@@ -3765,6 +3989,9 @@ class E861Simulator(object):
         self._output_buf = "" # what the commands sends back to the "host computer"
         self._input_buf = "" # what we receive from the "host computer"
 
+        # Number of commands processed, to measure the load on the bus
+        self.com_count = 0
+
         # special trick to only answer if baudrate is correct
         if baudrate != 38400:
             logging.debug("Baudrate incompatible: %d", baudrate)
@@ -3895,6 +4122,7 @@ class E861Simulator(object):
             return
         logging.debug("Fake controller %d processing command '%s'",
                       self._address, com.encode('string_escape'))
+        self.com_count += 1
 
         com = m.group("com") # also removes the \n at the end if it's there
         # split into arguments separated by spaces (not including empty strings)
@@ -4065,9 +4293,10 @@ class E861Simulator(object):
                 if axis != 1:
                     raise SimulatedError(15)
                 self._position = pos
-            elif args[0] == "POS?" and len(args) == 2: # Closed-Loop position query
-                axis = int(args[1])
-                if axis != 1:
+            elif args[0] == "POS?" and len(args) >= 1:  # Closed-Loop position query
+                # Only one axis, which is the default when no axis is given
+                args[1:] = args[1:] or ["1"]
+                if any(int(a) != 1 for a in args[1:]):
                     raise SimulatedError(15)
 #                 if 0 == random.randint(0, 20):  # To test with issue about generated garbage
 #                     self._output_buf += "\n\x8a\xea\x82r\x82\xa2\x9a\xa2\xca\x8a\n"
@@ -4078,9 +4307,9 @@ class E861Simulator(object):
                 if axis != 1:
                     raise SimulatedError(15)
                 out = "%s=%s" % (args[1], self._target)
-            elif args[0] == "ONT?" and len(args) == 2: # on target
-                axis = int(args[1])
-                if axis != 1:
+            elif args[0] == "ONT?" and len(args) >= 1:  # on target
+                args[1:] = args[1:] or ["1"]
+                if any(int(a) != 1 for a in args[1:]):
                     raise SimulatedError(15)
                 ont = time.time() > self._end_move
                 out = "%s=%d" % (args[1], 1 if ont else 0)
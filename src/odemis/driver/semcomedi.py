@@ -109,6 +109,9 @@ NI_AO_TRIG_AI_START1 = 19  # Trigger number for AI Start1 (= beginning of a comm
 ACQ_CMD_UPD = 1
 ACQ_CMD_TERM = 2
 
+# Number of samples read at once, when decimating while reading
+DECIMATION_CHUNK_SIZE = 2 ** 16
+
 # helper functions
 def get_best_dtype_for_acc(idtype, count):
     """
@@ -130,6 +133,84 @@ def get_best_dtype_for_acc(idtype, count):
     return adtype
 
 
+class LinesDecimator(object):
+    """
+    Decimates (averages the over-sampled values) the raw data of a line scan
+    while it is being read, directly into the output images. That avoids
+    holding the complete raw data, which is osr times bigger than the images.
+    The raw data is expected in the order it is acquired: for each pixel of
+    each line (margin included), osr samples of every channel.
+    """
+
+    def __init__(self, shape, margin, osr, x, lines, oarrays, adtype):
+        """
+        shape (2-tuple int): H,W dimension of the scanned image (margin not included)
+        margin (int): amount of useless pixels at the beginning of each line
+        osr (int): over-sampling rate
+        x (int): position of the first line to write in the output arrays
+        lines (0 < int): number of lines which will be fed
+        oarrays (list of 2D ndarray): the output array of each channel, already
+          allocated, of shape "shape"
+        adtype (dtype): intermediary type to use for the accumulator
+        """
+        self._width = shape[1] + margin  # number of pixels per line
+        self._margin = margin
+        self._osr = osr
+        self._x = x
+        self._oarrays = oarrays
+        self._adtype = adtype
+        self._nchans = len(oarrays)
+        self._pxlen = osr * self._nchans  # number of samples per pixel
+        self._npixels = lines * self._width
+        self._pos = 0  # index of the next pixel to decimate
+        self._leftover = None  # samples of an incomplete pixel
+
+    @property
+    def done(self):
+        """
+        True if all the pixels have been received
+        """
+        return self._pos >= self._npixels
+
+    def feed(self, data):
+        """
+        Decimate a new chunk of raw data. Any data received after the last pixel
+          (eg, the rest position) is discarded.
+        data (1D ndarray): the raw data, following the previous chunk
+        """
+        if self._leftover is not None:
+            data = numpy.concatenate((self._leftover, data))
+            self._leftover = None
+
+        npx = min(data.size // self._pxlen, self._npixels - self._pos)
+        end = npx * self._pxlen
+        if self._pos + npx < self._npixels and end < data.size:
+            # copy, so that the (big) chunk is not kept in memory
+            self._leftover = data[end:].copy()
+        if npx <= 0:
+            return
+
+        rect = data[:end].reshape(npx, self._osr, self._nchans)
+        if self._osr == 1:
+            # only one sample per pixel => copy
+            vals = rect[:, 0, :]
+        else:
+            acc = umath.add.reduce(rect, axis=1, dtype=self._adtype)
+            vals = umath.true_divide(acc, self._osr)
+
+        # find the position of each pixel in the output, and drop the margin
+        idx = numpy.arange(self._pos, self._pos + npx)
+        rows = idx // self._width + self._x
+        cols = idx % self._width - self._margin
+        inside = cols >= 0
+        rows, cols = rows[inside], cols[inside]
+        for i, oa in enumerate(self._oarrays):
+            # cast "unsafe", like true_divide(..., casting='unsafe')
+            oa[rows, cols] = vals[inside, i]
+
+        self._pos += npx
+
+
 def _get_linux_version():
     """
     return (tuple of 3 int): major, minor, micro
@@ -951,7 +1032,8 @@ class SEMComedi(model.HwComponent):
         comedi.command(self._device, cmd)
 
     def write_read_2d_data_raw(self, wchannels, wranges, rchannels, rranges,
-                               period, margin, osr, dpr, data):
+                               period, margin, osr, dpr, data,
+                               partial_cb=None, partial_period=0):
         """
         write data on the given analog output channels and read synchronously on
          the given analog input channels and convert back to 2d array
@@ -967,6 +1049,11 @@ class SEMComedi(model.HwComponent):
         data (3D numpy.ndarray of int): array to write (raw values)
           first dimension is along the slow axis, second is along the fast axis,
           third is along the channels
+        partial_cb (None or callable (list of 2D numpy.array, int) -> None):
+          called every time new complete lines have been read, with the
+          (partially filled) output buffers and the number of complete lines.
+        partial_period (0 <= float): if partial_cb is used, the maximum time
+          (in s) between two calls.
         return (list of 2D numpy.array with shape=(data.shape[0], data.shape[1]-margin)
          and dtype=device type): the data read (raw) for each channel, after
          decimation.
@@ -987,8 +1074,13 @@ class SEMComedi(model.HwComponent):
         linesz = data.shape[1] * nrchans * osr * self._reader.dtype.itemsize
         if linesz < self._max_bufsz and not force_per_pixel:
             lines = self._max_bufsz // linesz
+            if partial_cb and partial_period:
+                # read small enough blocks to be able to report often enough
+                line_dur = data.shape[1] * period
+                lines = min(lines, max(1, int(partial_period / line_dur)))
             return self._write_read_2d_lines(wchannels, wranges, rchannels, rranges,
-                                             period, margin, osr, lines, data)
+                                             period, margin, osr, lines, data,
+                                             partial_cb)
 
         # fit a pixel
         max_dpr = (self._max_bufsz / self._reader.dtype.itemsize) // osr
@@ -1001,7 +1093,8 @@ class SEMComedi(model.HwComponent):
                               "<= %d", pixelsz / 2 ** 20, dpr, max_dpr)
 
             return self._write_read_2d_pixel(wchannels, wranges, rchannels, rranges,
-                                             period, margin, osr, dpr, data)
+                                             period, margin, osr, dpr, data,
+                                             partial_cb)
 
         # separate each pixel into #dpr acquisitions
         pixelsz = nrchans * osr * self._reader.dtype.itemsize
@@ -1012,10 +1105,11 @@ class SEMComedi(model.HwComponent):
                           pixelsz / 2 ** 20, osr, dpr)
 
         return self._write_read_2d_subpixel(wchannels, wranges, rchannels, rranges,
-                                            period, margin, osr, dpr, data)
+                                            period, margin, osr, dpr, data,
+                                            partial_cb)
 
     def _write_read_2d_lines(self, wchannels, wranges, rchannels, rranges,
-                             period, margin, osr, maxlines, data):
+                             period, margin, osr, maxlines, data, partial_cb=None):
         """
         Implementation of write_read_2d_data_raw by reading the input data n
           lines at a time.
@@ -1046,46 +1140,23 @@ class SEMComedi(model.HwComponent):
             wdata = data[x:x + lines, :, :] # just a couple of lines
             wdata = wdata.reshape(-1, wdata.shape[2]) # flatten X/Y
             islast = (x + lines >= data.shape[0])
-            rbuf = self._write_read_raw_one_cmd(wchannels, wranges, rchannels,
+            # decimate into each buffer, while reading
+            decimator = LinesDecimator(rshape, margin, osr, x, lines, buf, adtype)
+            self._write_read_raw_one_cmd(wchannels, wranges, rchannels,
                                     rranges, period, osr, wdata, margin,
-                                    rest=(islast and self._scanner.fast_park))
-
-            # decimate into each buffer
-            for i, b in enumerate(buf):
-                self._scan_raw_to_lines(rshape, margin, osr, x,
-                                        rbuf[..., i], b[x:x + lines, ...], adtype)
+                                    rest=(islast and self._scanner.fast_park),
+                                    decimator=decimator)
+            if not decimator.done:
+                raise IOError("Decimated only part of the %d lines" % (lines,))
 
             x += lines
+            if partial_cb and not islast:
+                partial_cb(buf, x)
 
         return buf
 
-    @staticmethod
-    def _scan_raw_to_lines(shape, margin, osr, x, data, oarray, adtype):
-        """
-        Converts a linear array resulting from a scan with oversampling to a 2D array
-        shape (2-tuple int): H,W dimension of the scanned image (margin not included)
-        margin (int): amount of useless pixels at the beginning of each line
-        osr (int): over-sampling rate
-        x (int): x position of the line in the output array
-        data (1D ndarray): the raw linear array (including oversampling), of one channel
-        oarray (2D ndarray): the output array, already allocated, of shape self.shape
-        adtype (dtype): intermediary type to use for the accumulator
-        """
-        # reshape to a 3D array with margin and sub-samples
-        rectangle = data.reshape((-1, shape[1] + margin, osr))
-        # trim margin
-        tr_rect = rectangle[:, margin:, :]
-        if osr == 1:
-            # only one sample per pixel => copy
-            oarray[...] = tr_rect[:, :, 0]
-        else:
-            # inspired by _mean() from numpy, but save the accumulated value in
-            # a separate array of a big enough dtype.
-            acc = umath.add.reduce(tr_rect, axis=2, dtype=adtype)
-            umath.true_divide(acc, osr, out=oarray, casting='unsafe', subok=False)
-
     def _write_read_2d_pixel(self, wchannels, wranges, rchannels, rranges,
-                             period, margin, osr, dpr, data):
+                             period, margin, osr, dpr, data, partial_cb=None):
         """
         Implementation of write_read_2d_data_raw by reading the input data one
           pixel at a time.
@@ -1119,10 +1190,13 @@ class SEMComedi(model.HwComponent):
             for i, b in enumerate(buf):
                 self._scan_raw_to_pixel(rshape, margin, osr, dpr, x, y,
                                         rbuf[..., i], b, adtype)
+
+            if partial_cb and y == data.shape[1] - 1 and x < data.shape[0] - 1:
+                partial_cb(buf, x + 1)
         return buf
 
     def _write_read_2d_subpixel(self, wchannels, wranges, rchannels, rranges,
-                                period, margin, osr, dpr, data):
+                                period, margin, osr, dpr, data, partial_cb=None):
         """
         Implementation of write_read_2d_data_raw by reading the input data one
          part of a pixel at a time.
@@ -1162,6 +1236,9 @@ class SEMComedi(model.HwComponent):
                 self._scan_raw_to_pixel(rshape, margin, 1, dpr, x, y,
                                         px_rbuf[..., i], b, adtype)
 
+            if partial_cb and y == data.shape[1] - 1 and x < data.shape[0] - 1:
+                partial_cb(buf, x + 1)
+
         return buf
 
     @staticmethod
@@ -1182,7 +1259,8 @@ class SEMComedi(model.HwComponent):
         oarray[x, y - margin] = numpy.sum(data, dtype=adtype) / (osr * dpr)
 
     def _fake_write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
-                                     period, osr, data, settling_samples, rest=False):
+                                     period, osr, data, settling_samples, rest=False,
+                                     decimator=None):
         """
         Imitates _write_read_raw_one_cmd() but works with the comedi_test driver,
           just read data.
@@ -1220,7 +1298,7 @@ class SEMComedi(model.HwComponent):
             self._writer.prepare(wbuf, expected_time)
 
             # prepare read buffer info
-            self._reader.prepare(nrscans * nrchans, expected_time)
+            self._reader.prepare(nrscans * nrchans, expected_time, decimator)
 
         # FIXME: some times, after many fine acquisitions, this command fails
         # with "ComediError: returned -1 -> (16) Device or resource busy"
@@ -1248,15 +1326,18 @@ class SEMComedi(model.HwComponent):
         logging.debug("Waiting %g s for the acquisition to finish", timeout)
         rbuf = self._reader.wait(timeout)
         self._writer.wait(0.1)
+        logging.debug("acquisition took %g s, init=%g s", time.time() - begin, start - begin)
+        if decimator:
+            return None  # data already passed to the decimator
         # reshape to 2D
         rbuf.shape = (nrscans, nrchans)
         if rest:
             rbuf = rbuf[:-osr, :] # remove data read during rest positioning
-        logging.debug("acquisition took %g s, init=%g s", time.time() - begin, start - begin)
         return rbuf
 
     def _write_read_raw_one_cmd(self, wchannels, wranges, rchannels, rranges,
-                                period, osr, data, settling_samples, rest=False):
+                                period, osr, data, settling_samples, rest=False,
+                                decimator=None):
         """
         write data on the given analog output channels and read synchronously
           on the given analog input channels in one command
@@ -1273,9 +1354,11 @@ class SEMComedi(model.HwComponent):
         settling_samples (int): number of first write samples used for the
           settling of the beam, and so don't need to trigger newPosition
         rest (boolean): if True, will add one more write to set to rest position
-        return (2D numpy.array with dtype=device type)
+        decimator (None or LinesDecimator): if provided, the data read is passed
+          to it while being read, instead of being returned.
+        return (2D numpy.array with dtype=device type or None)
             the raw data read (first dimension is data.shape[0] * osr) for each
-            channel (as second dimension).
+            channel (as second dimension). None if decimator is provided.
         raises:
             IOError: in case of timeout or cancellation
         """
@@ -1308,7 +1391,7 @@ class SEMComedi(model.HwComponent):
             self.setup_timed_command(self._ai_subdevice, rchannels, rranges,
                                      rperiod_ns, stop_arg=nrscans, aref=comedi.AREF_DIFF)
             # prepare to read
-            self._reader.prepare(nrscans * nrchans, expected_time)
+            self._reader.prepare(nrscans * nrchans, expected_time, decimator)
 
             # create a command for writing
             # HACK WARNING:
@@ -1362,6 +1445,8 @@ class SEMComedi(model.HwComponent):
         rbuf = self._reader.wait(timeout)
         if nwscans != 1:
             self._writer.wait() # writer is faster, so there should be no wait
+        if decimator:
+            return None  # data already passed to the decimator
         # reshape to 2D
         rbuf.shape = (nrscans, nrchans)
         if rest:
@@ -1801,12 +1886,24 @@ class SEMComedi(model.HwComponent):
         for dmdi, mdi in zip(dmd, md):
             mdi.update(dmdi)
 
+        # If requested, send the partially scanned frames from time to time
+        partial_cb = None
+        pperiod = self._scanner.partialFramePeriod.value
+        if 0 < pperiod < scan.shape[0] * scan.shape[1] * period:
+            last_notify = [time.time()]  # in python2 we need a container object
+
+            def partial_cb(bufs, nlines):
+                now = time.time()
+                if now - last_notify[0] >= pperiod:
+                    last_notify[0] = now
+                    self._notify_partial_frames(detectors, bufs, md, nlines)
+
         # write and read the raw data
         rbuf = self.write_read_2d_data_raw(wchannels, wranges, rchannels,
-                            rranges, period, margin, osr, dpr, scan)
+                            rranges, period, margin, osr, dpr, scan,
+                            partial_cb, pperiod)
 
         # logging.debug("Converting raw data to physical: %s", rbuf)
-        # TODO decimate/convert the data while reading, to save time, or do not convert at all
         # TODO: fast way to convert to physical values (and if possible keep
         # integers as output
         # converting to physical value would look a bit like this:
@@ -1821,6 +1918,27 @@ class SEMComedi(model.HwComponent):
 
         return rdas
 
+    def _notify_partial_frames(self, detectors, bufs, md, nlines):
+        """
+        Sends the frames being acquired to the detectors
+        detectors (AnalogDetectors)
+        bufs (list of 2D numpy.array): the (partially filled) raw data of each
+          detector
+        md (list of dict): the metadata of each detector
+        nlines (0 < int): number of lines already acquired
+        """
+        for d, b, mdi in zip(detectors, bufs, md):
+            pmd = mdi.copy()
+            pmd[model.MD_VALID_ROWS] = nlines
+            # The buffer is still being filled, so send a copy of the lines
+            # acquired, and the rest is just black
+            pb = numpy.zeros_like(b)
+            pb[:nlines] = b[:nlines]
+            da = model.DataArray(pb, pmd)
+            if d.inverted:
+                da = (d.shape[0] - 1) - da
+            d.data.notify(da)
+
     def _acquire_counting_detector(self, detectors):
         """
         Run the acquisition for one counting detector (and the other detectors
@@ -2064,16 +2182,22 @@ class Reader(Accesser):
         self.dtype = parent._get_dtype(self._subdevice)
         self.buf = None
         self.count = None
+        self.decimator = None
+        self.nread = 0
         self._lock = threading.Lock()
 
-    def prepare(self, count, duration):
+    def prepare(self, count, duration, decimator=None):
         """
         count: number of values to read
         duration: expected total duration it will take (in s)
+        decimator (None or LinesDecimator): if provided, the data is passed to
+          it, chunk by chunk, while it's read, instead of being stored in .buf
         """
         with self._lock:
             self.count = count
             self.duration = duration
+            self.decimator = decimator
+            self.nread = 0
             self.cancelled = False
             if self.thread and self.thread.isAlive():
                 logging.warning("Preparing a new acquisition while previous one is not over")
@@ -2090,7 +2214,10 @@ class Reader(Accesser):
     def _thread(self):
         """To be called in a separate thread"""
         try:
-            self.buf = numpy.fromfile(self.file, dtype=self.dtype, count=self.count)
+            if self.decimator:
+                self._read_decimate()
+            else:
+                self.buf = numpy.fromfile(self.file, dtype=self.dtype, count=self.count)
             logging.debug("read took %g s", time.time() - self._begin)
             # Kernel 4.4+ requires to cancel reading (it's also possible to try
             # to read further and get a EOF, but if the device has extra data,
@@ -2102,6 +2229,18 @@ class Reader(Accesser):
         except:
             logging.exception("Unhandled error in reading thread")
 
+    def _read_decimate(self):
+        """
+        Read the data by chunks, and pass each of them to the decimator
+        """
+        while self.nread < self.count:
+            n = min(self.count - self.nread, DECIMATION_CHUNK_SIZE)
+            chunk = numpy.fromfile(self.file, dtype=self.dtype, count=n)
+            if chunk.size == 0:
+                break
+            self.decimator.feed(chunk)
+            self.nread += chunk.size
+
     def wait(self, timeout=None):
         """
         timeout (float): maximum number of seconds to wait for the read to finish
@@ -2120,6 +2259,11 @@ class Reader(Accesser):
             logging.warning("Reading thread is still running after %g s", timeout)
             self.cancel()
 
+        if self.decimator:
+            if self.nread != self.count:
+                raise IOError("Read only %d values from the %d expected" % (self.nread, self.count))
+            return None
+
         # the result should be in self.buf
         if self.buf is None:
             raise IOError("Failed to read all the %d expected values" % self.count)
@@ -2262,12 +2406,17 @@ class MMapReader(Reader):
     def close(self):
         Reader.close(self)
 
-    def prepare(self, count, duration):
+    def prepare(self, count, duration, decimator=None):
         with self._lock:
             self.count = count
             self.duration = duration
-            self.buf = numpy.empty(count, dtype=self.dtype)
-            self.remaining = self.buf.nbytes
+            self.decimator = decimator
+            if decimator:
+                # no need for a buffer, the data is directly decimated
+                self.buf = None
+            else:
+                self.buf = numpy.empty(count, dtype=self.dtype)
+            self.remaining = count * self.dtype.itemsize
             self.buf_offset = 0
             self.mmap.seek(0)
             self.cancelled = False
@@ -2280,7 +2429,7 @@ class MMapReader(Reader):
     # Code inspired by pycomedi
     def _thread(self):
         # time it takes to read 10% of the buffer at maximum speed
-        sleep_time = ((self.mmap_size / 10) / self.buf.itemsize) * self.parent._min_ai_periods[1]
+        sleep_time = ((self.mmap_size / 10) / self.dtype.itemsize) * self.parent._min_ai_periods[1]
         # at least 1 ms, for scheduler, and 100 ms for cancel latency
         sleep_time = min(0.1, max(sleep_time, 0.001))
         try:
@@ -2288,7 +2437,7 @@ class MMapReader(Reader):
                 # a bit of time to fill the buffer
                 if self.remaining < (self.mmap_size / 10):
                     # almost the end, finish quickly
-                    sleep_time = self.remaining / self.buf.itemsize * self.parent._min_ai_periods[1]
+                    sleep_time = self.remaining / self.dtype.itemsize * self.parent._min_ai_periods[1]
                 time.sleep(sleep_time)
                 comedi.poll(self._device, self._subdevice) # the NI driver _requires_ this to ensure the buffer content is correct after a mark_read
 
@@ -2311,11 +2460,13 @@ class MMapReader(Reader):
         else:
             wrap = False
 
-        # mmap_action = copy to numpy array
-        offset = self.buf_offset / self.buf.itemsize
-        s = read_size / self.buf.itemsize
-        self.buf[offset:offset + s] = numpy.fromstring(self.mmap.read(read_size),
-                                                       dtype=self.dtype)
+        # mmap_action = copy to numpy array (or directly decimate)
+        data = numpy.fromstring(self.mmap.read(read_size), dtype=self.dtype)
+        if self.decimator:
+            self.decimator.feed(data)
+        else:
+            offset = self.buf_offset // self.buf.itemsize
+            self.buf[offset:offset + data.size] = data
         comedi.mark_buffer_read(self._device, self._subdevice, read_size)
         if wrap:
             self.mmap.seek(0)
@@ -2337,12 +2488,12 @@ class MMapReader(Reader):
             logging.warning("Reading thread is still running after %g s", timeout)
             self.cancel()
 
-        # the result should be in self.buf
-        if self.buf is None:
-            raise IOError("Failed to read all the %d expected values" % self.count)
-        elif self.remaining != 0:
+        if self.remaining != 0:
             raise IOError("Read only %d values from the %d expected" %
-                          (self.count - self.remaining / self.buf.itemsize), self.count)
+                          (self.count - self.remaining // self.dtype.itemsize, self.count))
+        # the result should be in self.buf (or already passed to the decimator)
+        if self.buf is None and not self.decimator:
+            raise IOError("Failed to read all the %d expected values" % self.count)
 
         return self.buf
 
@@ -2775,6 +2926,10 @@ class Scanner(model.Emitter):
         self.dwellTime = model.FloatContinuous(min_dt, range_dwell,
                                                unit="s", setter=self._setDwellTime)
 
+        # Period at which the partially scanned frame is sent (with
+        # MD_VALID_ROWS). 0 means only complete frames are sent.
+        self.partialFramePeriod = model.FloatContinuous(0, (0, 100), unit="s")
+
         # event to allow another component to synchronize on the beginning of
         # a pixel position. Only sent during an actual pixel of a scan, not for
         # the beam settling time or when put to rest.
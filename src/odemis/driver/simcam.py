@@ -23,11 +23,12 @@ from __future__ import division
 
 import Queue
 import logging
+import math
 import numpy
 from odemis import model, util, dataio
 from odemis.model import isasync, oneway
 import os
-from scipy import ndimage
+import threading
 import time
 
 
@@ -126,6 +127,7 @@ class Camera(model.DigitalCamera):
         # there are subscribers, they'll receive it.
         self.data = SimpleDataFlow(self)
         self._generator = None
+        self._fft_cache = None  # (ROI, fft of the image)
         # Convenience event for the user to connect and fire
         self.softwareTrigger = model.Event()
 
@@ -184,6 +186,8 @@ class Camera(model.DigitalCamera):
         but the component shouldn't be used afterwards.
         """
         self._stop_generate()
+        if self._focus:
+            self._focus.terminate()
 
     def _start_generate(self):
         if self._generator is not None:
@@ -220,10 +224,11 @@ class Camera(model.DigitalCamera):
         metadata[model.MD_EXP_TIME] = exp
         logging.debug("Generating new fake image of shape %s", gen_img.shape)
         if self._focus:
-            # apply the defocus
-            pos = self._focus.position.value['z']
+            # apply the defocus, based on the focus position in the middle of
+            # the exposure (as it might be moving)
+            pos = self._focus._getPositionAt(time.time() - exp / 2)
             dist = abs(pos - self._focus._good_focus) * 1e4
-            img = ndimage.gaussian_filter(gen_img, sigma=dist)
+            img = self._defocus(gen_img, dist)
         else:
             img = gen_img
 
@@ -235,6 +240,38 @@ class Camera(model.DigitalCamera):
         # simulate exposure time
         timer.period = self.exposureTime.value
 
+    def _defocus(self, img, sigma):
+        """
+        Blurs the image with a gaussian filter. It's done in the Fourier
+        domain, so that the time needed doesn't depend on the blur amount.
+        img (ndarray of shape YX or YXC): the image
+        sigma (0<=float): standard deviation of the gaussian (in px)
+        return (ndarray of the same shape and dtype as img): the blurred image
+        """
+        if sigma == 0:
+            return img
+
+        # The FFT of the image only changes when the ROI changes, so cache it
+        key = (img.shape, self._binning, self._translation)
+        if self._fft_cache is None or self._fft_cache[0] != key:
+            self._fft_cache = key, numpy.fft.rfft2(img, axes=(0, 1))
+        fimg = self._fft_cache[1]
+
+        # Fourier transform of a gaussian is a gaussian
+        fy = numpy.fft.fftfreq(img.shape[0])
+        fx = numpy.fft.rfftfreq(img.shape[1])
+        gy = numpy.exp(-2 * (math.pi * sigma * fy) ** 2)
+        gx = numpy.exp(-2 * (math.pi * sigma * fx) ** 2)
+        filt = numpy.outer(gy, gx)
+        if img.ndim == 3:
+            filt = filt[:, :, numpy.newaxis]
+
+        blurred = numpy.fft.irfft2(fimg * filt, s=img.shape[0:2], axes=(0, 1))
+        if img.dtype.kind in "biu":
+            idt = numpy.iinfo(img.dtype)
+            blurred = numpy.clip(numpy.round(blurred), idt.min, idt.max)
+        return blurred.astype(img.dtype)
+
     def _simulate(self):
         """
         Processes the fake image based on the translation, resolution and
@@ -309,20 +346,36 @@ class SimpleDataFlow(model.DataFlow):
 class CamFocus(model.Actuator):
     """
     Simulated focus component.
-    Just pretends to be able to move Z (instantaneously).
+    Just pretends to be able to move Z, at a constant speed.
     """
     # Duplicate of simsem.EbeamFocus
-    def __init__(self, name, role, **kwargs):
+    def __init__(self, name, role, speed=0.1, **kwargs):
+        """
+        speed (0 < float): initial speed of the z axis (m/s)
+        """
         self._good_focus = 0.006
-        axes_def = {"z": model.Axis(unit="m", range=(-0.01, 0.01))}
+        axes_def = {"z": model.Axis(unit="m", range=(-0.01, 0.01), speed=(1e-6, 1))}
         self._position = {"z": self._good_focus}
+        # Current move: start time, start position, end time, end position
+        self._move = (0, self._good_focus, 0, self._good_focus)
+        self._move_lock = threading.Lock()
+        self._move_stop = threading.Event()  # set to interrupt the current move
 
         model.Actuator.__init__(self, name, role, axes=axes_def, **kwargs)
 
+        self._executor = model.CancellableThreadPoolExecutor(max_workers=1)
+
         # RO, as to modify it the client must use .moveRel() or .moveAbs()
         self.position = model.VigilantAttribute(
                                     self._applyInversion(self._position),
                                     unit="m", readonly=True)
+        self.speed = model.MultiSpeedVA({"z": speed}, (1e-6, 1), "m/s")
+
+    def terminate(self):
+        if self._executor:
+            self.stop()
+            self._executor.shutdown()
+            self._executor = None
 
     def _updatePosition(self):
         """
@@ -332,6 +385,40 @@ class CamFocus(model.Actuator):
         self.position._value = self._applyInversion(self._position)
         self.position.notify(self.position.value)
 
+    def _getPositionAt(self, t):
+        """
+        Computes the (internal) position of the z axis at a given time, based on
+        the current move.
+        t (float): time since epoch
+        return (float): the position of the z axis
+        """
+        with self._move_lock:
+            tstart, pstart, tend, pend = self._move
+        if t >= tend:
+            return pend
+        elif t <= tstart:
+            return pstart
+        return pstart + (pend - pstart) * (t - tstart) / (tend - tstart)
+
+    def _doMoveAbs(self, pos):
+        """
+        Move to the (internal) position, and block until it's reached (or the
+        move is stopped)
+        """
+        now = time.time()
+        start = self._getPositionAt(now)
+        dur = abs(pos - start) / self.speed.value["z"]
+        with self._move_lock:
+            self._move = (now, start, now + dur, pos)
+        self._move_stop.wait(dur)
+
+        # Either at the end of the move, or stopped in the middle
+        with self._move_lock:
+            self._position["z"] = self._getPositionAt(time.time())
+            self._move = (0, self._position["z"], 0, self._position["z"])
+        logging.info("moved axis z to %f", self._position["z"])
+        self._updatePosition()
+
     @isasync
     def moveRel(self, shift):
         if not shift:
@@ -340,16 +427,14 @@ class CamFocus(model.Actuator):
         shift = self._applyInversion(shift)
 
         for axis, change in shift.items():
-            self._position[axis] += change
             rng = self.axes[axis].range
-            if not rng[0] < self._position[axis] < rng[1]:
-                logging.warning("moving axis %s to %f, outside of range %r",
-                                axis, self._position[axis], rng)
-            else:
-                logging.info("moving axis %s to %f", axis, self._position[axis])
+            if not rng[0] < self._position[axis] + change < rng[1]:
+                logging.warning("moving axis %s by %f, outside of range %r",
+                                axis, change, rng)
 
-        self._updatePosition()
-        return model.InstantaneousFuture()
+        # The position is computed only when the move starts, as the previous
+        # moves might not yet be finished
+        return self._executor.submit(lambda: self._doMoveAbs(self._position["z"] + shift["z"]))
 
     @isasync
     def moveAbs(self, pos):
@@ -358,12 +443,10 @@ class CamFocus(model.Actuator):
         self._checkMoveAbs(pos)
         pos = self._applyInversion(pos)
 
-        for axis, new_pos in pos.items():
-            self._position[axis] = new_pos
-            logging.info("moving axis %s to %f", axis, self._position[axis])
-
-        self._updatePosition()
-        return model.InstantaneousFuture()
+        return self._executor.submit(self._doMoveAbs, pos["z"])
 
     def stop(self, axes=None):
         logging.warning("Stopping z axis")
+        self._move_stop.set()
+        self._executor.cancel()
+        self._move_stop.clear()
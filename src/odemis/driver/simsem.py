@@ -23,6 +23,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 from Pyro4.core import isasync
+import collections
 import logging
 import math
 import numpy
@@ -35,6 +36,10 @@ import time
 import weakref
 
 
+# Maximum number of defocused images kept in memory
+MAX_DEFOCUS_CACHE = 4
+
+
 class SimSEM(model.HwComponent):
     '''
     This is an extension of the model.HwComponent class. It first reads and
@@ -44,7 +49,7 @@ class SimSEM(model.HwComponent):
     '''
 
     def __init__(self, name, role, children, image=None, drift_period=None,
-                 daemon=None, **kwargs):
+                 realistic_timing=True, daemon=None, **kwargs):
         '''
         children (dict string->kwargs): parameters setting for the children.
             Known children are "scanner", "detector0", and the optional "focus"
@@ -52,6 +57,10 @@ class SimSEM(model.HwComponent):
         image (str or None): path to a file to use as fake image (relative to
          the directory of this class)
         drift_period (None or 0<float): time period for drift updating in seconds
+        realistic_timing (bool): if True, each image is sent after the time
+         it would take to scan it (resolution x dwell time). If False, the
+         images are generated as fast as possible, which is handy to test the
+         throughput of the data processing.
         Raise an exception if the device cannot be opened
         '''
         # fake image setup
@@ -65,6 +74,7 @@ class SimSEM(model.HwComponent):
         self.fake_img = img.ensure2DImage(converter.read_data(image)[0])
 
         self._drift_period = drift_period
+        self._realistic_timing = realistic_timing
 
         # we will fill the set of children with Components later in ._children
         model.HwComponent.__init__(self, name, role, daemon=daemon, **kwargs)
@@ -198,6 +208,10 @@ class Scanner(model.Emitter):
 
         self.dwellTime = model.FloatContinuous(1e-06, (1e-06, 1000), unit="s")
 
+        # Period at which the partially scanned frame is sent (with
+        # MD_VALID_ROWS). 0 means only complete frames are sent.
+        self.partialFramePeriod = model.FloatContinuous(0, (0, 100), unit="s")
+
         # VAs to control the ebeam, purely fake
         self.probeCurrent = model.FloatEnumerated(1.3e-9,
                           {0.1e-9, 1.3e-9, 2.6e-9, 3.4e-9, 11.564e-9, 23e-9},
@@ -337,6 +351,8 @@ class Detector(model.Detector):
         self._acquisition_must_stop = threading.Event()
 
         self.fake_img = self.parent.fake_img
+        # (sigma, area scanned) -> image blurred (in order of use)
+        self._defocus_cache = collections.OrderedDict()
         # The shape is just one point, the depth
         idt = numpy.iinfo(self.fake_img.dtype)
         data_depth = idt.max - idt.min + 1
@@ -417,6 +433,25 @@ class Detector(model.Detector):
         if abs(self.current_drift) == self.drift_bound:
             self.drift_factor = -self.drift_factor
 
+    def _defocus(self, sim_img, sigma, key):
+        """
+        Blurs the image, as if it was out of focus. The results are cached, as
+        typically the focus and the scanning area stay the same for many frames.
+        sim_img (ndarray): the image in focus
+        sigma (0<=float): standard deviation of the gaussian blur, in pixels
+        key (tuple): identifies the area of the fake image which was scanned
+        return (ndarray): the blurred image. Must not be modified.
+        """
+        key = (round(sigma, 2),) + key
+        try:
+            blurred = self._defocus_cache.pop(key)
+        except KeyError:
+            blurred = ndimage.gaussian_filter(sim_img, sigma=sigma)
+            if len(self._defocus_cache) >= MAX_DEFOCUS_CACHE:
+                self._defocus_cache.popitem(last=False)  # least recently used
+        self._defocus_cache[key] = blurred
+        return blurred
+
     def _simulate_image(self):
         """
         Generates the fake output based on the translation, resolution and
@@ -447,10 +482,26 @@ class Detector(model.Detector):
             lt = (center[0] + pxs_pos[0] - (res[0] / 2) * scale[0],
                   center[1] + pxs_pos[1] - (res[1] / 2) * scale[1])
             assert(lt[0] >= 0 and lt[1] >= 0)
-            # compute each row and column that will be included
-            coord = ([int(round(lt[0] + i * scale[0])) for i in range(res[0])],
-                     [int(round(lt[1] + i * scale[1])) for i in range(res[1])])
-            sim_img = self.fake_img[numpy.ix_(coord[1], coord[0])] # copy
+            if all(s == int(s) for s in scale):
+                # each row and column included are at a fixed interval => view
+                x0, y0 = int(math.floor(lt[0] + 0.5)), int(math.floor(lt[1] + 0.5))
+                sx, sy = int(scale[0]), int(scale[1])
+                sim_img = self.fake_img[y0:y0 + res[1] * sy:sy, x0:x0 + res[0] * sx:sx]
+                shared = True
+            else:
+                # compute each row and column that will be included
+                cols = numpy.floor(lt[0] + numpy.arange(res[0]) * scale[0] + 0.5).astype(numpy.intp)
+                rows = numpy.floor(lt[1] + numpy.arange(res[1]) * scale[1] + 0.5).astype(numpy.intp)
+                sim_img = self.fake_img.take(rows, axis=0).take(cols, axis=1)
+                shared = False
+
+            if self.parent._focus:
+                # apply the defocus
+                pos = self.parent._focus.position.value['z']
+                dist = abs(pos - self.parent._focus._good_focus) * 1e4
+                if dist > 0:
+                    sim_img = self._defocus(sim_img, dist, (lt, scale, res))
+                    shared = True
 
             # reduce image depth if requested
             bpp = self.bpp.value
@@ -458,19 +509,16 @@ class Detector(model.Detector):
                 mind, maxd = sim_img.min(), sim_img.max()
                 maxf = 2 ** bpp - 1
                 b = maxf / (maxd - mind)
-                # Multiply by a float and drop to the original dtype
-                numpy.multiply(sim_img - mind, b, out=sim_img, casting="unsafe")
-                if bpp <= 8:
-                    sim_img = sim_img.astype(numpy.uint8)
+                odtype = numpy.uint8 if bpp <= 8 else sim_img.dtype
+                fimg = numpy.subtract(sim_img, mind, dtype=numpy.float32)
+                fimg *= b
+                sim_img = fimg.astype(odtype)
+            elif shared:
+                # Never share the fake image (or the cache) with the clients
+                sim_img = sim_img.copy()
 
             metadata[model.MD_BPP] = bpp
 
-            if self.parent._focus:
-                # apply the defocus
-                pos = self.parent._focus.position.value['z']
-                dist = abs(pos - self.parent._focus._good_focus) * 1e4
-                sim_img = ndimage.gaussian_filter(sim_img, sigma=dist)
-
             # update fake output metadata
             metadata[model.MD_POS] = updated_phy_pos
             metadata[model.MD_PIXEL_SIZE] = (pxs[0] * scale[0], pxs[1] * scale[1])
@@ -490,9 +538,17 @@ class Detector(model.Detector):
         """
         try:
             while not self._acquisition_must_stop.is_set():
-                dwelltime = self.parent._scanner.dwellTime.value
-                resolution = self.parent._scanner.resolution.value
-                duration = numpy.prod(resolution) * dwelltime
+                if self.parent._realistic_timing:
+                    dwelltime = self.parent._scanner.dwellTime.value
+                    resolution = self.parent._scanner.resolution.value
+                    duration = numpy.prod(resolution) * dwelltime
+                else:
+                    duration = 0  # as fast as possible
+                pperiod = self.parent._scanner.partialFramePeriod.value
+                if 0 < pperiod < duration:
+                    if not self._acquire_progressive(callback, duration, pperiod):
+                        break
+                    continue
                 if self._acquisition_must_stop.wait(duration):
                     break
                 callback(self._simulate_image())
@@ -503,6 +559,43 @@ class Detector(model.Detector):
             self._acquisition_must_stop.clear()
 
 
+    def _acquire_progressive(self, callback, duration, period):
+        """
+        Simulates the acquisition of one frame, line by line, and sends the
+        partially scanned frame (with MD_VALID_ROWS) every period.
+        callback (callable): called with each (partial or complete) DataArray
+        duration (float): time to scan the whole frame (in s)
+        period (0<float): time between two partial frames (in s)
+        return (bool): True if the whole frame was sent, False if the
+          acquisition was requested to stop before.
+        """
+        # Metadata (and especially MD_ACQ_DATE) are from the beginning of the scan
+        sim_img = self._simulate_image()
+        nrows = sim_img.shape[0]
+        line_dur = duration / nrows
+        step = max(1, int(period / line_dur))
+
+        start = time.time()
+        prev_row = 0
+        while prev_row < nrows:
+            row = min(prev_row + step, nrows)
+            left = start + row * line_dur - time.time()
+            if self._acquisition_must_stop.wait(max(0, left)):
+                return False
+            if row == nrows:
+                callback(sim_img)
+            else:
+                # A new array each time, as the receivers might keep it
+                partial = numpy.zeros(sim_img.shape, sim_img.dtype)
+                partial[:row] = sim_img[:row]
+                md = sim_img.metadata.copy()
+                md[model.MD_VALID_ROWS] = row
+                callback(model.DataArray(partial, md))
+            prev_row = row
+
+        return True
+
+
 class SEMDataFlow(model.DataFlow):
     """
     This is an extension of model.DataFlow. It receives notifications from the
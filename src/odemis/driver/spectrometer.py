@@ -24,6 +24,8 @@ from odemis import model
 from odemis.model import ComponentBase, DataFlowBase
 import logging
 import math
+import numpy
+import time
 
 # This is a class that represents a spectrometer (ie, a detector to acquire
 # a spectrum) by wrapping a DigitalCamera and a spectrograph (ie, actuator which
@@ -48,6 +50,13 @@ class CompositedSpectrometer(model.Detector):
        max resolution is 1.
      * the maximum binning can be bigger than the maximum resolution (but not
        of the shape).
+     * the vertical binning can always go up to the whole height of the
+       detector. If the detector cannot bin that much, it is requested to
+       bin as much as possible, and the lines received are summed. In such
+       case, the vertical binning is rounded down to a multiple of the
+       maximum detector binning.
+     * the .lineRate VA reports the number of spectra received per second
+       during the acquisition.
      * the metadata has an additional entry MD_WL_LIST which indicates the
        wavelength associated to each pixel.
     '''
@@ -108,13 +117,15 @@ class CompositedSpectrometer(model.Detector):
         # TODO: give a init parameter or VA to specify a smaller window height
         # than the entire CCD (some spectrometers have only noise on the top and
         # bottom)
-        if dt.binning.range[1][1] < dt.resolution.range[1][1]:
-            # without software binning, we are stuck to the max binning
-            # TODO: support software binning by rolling up our own dataflow that
-            # does data merging
-            logging.info("Spectrometer %s will only use a %d px band of the %d "
-                         "px of the sensor", name, dt.binning.range[1][1],
-                         dt.resolution.range[1][1])
+        self._hw_max_vbin = dt.binning.range[1][1]
+        max_height = dt.resolution.range[1][1]
+        if self._hw_max_vbin < max_height:
+            # The fastest is to let the detector bin everything, but if it
+            # cannot, it sends several lines, which are summed in software.
+            logging.info("Spectrometer %s will sum up to %d lines in software, "
+                         "as the detector can only bin %d px vertically",
+                         name, max_height // self._hw_max_vbin,
+                         self._hw_max_vbin)
 
         assert dt.resolution.range[0][1] == 1
         resolution = (dt.resolution.range[1][0], 1)  # max,1
@@ -124,10 +135,16 @@ class CompositedSpectrometer(model.Detector):
                                              setter=self._setResolution)
         # 2D binning is like a "small resolution"
         # Initial binning is minimum binning horizontally, and maximum vertically
-        self._binning = (1, min(dt.binning.range[1][1], dt.resolution.range[1][1]))
-        self.binning = model.ResolutionVA(self._binning, dt.binning.range,
+        self._binning = self._fitBinning((1, max_height))
+        self._hw_vbin = 1  # vertical binning actually done by the detector
+        bin_rng = (dt.binning.range[0],
+                   (dt.binning.range[1][0], max(self._hw_max_vbin, max_height)))
+        self.binning = model.ResolutionVA(self._binning, bin_rng,
                                           setter=self._setBinning)
 
+        # Number of spectra per second actually received (0 if not acquiring)
+        self.lineRate = model.FloatVA(0, unit="Hz", readonly=True)
+
         self._setBinning(self._binning) # will also update the resolution
 
         # TODO: also wrap translation, if it exists?
@@ -181,9 +198,11 @@ class CompositedSpectrometer(model.Detector):
         value (int): how many pixels horizontally and vertically
           are combined to create "super pixels"
         """
-        # Everything accepted by the VA should be acceptable
+        # Everything accepted by the VA should be acceptable, but possibly
+        # rounded to what can actually be summed
+        value = self._fitBinning(value)
         prev_binning = self._binning
-        self._binning = tuple(value) # duplicate
+        self._binning = value
 
         if self.data.active:
             self._applyBinning(value)
@@ -202,6 +221,20 @@ class CompositedSpectrometer(model.Detector):
         self.resolution.value = new_resolution
         return value
 
+    def _fitBinning(self, value):
+        """
+        Rounds the binning to a value which can be done, either by the detector,
+        or by summing lines binned by the detector as much as possible.
+        value (tuple of 2 ints): the requested binning
+        return (tuple of 2 ints): the binning which can be done
+        """
+        vbin = value[1]
+        if vbin > self._hw_max_vbin:
+            # All the lines summed are binned by the detector the same way,
+            # otherwise the extra lines would be dropped
+            vbin = (vbin // self._hw_max_vbin) * self._hw_max_vbin
+        return (value[0], vbin)
+
     def _setResolution(self, value):
         """
         Called when the resolution VA is to be updated.
@@ -220,13 +253,24 @@ class CompositedSpectrometer(model.Detector):
         return size
 
     def _applyBinning(self, b):
-        self._detector.binning.value = b
-        if self._detector.binning.value != b:
+        # The detector might not be able to bin as much as requested (some
+        # binnings might only be possible in special read modes). In such case,
+        # it will send several lines, which are summed in software.
+        self._detector.binning.value = (b[0], min(b[1], self._hw_max_vbin))
+        hw_binning = self._detector.binning.value
+        if hw_binning[0] != b[0]:
             logging.error("Hw binning didn't follow requested binning %s", b)
+        self._hw_vbin = hw_binning[1]
+        if self._hw_vbin != b[1]:
+            logging.debug("Detector binning is %s, will sum %d lines in software",
+                          hw_binning, b[1] // self._hw_vbin)
 
     def _applyResolution(self, res):
-        self._detector.resolution.value = res
-        assert self._detector.resolution.value[1] == 1
+        nlines = max(1, self._binning[1] // self._hw_vbin)
+        self._detector.resolution.value = (res[0], nlines)
+        if self._detector.resolution.value[1] != nlines:
+            logging.warning("Detector sends %d lines instead of %d",
+                            self._detector.resolution.value[1], nlines)
 
     def _applyCCDSettings(self):
         self._applyBinning(self.binning.value)
@@ -251,10 +295,14 @@ class SpecDataFlow(model.DataFlow):
         # the acquisition was taken (when the settings are changing while
         # generating).
         self._beg_metadata = {}  # Metadata (more or less) at the beginning of the acquisition
+        # Reception time of the first frame, and number of frames since then
+        self._first_frame = None
+        self._nframes = 0
 
     def start_generate(self):
         logging.debug("Activating Spectrometer acquisition")
         self.active = True
+        self._first_frame = None
         self.component._applyCCDSettings()
         self._beg_metadata = self.component._metadata.copy()
         self._ccddf.subscribe(self._newFrame)
@@ -262,19 +310,48 @@ class SpecDataFlow(model.DataFlow):
     def stop_generate(self):
         self._ccddf.unsubscribe(self._newFrame)
         self.active = False
+        self.component.lineRate._set_value(0, force_write=True)
         logging.debug("Spectrometer acquisition finished")
         # TODO: tell the component that it's over?
 
     def synchronizedOn(self, event):
         self._ccddf.synchronizedOn(event)
 
+    def _updateLineRate(self):
+        """
+        Updates the .lineRate of the component, based on the number of frames
+        received since the beginning of the acquisition
+        """
+        if not self.active:
+            return
+        now = time.time()
+        if self._first_frame is None:
+            self._first_frame = now
+            self._nframes = 0
+            return
+
+        self._nframes += 1
+        dur = now - self._first_frame
+        if dur > 0:
+            self.component.lineRate._set_value(self._nframes / dur, force_write=True)
+
     def _newFrame(self, df, data):
         """
         Get the new frame from the detector
         """
+        self._updateLineRate()
+
         if data.shape[0] != 1:
-            logging.warning("Shape of spectrometer data is %s, while first dim should be 1", data.shape)
-            # TODO: do software binning (= sum/mean over the first axis)
+            # The detector couldn't bin all the lines => sum them
+            dmd = data.metadata.copy()  # Don't modify the metadata of the detector data
+            if model.MD_BINNING in dmd:
+                b = dmd[model.MD_BINNING]
+                dmd[model.MD_BINNING] = (b[0], b[1] * data.shape[0])
+            if data.dtype.kind == "u" and data.dtype.itemsize < 4:
+                dtype = numpy.uint32  # To be sure it doesn't overflow
+            else:
+                dtype = data.dtype
+            data = model.DataArray(data.sum(axis=0, dtype=dtype, keepdims=True), dmd)
 
         # Check the metadata seems correct, and if not, recompute it on-the-fly
         md = self._beg_metadata
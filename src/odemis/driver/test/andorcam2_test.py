@@ -24,8 +24,11 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 
 import logging
+import numpy
+from odemis import model
 from odemis.driver import andorcam2
 import os
+import time
 import unittest
 from unittest.case import skip
 
@@ -70,6 +73,48 @@ class TestFake(VirtualTestCam, unittest.TestCase):
 
 
 #@skip("simple")
+class TestBurstFake(unittest.TestCase):
+    """
+    Test the burst mode, with the simulator
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.camera = CLASS_SIM(**KWARGS_SIM)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.camera.terminate()
+
+    def test_burst(self):
+        self.camera.binning.value = (8, 8)  # small images => fast readout
+        self.camera.resolution.value = self.camera.resolution.range[1]
+        self.camera.exposureTime.value = 0.01  # s
+        self.camera.burst.value = True
+        self._dates = []
+        self._images = []
+        try:
+            self.camera.data.subscribe(self._on_image)
+            time.sleep(2)
+            self.camera.data.unsubscribe(self._on_image)
+        finally:
+            self.camera.burst.value = False
+
+        # All the images should be received, at the rate of the camera
+        self.assertGreater(len(self._dates), 100)
+        periods = numpy.diff(self._dates)
+        self.assertGreater(periods.min(), 0.01)
+        self.assertAlmostEqual(periods.min(), periods.max())
+
+        # Each image has its own memory (the read buffer is reused)
+        for im1, im2 in zip(self._images[:-1], self._images[1:]):
+            self.assertFalse(numpy.may_share_memory(im1, im2))
+
+    def _on_image(self, df, data):
+        self._dates.append(data.metadata[model.MD_ACQ_DATE])
+        self._images.append(data)
+
+
 class StaticTestAndorCam2(VirtualStaticTestCam, unittest.TestCase):
     camera_type = CLASS
     camera_kwargs = KWARGS
@@ -119,6 +119,39 @@ class TestPH300(unittest.TestCase):
         self._cnt += 1
         self._lastdata = data
 
+    def test_acquire_continuous(self):
+        """Test the continuous acquisition"""
+        df = self.dev.data
+        self.dev.refreshPeriod.value = 0.1  # s
+        exp_shape = self.dev.shape[-2::-1]
+
+        self._cnt = 0
+        self._lastdata = None
+        self._rawcnt = 0
+        self.dev.continuous.value = True
+        try:
+            self.dev.rawData.subscribe(self._on_raw)
+            df.subscribe(self._on_det)
+            time.sleep(2)
+            df.unsubscribe(self._on_det)
+            self.dev.rawData.unsubscribe(self._on_raw)
+        finally:
+            self.dev.continuous.value = False
+
+        self.assertGreater(self._cnt, 10)  # Should be 10Hz => ~20
+        self.assertEqual(self._lastdata.shape, exp_shape)
+        # The histogram is accumulated since the start
+        self.assertGreater(self._lastdata.metadata[model.MD_DWELL_TIME], 1.5)
+        if TEST_NOHW:  # The simulator always has events
+            self.assertGreater(self._rawcnt, 0)
+
+        # Back to the normal mode
+        data = df.get()
+        self.assertEqual(data.shape, exp_shape)
+
+    def _on_raw(self, df, data):
+        self._rawcnt += len(data)
+
     def test_va(self):
         """Test changing VA"""
         dt = self.dev.dwellTime.range[0]
@@ -27,7 +27,9 @@ from concurrent import futures
 import logging
 import math
 from odemis.driver import pigcs
+from odemis.util import driver
 import os
+import threading
 import time
 import unittest
 from unittest.case import skip
@@ -597,6 +599,104 @@ class TestActuatorE725(TestActuator):
         self.kwargs_two = KWARGS_E725
 
 
+class TestBusQueries(unittest.TestCase):
+    """
+    Check the number of queries sent to the (simulated) controllers
+    """
+    def setUp(self):
+        self.stage = pigcs.FakeBus(**KWARGS_TWO_CL)
+        self.sims = self.stage.accesser.serial._subports
+
+    def tearDown(self):
+        self.stage.terminate()
+
+    def _count_commands(self):
+        return sum(s.com_count for s in self.sims)
+
+    def test_position_coalesce(self):
+        """
+        Concurrent position updates are coalesced
+        """
+        ncom = self._count_commands()
+        threads = [threading.Thread(target=self.stage._updatePosition) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # At worse, one reading in progress + one for all the others (per controller)
+        ncom = self._count_commands() - ncom
+        self.assertLessEqual(ncom, 2 * len(self.sims))
+
+    def test_position_maxage(self):
+        self.stage._updatePosition()
+        ncom = self._count_commands()
+        self.stage._updatePosition(maxage=10)
+        self.assertEqual(self._count_commands(), ncom)
+
+        # One query per controller
+        self.stage._updatePosition()
+        self.assertEqual(self._count_commands(), ncom + len(self.sims))
+
+    def test_move_commands(self):
+        """
+        Measures the number of commands per second during moves
+        """
+        orig_pos = self.stage.position.value.copy()
+        start = time.time()
+        ncom = self._count_commands()
+        for i in range(10):
+            f = self.stage.moveRel({"x": 10e-6, "y": -10e-6})
+            f.result()
+        dur = time.time() - start
+        ncom = self._count_commands() - ncom
+        logging.info("Sent %d commands in %g s (%g com/s)", ncom, dur, ncom / dur)
+        pos = self.stage.position.value
+        self.assertAlmostEqual(pos["x"], orig_pos["x"] + 100e-6)
+        self.assertAlmostEqual(pos["y"], orig_pos["y"] - 100e-6)
+
+    def test_trajectory(self):
+        """
+        Measures the number of commands per second during a trajectory
+        """
+        orig_pos = self.stage.position.value.copy()
+        positions = [{"x": orig_pos["x"] + i * 10e-6, "y": orig_pos["y"] - i * 10e-6}
+                     for i in range(1, 11)]
+        start = time.time()
+        ncom = self._count_commands()
+        fs = driver.moveAbsTrajectory(self.stage, positions)
+        for f in fs:
+            f.result()
+        dur = time.time() - start
+        ncom = self._count_commands() - ncom
+        logging.info("Sent %d commands in %g s (%g com/s)", ncom, dur, ncom / dur)
+
+        # Even if the position is not read after every point, it is at the end
+        pos = self.stage.position.value
+        self.assertAlmostEqual(pos["x"], positions[-1]["x"])
+        self.assertAlmostEqual(pos["y"], positions[-1]["y"])
+
+    def test_trajectory_cancel(self):
+        """
+        The position is updated when a trajectory is cancelled
+        """
+        orig_pos = self.stage.position.value.copy()
+        positions = [{"x": orig_pos["x"] + i * 10e-6, "y": orig_pos["y"] - i * 10e-6}
+                     for i in range(1, 11)]
+        fs = driver.moveAbsTrajectory(self.stage, positions)
+        # Cancel the third point as soon as the second one is reached, so
+        # before it starts (which also cancels all the following points)
+        fs[1].add_done_callback(lambda f: fs[2].cancel())
+        fs[1].result()
+        time.sleep(0.1)  # Let the actuator update the position
+
+        for f in fs[2:]:
+            self.assertTrue(f.cancelled())
+        pos = self.stage.position.value
+        self.assertAlmostEqual(pos["x"], positions[1]["x"])
+        self.assertAlmostEqual(pos["y"], positions[1]["y"])
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -21,6 +21,7 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 from __future__ import division
 from odemis import model
 from odemis.driver import semcomedi
+from odemis.util.driver import readMemoryUsage
 import Pyro4
 import comedi
 import copy
@@ -68,6 +69,126 @@ KWARGS_SEM_CNT = {"name": "sem", "role": "sem", "device": "/dev/comedi0",
               "children": {"detector0": CONFIG_SED, "counter0": CONFIG_CNT, "scanner": CONFIG_SCANNER}
               }
 
+def _scan_raw_to_lines(shape, margin, osr, data, oarray, adtype):
+    """
+    Converts a linear array resulting from a scan with oversampling to a 2D
+    array, all at once (as SEMComedi used to do before using LinesDecimator)
+    shape (2-tuple int): H,W dimension of the scanned image (margin not included)
+    margin (int): amount of useless pixels at the beginning of each line
+    osr (int): over-sampling rate
+    data (1D ndarray): the raw linear array (including oversampling), of one channel
+    oarray (2D ndarray): the output array, already allocated, of shape shape
+    adtype (dtype): intermediary type to use for the accumulator
+    """
+    # reshape to a 3D array with margin and sub-samples
+    rectangle = data.reshape((-1, shape[1] + margin, osr))
+    # trim margin
+    tr_rect = rectangle[:, margin:, :]
+    if osr == 1:
+        # only one sample per pixel => copy
+        oarray[...] = tr_rect[:, :, 0]
+    else:
+        acc = numpy.add.reduce(tr_rect, axis=2, dtype=adtype)
+        numpy.true_divide(acc, osr, out=oarray, casting='unsafe', subok=False)
+
+
+class TestLinesDecimator(unittest.TestCase):
+    """
+    Test the LinesDecimator, which doesn't need any hardware
+    """
+
+    def _gen_raw(self, shape, margin, osr, nchans, dtype=numpy.uint16):
+        """
+        return (1D ndarray): raw data as read from the device
+        """
+        raw_shape = (shape[0], shape[1] + margin, osr, nchans)
+        return numpy.random.randint(0, 2 ** 12, size=raw_shape).astype(dtype).ravel()
+
+    def _decimate_ref(self, raw, shape, margin, osr, nchans, dtype):
+        """
+        Decimate the whole raw buffer at once (as SEMComedi used to do)
+        """
+        rbuf = raw.reshape(-1, nchans)
+        adtype = semcomedi.get_best_dtype_for_acc(dtype, osr)
+        out = []
+        for i in range(nchans):
+            oa = numpy.empty(shape, dtype=dtype)
+            _scan_raw_to_lines(shape, margin, osr, rbuf[..., i], oa, adtype)
+            out.append(oa)
+        return out
+
+    def _decimate_chunks(self, raw, shape, margin, osr, nchans, dtype, chunksz):
+        """
+        Decimate by passing the raw data in chunks (of variable size)
+        """
+        adtype = semcomedi.get_best_dtype_for_acc(dtype, osr)
+        out = [numpy.empty(shape, dtype=dtype) for i in range(nchans)]
+        dec = semcomedi.LinesDecimator(shape, margin, osr, 0, shape[0], out, adtype)
+        i = 0
+        while i < raw.size:
+            n = numpy.random.randint(1, chunksz + 1)
+            dec.feed(raw[i:i + n])
+            i += n
+        self.assertTrue(dec.done)
+        return out
+
+    def test_decimate(self):
+        dtype = numpy.uint16
+        for shape, margin, osr, nchans in (((20, 30), 3, 8, 2),
+                                           ((7, 13), 0, 1, 1),
+                                           ((1, 50), 5, 3, 3),
+                                           ((16, 16), 2, 1000, 1)):
+            raw = self._gen_raw(shape, margin, osr, nchans, dtype)
+            exp = self._decimate_ref(raw, shape, margin, osr, nchans, dtype)
+            for chunksz in (1, 7, 1000, raw.size):
+                out = self._decimate_chunks(raw, shape, margin, osr, nchans,
+                                            dtype, chunksz)
+                for e, o in zip(exp, out):
+                    numpy.testing.assert_array_equal(e, o)
+
+    def test_rest_discarded(self):
+        """
+        Data after the last pixel (eg, rest position) is ignored
+        """
+        dtype = numpy.uint16
+        shape, margin, osr, nchans = (10, 10), 2, 4, 2
+        raw = self._gen_raw(shape, margin, osr, nchans, dtype)
+        exp = self._decimate_ref(raw, shape, margin, osr, nchans, dtype)
+        rest = numpy.zeros(osr * nchans, dtype=dtype)
+        out = self._decimate_chunks(numpy.concatenate((raw, rest)), shape,
+                                    margin, osr, nchans, dtype, 100)
+        for e, o in zip(exp, out):
+            numpy.testing.assert_array_equal(e, o)
+
+    def test_speed(self):
+        """
+        Compare the decimation while reading (by chunks, as the Reader does with
+        comedi_test) to the decimation of the whole raw buffer.
+        """
+        dtype = numpy.uint16
+        shape, margin, osr, nchans = (64, 512), 10, 64, 1
+        raw = self._gen_raw(shape, margin, osr, nchans, dtype)
+        adtype = semcomedi.get_best_dtype_for_acc(dtype, osr)
+
+        tstart = time.time()
+        self._decimate_ref(raw, shape, margin, osr, nchans, dtype)
+        dur_ref = time.time() - tstart
+
+        out = [numpy.empty(shape, dtype=dtype)]
+        dec = semcomedi.LinesDecimator(shape, margin, osr, 0, shape[0], out, adtype)
+        chunksz = semcomedi.DECIMATION_CHUNK_SIZE
+        tstart = time.time()
+        for i in range(0, raw.size, chunksz):
+            dec.feed(raw[i:i + chunksz])
+        dur_chunk = time.time() - tstart
+
+        logging.info("Decimated %g MB of raw data in %g s at once, and in %g s "
+                     "by chunks of %g MB", raw.nbytes / 2 ** 20, dur_ref, dur_chunk,
+                     chunksz * raw.itemsize / 2 ** 20)
+        # Should not be much slower, while using osr times less memory
+        self.assertLess(dur_chunk, dur_ref * 5 + 0.1)
+
+
 #@unittest.skip("simple")
 class TestSEMStatic(unittest.TestCase):
     """
@@ -329,6 +450,50 @@ class TestSEM(unittest.TestCase):
         self.assertGreaterEqual(duration, expected_duration, "Error execution took %f s, less than exposure time %d." % (duration, expected_duration))
         self.assertIn(model.MD_DWELL_TIME, im.metadata)
 
+    def test_acquire_speed(self):
+        """
+        Benchmark of the acquisition (reading + decimation) with an increasing
+        over-sampling rate: the overhead and the memory used should stay small.
+        """
+        self.scanner.resolution.value = (256, 256)
+        self.size = self.scanner.resolution.value
+        self.sed.data.get()  # warm-up
+
+        for dtf in (1, 10, 100):
+            self.scanner.dwellTime.value = self.scanner.dwellTime.range[0] * dtf
+            dt = self.scanner.dwellTime.value
+            osr = self.sem.find_best_oversampling_rate(dt)[1]
+            expected_duration = self.compute_expected_duration()
+            raw_size = self.size[0] * self.size[1] * osr * 2  # bytes, for uint16
+
+            # Monitor the memory while acquiring
+            mem_max = [readMemoryUsage()]
+            mem_start = mem_max[0]
+            acq_done = threading.Event()
+
+            def monitor_mem():
+                while not acq_done.wait(0.01):
+                    mem_max[0] = max(mem_max[0], readMemoryUsage())
+
+            t = threading.Thread(target=monitor_mem)
+            t.start()
+            start = time.time()
+            im = self.sed.data.get()
+            duration = time.time() - start
+            acq_done.set()
+            t.join()
+
+            mem_used = mem_max[0] - mem_start
+            logging.info("Acquired %s px with osr = %d in %g s (expected %g s), "
+                         "using %g MB (raw data is %g MB)",
+                         self.size, osr, duration, expected_duration,
+                         mem_used / 2 ** 20, raw_size / 2 ** 20)
+            self.assertEqual(im.shape, self.size[::-1])
+            self.assertGreaterEqual(duration, expected_duration)
+            if osr > 10:
+                # The raw data is never entirely in memory
+                self.assertLess(mem_used, raw_size / 2)
+
     def test_long_dwell_time(self):
         """
         one pixel only, but long dwell time (> 4s), which means it uses
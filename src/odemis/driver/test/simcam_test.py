@@ -302,6 +302,32 @@ class TestSimCam(unittest.TestCase):
         f.result()
         self.assertEqual(self.focus.position.value, pos)
 
+    def test_focus_speed(self):
+        """
+        Check the focus moves at the requested speed
+        """
+        orig_speed = self.focus.speed.value
+        pos = self.focus.position.value
+        self.focus.speed.value = {"z": 1e-3}  # m/s
+        try:
+            tstart = time.time()
+            f = self.focus.moveRel({"z": 1e-3})
+            time.sleep(0.5)
+            self.assertFalse(f.done())
+            f.result()
+            self.assertAlmostEqual(time.time() - tstart, 1, delta=0.2)
+            self.assertAlmostEqual(self.focus.position.value["z"], pos["z"] + 1e-3)
+
+            # Stop in the middle => stays in between
+            f = self.focus.moveAbs(pos)
+            time.sleep(0.5)
+            self.focus.stop()
+            self.assertTrue(f.done())
+            self.assertTrue(pos["z"] < self.focus.position.value["z"] < pos["z"] + 1e-3)
+        finally:
+            self.focus.speed.value = orig_speed
+            self.focus.moveAbs(pos).result()
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -79,6 +79,34 @@ class TestSEMStatic(unittest.TestCase):
         wrong_config["children"]["scanner"]["channels"] = [1, 1]
         self.assertRaises(Exception, simsem.SimSEM, **wrong_config)
 
+    def test_fast(self):
+        """
+        Check that without realistic timing, images are generated without
+        waiting for the scanning time
+        """
+        config = copy.deepcopy(CONFIG_SEM)
+        config["realistic_timing"] = False
+        sem = simsem.SimSEM(**config)
+        for child in sem.children.value:
+            if child.name == CONFIG_SED["name"]:
+                sed = child
+            elif child.name == CONFIG_SCANNER["name"]:
+                scanner = child
+
+        scanner.dwellTime.value = 1e-3  # s
+        res = scanner.resolution.value
+        expected_duration = res[0] * res[1] * scanner.dwellTime.value
+
+        number = 10
+        start = time.time()
+        for i in range(number):
+            im = sed.data.get()
+            self.assertEqual(im.shape, res[::-1])
+        duration = time.time() - start
+        logging.info("Generated %d images of %s in %g s", number, res, duration)
+        self.assertLess(duration, expected_duration)
+        sem.terminate()
+
     def test_pickle(self):
         try:
             os.remove("testds")
@@ -404,6 +432,50 @@ class TestSEM(unittest.TestCase):
         # if it has acquired a least 5 pictures we are already happy
         self.assertLessEqual(self.left, 10000)
 
+    def test_acquire_partial(self):
+        """
+        Check that partial frames are sent during a long scan, with
+        MD_VALID_ROWS increasing, and ending with a complete frame
+        """
+        self.scanner.dwellTime.value = 20e-6  # s
+        expected_duration = self.compute_expected_duration()  # ~2.6 s
+        self.scanner.partialFramePeriod.value = 0.2  # s
+        self.partial_rows = []
+        self.partial_ims = []
+        self.left = 1
+
+        self.sed.data.subscribe(self.receive_partial_image)
+        self.acq_done.wait(2 + expected_duration * 1.1)
+        self.sed.data.unsubscribe(self.receive_partial_image)
+        self.scanner.partialFramePeriod.value = 0
+
+        self.assertTrue(self.acq_done.is_set())
+        self.assertGreater(len(self.partial_rows), 5)
+        self.assertEqual(self.partial_rows, sorted(self.partial_rows))
+        self.assertLess(self.partial_rows[-1], self.size[1])
+        # The frames received are not modified afterwards, and the rows not
+        # yet scanned are empty
+        for im, nrows in zip(self.partial_ims, self.partial_rows):
+            self.assertEqual(im[nrows:].max(), 0)
+
+        # .get() only returns complete frames
+        self.scanner.partialFramePeriod.value = 0.1
+        im = self.sed.data.get()
+        self.scanner.partialFramePeriod.value = 0
+        self.assertNotIn(model.MD_VALID_ROWS, im.metadata)
+        self.assertEqual(im.shape, self.size[::-1])
+
+    def receive_partial_image(self, dataflow, image):
+        """
+        callback for df of test_acquire_partial()
+        """
+        self.assertEqual(image.shape, self.size[-1:-3:-1])
+        if model.MD_VALID_ROWS in image.metadata:
+            self.partial_rows.append(image.metadata[model.MD_VALID_ROWS])
+            self.partial_ims.append(image)
+        else:
+            self.receive_image(dataflow, image)
+
     def receive_image(self, dataflow, image):
         """
         callback for df of test_acquire_flow()
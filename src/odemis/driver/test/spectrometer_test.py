@@ -136,6 +136,38 @@ class TestSimulated(unittest.TestCase):
         self.assertEqual(data.shape[0], 1)
         self.assertEqual(data.shape[-1::-1], self.spectrometer.resolution.value)
 
+    def test_sw_vbinning(self):
+        """
+        Test vertical binning bigger than what the detector can do in image
+        mode, but not the full height => some lines are summed in software
+        """
+        hw_maxb = self.detector.GetMaximumBinnings(andorcam2.AndorV2DLL.RM_IMAGE)[1]
+        binning = (1, hw_maxb * 2)
+        if binning[1] >= self.detector.resolution.range[1][1]:
+            self.skipTest("Detector too small for software binning")
+        self.spectrometer.binning.value = binning
+        self.assertEqual(self.spectrometer.binning.value, binning)
+        self.spectrometer.resolution.value = self.spectrometer.resolution.range[1]
+
+        data = self.spectrometer.data.get()
+        self.assertEqual(data.shape[-1::-1], self.spectrometer.resolution.value)
+        self.assertEqual(data.metadata[model.MD_BINNING], binning)
+
+    def test_line_rate(self):
+        self.spectrometer.exposureTime.value = 0.01  # s
+        self._cnt = 0
+        self.spectrometer.data.subscribe(self._on_spectrum)
+        time.sleep(1)
+        rate = self.spectrometer.lineRate.value
+        self.spectrometer.data.unsubscribe(self._on_spectrum)
+
+        self.assertGreater(rate, 0)
+        self.assertLessEqual(rate, self._cnt * 1.5)
+        self.assertEqual(self.spectrometer.lineRate.value, 0)
+
+    def _on_spectrum(self, df, data):
+        self._cnt += 1
+
 
 class TestSimulatedShamrock(TestSimulated):
     """
@@ -235,7 +267,9 @@ class TestCompositedSpectrometer(unittest.TestCase):
                    self.spectrometer.binning.range[1][1]] # max
         self.spectrometer.binning.value = binning
         self.spectrometer.resolution.value = self.spectrometer.resolution.range[1]
-        self.assertEqual(self.spectrometer.binning.value, tuple(binning))
+        # It might be rounded, if summed in software
+        self.assertLessEqual(self.spectrometer.binning.value[1], binning[1])
+        binning = list(self.spectrometer.binning.value)
 
         data = self.spectrometer.data.get()
         self.assertEqual(data.shape[-1::-1], self.spectrometer.resolution.value)
@@ -252,6 +286,24 @@ class TestCompositedSpectrometer(unittest.TestCase):
         md = data.metadata
         self.assertEqual(md[model.MD_BINNING], tuple(binning))
 
+#    @skip("simple")
+    def test_vbinning_rounded(self):
+        """
+        Test vertical binning not a multiple of the detector maximum binning
+        """
+        hw_maxb = self.spectrometer._hw_max_vbin
+        binning = (1, hw_maxb * 2 + 1)
+        if binning[1] > self.spectrometer.binning.range[1][1]:
+            self.skipTest("Detector can bin the whole height")
+
+        # The extra line cannot be summed
+        self.spectrometer.binning.value = binning
+        exp_binning = (1, hw_maxb * 2)
+        self.assertEqual(self.spectrometer.binning.value, exp_binning)
+
+        data = self.spectrometer.data.get()
+        self.assertEqual(data.metadata[model.MD_BINNING], exp_binning)
+
 #    @skip("simple")
     def test_hbinning(self):
         """
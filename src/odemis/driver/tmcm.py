@@ -1261,14 +1261,16 @@ class TMCLController(model.Actuator):
         self.temperature1._value = t1
         self.temperature1.notify(t1)
 
-    def _createMoveFuture(self):
+    def _createMoveFuture(self, axes):
         """
+        axes (set of str): the axes that are moved
         Return (CancellableFuture): a future that can be used to manage a move
         """
         f = CancellableFuture()
         f._moving_lock = threading.Lock() # taken while moving
         f._must_stop = threading.Event() # cancel of the current future requested
         f._was_stopped = False # if cancel was successful
+        f._move_axes = axes  # axes moved
         f.task_canceller = self._cancelCurrentMove
         return f
 
@@ -1290,7 +1292,7 @@ class TMCLController(model.Actuator):
         if not shift:
             return model.InstantaneousFuture()
 
-        f = self._createMoveFuture()
+        f = self._createMoveFuture(set(shift.keys()))
         f = self._executor.submitf(dependences, f, self._doMoveRel, f, shift)
         return f
 
@@ -1307,7 +1309,7 @@ class TMCLController(model.Actuator):
 
         pos = self._applyInversion(pos)
         dependences = set(pos.keys())
-        f = self._createMoveFuture()
+        f = self._createMoveFuture(set(pos.keys()))
         self._executor.submitf(dependences, f, self._doMoveAbs, f, pos)
         return f
     moveAbs.__doc__ = model.Actuator.moveAbs.__doc__
@@ -1412,6 +1414,8 @@ class TMCLController(model.Actuator):
             CancelledError: if cancelled before the end of the move
         """
         moving_axes = set(axes)
+        moved_names = set(n for n, i in self._name_to_axis.items() if i in axes)
+        pipelined = False  # True if the next move takes over
 
         last_upd = time.time()
         dur = max(0.01, min(end - last_upd, 60))
@@ -1455,9 +1459,35 @@ class TMCLController(model.Actuator):
                     self.MotorStop(i)
                 future._was_stopped = True
                 raise CancelledError()
+
+            # If the next move is already queued on all these axes (eg, it's
+            # the next point of a trajectory), it will update the position
+            # anyway => let it start immediately.
+            nf = self._executor.get_next_future(future)
+            if nf is not None and moved_names <= getattr(nf, "_move_axes", set()):
+                logging.debug("Skipping position update as next move continues on %s",
+                              moved_names)
+                pipelined = True
+                # If it's cancelled before starting, it will not update it
+                nf.add_done_callback(lambda f, axes=moved_names: self._onPipelinedMoveDone(f, axes))
         finally:
             # TODO: check if the move succeded ? (= Not failed due to stallguard/limit switch)
-            self._updatePosition() # update (all axes) with final position
+            # Only the axes which moved can have changed, and the position of
+            # each axis takes one query => don't read the other ones
+            if not pipelined:
+                self._updatePosition(moved_names)
+
+    def _onPipelinedMoveDone(self, future, axes):
+        """
+        Called when a move which followed directly another move is over.
+        Updates the position if it was cancelled before starting, as then
+        nothing read the position at the end of the previous move.
+        future (Future): the future of the move which followed
+        axes (set of str): the names of the axes moved by the previous move
+        """
+        if future.cancelled() and not future._was_stopped:
+            logging.debug("Pipelined move cancelled before starting, updating position of %s", axes)
+            self._updatePosition(axes)
 
     def _cancelCurrentMove(self, future):
         """
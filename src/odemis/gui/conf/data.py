@@ -157,6 +157,15 @@ HW_SETTINGS_CONFIG = {
                 "choices": util.resolution_from_range,
                 "accuracy": None,  # never simplify the numbers
             }),
+            ("partialFramePeriod", {
+                "label": "Partial update",
+                "tooltip": "Period at which the image is updated during a scan (0 to only show complete images)",
+                "control_type": odemis.gui.CONTROL_SLIDER,
+                "range": (0, 10),
+                "type": "float",
+                "accuracy": 2,
+                "event": wx.EVT_SCROLL_CHANGED
+            }),
             # what we don't want to display:
             ("power", {
                 "control_type": odemis.gui.CONTROL_NONE,
@@ -2822,7 +2822,7 @@ class Sparc2AlignTab(Tab):
                 # Take the first detector
                 for dname in fbaffects:
                     try:
-                        d = model.getComponent(name=dname)
+                        d = main_data.comps.getComponent(name=dname)
                     except LookupError:
                         logging.warning("Failed to find component %s affected by fiber-aligner", dname)
                         continue
@@ -3235,7 +3235,7 @@ class Sparc2AlignTab(Tab):
         # for focusing), and typically has a better performance for focus.
         for r in ("ccd", "sp-ccd"):
             try:
-                d = model.getComponent(role=r)
+                d = main.comps.getComponent(role=r)
             except LookupError:
                 continue
             if d.name in focuser.affects.value:
@@ -3255,7 +3255,7 @@ class Sparc2AlignTab(Tab):
             # spectrographs (with a focus)
             # Precisely, a selector would have multiple positions, with
             # each position corresponding to one of the detectors
-            sels = [model.getComponent(role="spec-det-selector")]
+            sels = [main.comps.getComponent(role="spec-det-selector")]
             selector = self._findSameAffects(sels, dets)
 
         return spgr, dets, selector
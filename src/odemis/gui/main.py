@@ -36,6 +36,7 @@ from odemis.util import driver
 import os
 import sys
 import threading
+import time
 import traceback
 import wx
 from wx.lib.pubsub import pub
@@ -85,9 +86,14 @@ class OdemisGUIApp(wx.App):
         l = logging.getLogger()
         self.log_level = l.getEffectiveLevel()
 
+        # To report how long it takes to start
+        self._start_time = time.time()
+        # ComponentDirectory of all the components of the microscope
+        self._comps = None
+
         if not self._is_standalone:
             try:
-                driver.speedUpPyroConnect(model.getMicroscope())
+                self._comps = driver.speedUpPyroConnect(model.getMicroscope())
             except Exception:
                 logging.exception("Failed to speed up start up")
 
@@ -149,7 +155,7 @@ class OdemisGUIApp(wx.App):
         # TODO: if microscope.ghost is not empty => wait and/or display a special
         # "hardware status" tab.
 
-        self.main_data = guimodel.MainGUIData(microscope)
+        self.main_data = guimodel.MainGUIData(microscope, self._comps)
         # Load the main frame
         self.main_frame = main_xrc.xrcfr_main(None)
 
@@ -316,6 +322,7 @@ class OdemisGUIApp(wx.App):
             self.main_frame.Maximize()  # must be done before Show()
             # making it very late seems to make it smoother
             wx.CallAfter(self.main_frame.Show)
+            wx.CallAfter(self._log_ready_time)
 
         except Exception:
             self.excepthook(*sys.exc_info())
@@ -324,6 +331,9 @@ class OdemisGUIApp(wx.App):
             # the program keeps running in the background.
             raise
 
+    def _log_ready_time(self):
+        logging.info("GUI ready after %g s", time.time() - self._start_time)
+
     @call_in_wx_main
     def on_debug_va(self, enabled):
         """
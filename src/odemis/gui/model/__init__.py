@@ -35,6 +35,7 @@ from odemis.model import (FloatContinuous, VigilantAttribute, IntEnumerated, Str
                           MD_POS, InstantaneousFuture, hasVA, StringEnumerated)
 from odemis.driver.actuator import ConvertStage
 from odemis.model import MD_PIXEL_SIZE_COR, MD_POS_COR, MD_ROTATION_COR
+from odemis.util.driver import ComponentDirectory
 import os
 import threading
 import time
@@ -136,17 +137,25 @@ class MainGUIData(object):
         "overview-light": "overview_light",
     }
 
-    def __init__(self, microscope):
+    def __init__(self, microscope, comps=None):
         """
         :param microscope: (model.Microscope or None): the root of the HwComponent tree
             provided by the back-end. If None, it means the interface is not
             connected to a microscope (and displays a recorded acquisition).
+        :param comps: (ComponentDirectory or None): the directory of all the
+            components of the microscope. If None, and a microscope is given,
+            it will be created.
 
         """
 
         self.microscope = microscope
         self.role = None
 
+        # ComponentDirectory to quickly find any component of the microscope
+        if microscope and comps is None:
+            comps = ComponentDirectory(microscope)
+        self.comps = comps
+
         # The following attributes are either HwComponents or None (if not available)
         self.ccd = None
         self.stage = None
@@ -197,9 +206,14 @@ class MainGUIData(object):
             for c in microscope.children.value:
                 try:
                     attrname = self._ROLE_TO_ATTR[c.role]
-                    setattr(self, attrname, c)
                 except KeyError:
-                    pass  # not interested by this component
+                    continue  # not interested by this component
+                # Use the same proxy as in the directory, as it's already connected
+                try:
+                    c = self.comps.getComponent(name=c.name)
+                except LookupError:
+                    pass
+                setattr(self, attrname, c)
 
             # Spectrograph is not directly a child, but a sub-comp of spectrometer
             # TODO: now it's also a direct child. Code can be removed once all installs have been updated
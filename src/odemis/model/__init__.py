@@ -32,6 +32,7 @@ from ._components import *
 from ._dataflow import *
 from ._core import *
 from ._metadata import *
+from ._zmqhub import getSubscriptionStats
 
 
 #__all__ = []
@@ -60,6 +60,11 @@ BACKEND_NAME = "backend" # the official name for the backend container
 
 _microscope = None
 
+# Index of the components, to find them quickly by name or role
+# It's automatically reset when the .alive VA of the microscope changes
+_comps_index = None  # None or (Microscope, set of Components, dict str -> Component, dict str -> Component)
+_comps_index_lock = threading.Lock()
+
 def getMicroscope():
     """
     return the microscope component managed by the backend
@@ -94,13 +99,50 @@ def getComponent(name=None, role=None):
     if name is None and role is None:
         raise ValueError("Need to specify at least a name or a role")
 
-    for c in getComponents():
-        if name is not None and c.name != name:
-            continue
-        if role is not None and c.role != role:
-            continue
-        return c
+    return _lookupComponent(_getComponentsIndex()[1:], name, role)
+
+
+def getComponents():
+    """
+    return (set of Component): all the HwComponents (alive) managed by the backend
+    """
+    return set(_getComponentsIndex()[1])
+    # return _getChildren(microscope)
+
+
+def _indexComponents(comps):
+    """
+    Creates an index of the components, to find them quickly by name or role
+    comps (set of Components): all the components to index
+    return (frozenset of Components, dict str -> Component,
+            dict str -> Component): all the components, the components by name,
+            and the components by role.
+    """
+    names = {}
+    roles = {}
+    for c in comps:
+        names[c.name] = c
+        # If multiple components have the same role, pick any of them
+        roles.setdefault(getattr(c, "role", None), c)
+    return frozenset(comps), names, roles
+
+
+def _lookupComponent(index, name=None, role=None):
+    """
+    Find a component in an index, according to its name or role.
+    index (tuple): as returned by _indexComponents()
+    name (str or None): name of the component to look for
+    role (str or None): role of the component to look for
+    return (Component): the component with the given name and/or role
+    raise LookupError: if no component with such a name/role is in the index
+    """
+    names, roles = index[1:]
+    if name is not None:
+        c = names.get(name)
     else:
+        c = roles.get(role)
+
+    if c is None or (role is not None and c.role != role):
         errors = []
         if name is not None:
             errors.append("name %s" % name)
@@ -108,14 +150,43 @@ def getComponent(name=None, role=None):
             errors.append("role %s" % role)
         raise LookupError("No component with the %s" % (" and ".join(errors),))
 
+    return c
 
-def getComponents():
+
+def _onAlive(alive):
     """
-    return (set of Component): all the HwComponents (alive) managed by the backend
+    Called when the list of components alive changes
+    """
+    global _comps_index
+    with _comps_index_lock:
+        _comps_index = None
+
+
+def _getComponentsIndex():
+    """
+    Returns the index of all the components, and (re)creates it if needed
+    return (Microscope, set of Components, dict str -> Component,
+            dict str -> Component): the microscope, all the components, the
+            components by name, and the components by role.
     """
+    global _comps_index
     microscope = getMicroscope()
-    return microscope.alive.value | {microscope}
-    # return _getChildren(microscope)
+    with _comps_index_lock:
+        index = _comps_index
+        if index is not None and index[0] is microscope:
+            return index
+
+        # Subscribe before reading the value, to not miss any change.
+        # (Subscribing again the same listener has no effect)
+        try:
+            microscope.alive.subscribe(_onAlive)
+        except Exception:
+            logging.warning("Failed to follow the components alive, index will not be updated",
+                            exc_info=True)
+
+        comps = microscope.alive.value | {microscope}
+        _comps_index = (microscope,) + _indexComponents(comps)
+        return _comps_index
 
 
 def _getChildren(root):
@@ -27,6 +27,7 @@ losslessly and with metadata attached (see _metadata for the conventional ones).
 from __future__ import division
 
 import Pyro4
+import Queue
 import inspect
 import logging
 import numpy
@@ -37,7 +38,17 @@ import threading
 import time
 import zmq
 
-from . import _core
+from . import _core, _zmqhub
+
+
+# Topics of the messages sent over 0MQ by the DataFlows. The topic of the
+# replies to get() is this prefix + the name of the proxy + "\0" (so that no
+# topic is the prefix of another one).
+_TOPIC_DATA = "D"
+_TOPIC_GET_PREFIX = "G"
+
+# Maximum time to wait for the reply of get() over 0MQ, after it was sent
+_GET_REPLY_TIMEOUT = 10  # s
 
 
 class DataArray(numpy.ndarray):
@@ -202,6 +213,9 @@ class DataFlow(DataFlowBase):
         self._global_name = None # to be filled when registered
         self._ctx = None
         self.pipe = None
+        # The pipe is used from the notify() thread and the Pyro threads
+        # (for get()), and the messages are multi-part => one at a time
+        self._pipe_lock = threading.Lock()
         self._max_discard = max_discard
 
     def _getproxystate(self):
@@ -282,7 +296,7 @@ class DataFlow(DataFlowBase):
         """
         Acquires one image and return it
         asap (boolean): if True, returns the first image received, otherwise
-         ensures that the image has been acquired after the call to this function 
+         ensures that the image has been acquired after the call to this function
         return (DataArray)
         Default implementation: it subscribes and, after receiving the first
          image, unsubscribes. It's inefficient but simple and works in every case.
@@ -296,6 +310,8 @@ class DataFlow(DataFlowBase):
         data_shared = [None] # in python2 we need to create a new container object
 
         def receive_one_image(df, data, min_time=min_time):
+            if _metadata.MD_VALID_ROWS in data.metadata:
+                return  # partial frame, wait for the complete one
             if data.metadata.get(_metadata.MD_ACQ_DATE, float("inf")) >= min_time:
                 df.unsubscribe(receive_one_image)
                 data_shared[0] = data
@@ -341,8 +357,22 @@ class DataFlow(DataFlowBase):
     def notify(self, data):
         # publish the data remotely
         if self.pipe and len(self._remote_listeners) > 0:
-            # TODO thread-safe for self.pipe ?
-            dformat = {"dtype": str(data.dtype), "shape": data.shape}
+            self._send_array(_TOPIC_DATA, {}, data)
+
+        # publish locally
+        DataFlowBase.notify(self, data)
+
+    def _send_array(self, topic, dformat, data):
+        """
+        Sends a DataArray over the 0MQ pipe
+        topic (str): topic of the message, to select the receivers
+        dformat (dict): extra information to pass in the format
+        data (DataArray): the data to send
+        """
+        dformat = dict(dformat)
+        dformat.update({"dtype": str(data.dtype), "shape": data.shape})
+        with self._pipe_lock:
+            self.pipe.send(topic, zmq.SNDMORE)
             self.pipe.send_pyobj(dformat, zmq.SNDMORE)
             self.pipe.send_pyobj(data.metadata, zmq.SNDMORE)
             try:
@@ -359,8 +389,32 @@ class DataFlow(DataFlowBase):
                 data = numpy.require(data, requirements=["C_CONTIGUOUS"])
                 self.pipe.send(numpy.getbuffer(data), copy=False)
 
-        # publish locally
-        DataFlowBase.notify(self, data)
+    # The next two methods are only for the DataFlowProxy
+    def _publish_get(self, topic, req, asap=True):
+        """
+        Acquires one image (via .get()) and sends it over the 0MQ pipe.
+        It's much more efficient than returning it via Pyro.
+        topic (str): topic of the message, to which the proxy subscribed
+        req (int): request number, passed back in the message
+        asap (boolean): see .get()
+        """
+        # Some DataFlows override get() without the asap argument
+        if asap:
+            data = self.get()
+        else:
+            data = self.get(asap=False)
+        self._send_array(topic, {"req": req}, data)
+
+    def _publish_ping(self, topic, req):
+        """
+        Sends an empty message over the 0MQ pipe, to check the proxy is ready
+        to receive the messages of the given topic.
+        topic (str): topic of the message, to which the proxy subscribed
+        req (int): request number, passed back in the message
+        """
+        with self._pipe_lock:
+            self.pipe.send(topic, zmq.SNDMORE)
+            self.pipe.send_pyobj({"req": req, "ping": True})
 
     def __del__(self):
         if self._count_listeners() > 0:
@@ -387,9 +441,16 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
         DataFlowBase.__init__(self)
         self.max_discard = max_discard
 
-        self._ctx = None
-        self._commands = None
-        self._thread = None
+        self._subscription = None
+        self._init_get()
+
+    def _init_get(self):
+        # For the one-shot subscription of get()
+        self._get_topic = _TOPIC_GET_PREFIX + self._proxy_name + "\0"
+        self._get_lock = threading.Lock()  # one get() at a time
+        self._get_subscription = None
+        self._get_replies = Queue.Queue()  # (req, DataArray or None)
+        self._get_req = 0  # last request number
 
     def __getstate__(self):
         # must permit to recreate a proxy to a data-flow in a different container
@@ -405,30 +466,94 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
         self._proxy_name = "%x/%x" % (os.getpid(), id(self))
         DataFlowBase.__init__(self)
 
-        self._ctx = None
-        self._commands = None
-        self._thread = None
+        self._subscription = None
+        self._init_get()
 
-    # .get() is a direct remote call
+    def get(self, asap=True):
+        """
+        Acquires one image and return it
+        asap (boolean): if True, returns the first image received, otherwise
+         ensures that the image has been acquired after the call to this function
+        return (DataArray)
+        The remote DataFlow runs get(), and sends the data over the 0MQ data
+        channel, like when subscribed (which avoids copies and the Pyro
+        serialization of big arrays).
+        """
+        with self._get_lock:
+            if not self._get_subscription:
+                self._create_get_subscription()
+
+            self._get_req += 1
+            req = self._get_req
+            # Returns only after the data is sent
+            Pyro4.Proxy.__getattr__(self, "_publish_get")(self._get_topic, req, asap)
+            received, data = self._wait_get_reply(req, _GET_REPLY_TIMEOUT)
+            if not received:
+                raise IOError("Data from get() of dataflow '%s' not received" %
+                              (self._global_name,))
+            return data
+
+    def _create_get_subscription(self):
+        """
+        Subscribe to the topic for the get() replies, and wait until it's
+        effective (0MQ subscriptions are asynchronous).
+        """
+        hub = _zmqhub.getSubscriptionHub()
+        # Direct, so that the replies are never blocked by the listeners of the
+        # other subscriptions (_on_get_reply() just queues the reply).
+        self._get_subscription = hub.register(self._global_name, self._on_get_reply,
+                                              0, _receiveGetReply, self._get_topic,
+                                              direct=True)
+        hub.subscribe(self._get_subscription)
+
+        # Wait until the publisher sends the messages to us
+        for i in range(50):
+            self._get_req += 1
+            Pyro4.Proxy.__getattr__(self, "_publish_ping")(self._get_topic, self._get_req)
+            if self._wait_get_reply(self._get_req, 0.1)[0]:
+                logging.debug("Subscription for get() of dataflow %s ready after %d pings",
+                              self._global_name, i + 1)
+                return
+        hub.unregister(self._get_subscription)
+        self._get_subscription = None
+        raise IOError("Failed to subscribe to dataflow '%s'" % (self._global_name,))
+
+    def _on_get_reply(self, msg):
+        self._get_replies.put(msg)
+
+    def _wait_get_reply(self, req, timeout):
+        """
+        Wait for the reply of the given request. Older replies are dropped.
+        req (int): the request number
+        timeout (float): maximum time to wait (s)
+        returns (bool, DataArray or None): whether the reply was received, and
+          the data (None for pings)
+        """
+        tend = time.time() + timeout
+        while True:
+            try:
+                r, data = self._get_replies.get(timeout=max(0, tend - time.time()))
+            except Queue.Empty:
+                return False, None
+            if r == req:
+                return True, data
+            logging.debug("Dropping old reply %d of get() of dataflow %s", r, self._global_name)
 
     # next three methods are directly from DataFlowBase
     #.subscribe()
     #.unsubscribe()
     #.notify()
 
-    def _create_thread(self):
-        self._ctx = zmq.Context(1) # apparently 0MQ reuse contexts
-        self._commands = self._ctx.socket(zmq.PAIR)
-        self._commands.bind("inproc://" + self._global_name)
-        self._thread = SubscribeProxyThread(self.notify, self._global_name, self.max_discard, self._ctx)
-        self._thread.start()
+    def _create_subscription(self):
+        self._subscription = _zmqhub.getSubscriptionHub().register(
+                    self._global_name, self.notify, self.max_discard,
+                    _receiveDataArray, _TOPIC_DATA)
 
     def start_generate(self):
         # start the remote subscription
-        if not self._thread:
-            self._create_thread()
-        self._commands.send("SUB")
-        self._commands.recv() # synchronise
+        if not self._subscription:
+            self._create_subscription()
+        _zmqhub.getSubscriptionHub().subscribe(self._subscription)
 
         # send subscription to the actual dataflow
         # a bit tricky because the underlying method gets created on the fly
@@ -438,25 +563,22 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
     def stop_generate(self):
         # stop the remote subscription
         Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._proxy_name)
-        self._commands.send("UNSUB") # asynchronous (necessary to not deadlock)
+        # asynchronous (necessary to not deadlock)
+        _zmqhub.getSubscriptionHub().unsubscribe(self._subscription)
 
     def __del__(self):
         try:
-            # end the thread (but it will stop as soon as it notices we are gone anyway)
-            if self._thread:
-                if self._thread.is_alive():
-                    if len(self._listeners):
-                        if logging:
-                            logging.debug("Stopping subscription while there "
-                                          "are still subscribers because dataflow '%s' is going out of context",
-                                          self._global_name)
-                        Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._proxy_name)
-                    self._commands.send("STOP")
-                    self._thread.join(1)
-                self._commands.close()
-                # Not needed: called when garbage-collected and it's dangerous
-                # as it blocks until all connections are closed.
-                # self._ctx.term()
+            # stop the subscription (but it will stop as soon as it notices we are gone anyway)
+            if self._subscription:
+                if len(self._listeners):
+                    if logging:
+                        logging.debug("Stopping subscription while there "
+                                      "are still subscribers because dataflow '%s' is going out of context",
+                                      self._global_name)
+                    Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._proxy_name)
+                _zmqhub.getSubscriptionHub().unregister(self._subscription)
+            if self._get_subscription:
+                _zmqhub.getSubscriptionHub().unregister(self._get_subscription)
         except Exception:
             pass
         try:
@@ -465,114 +587,49 @@ class DataFlowProxy(DataFlowBase, Pyro4.Proxy):
             pass # don't be too rough if that fails, it's not big deal anymore
 
 
-class SubscribeProxyThread(threading.Thread):
-    def __init__(self, notifier, uri, max_discard, zmq_ctx):
-        """
-        notifier (callable): method to call when a new array arrives
-        uri (string): unique string to identify the connection
-        max_discard (int)
-        zmq_ctx (0MQ context): available 0MQ context to use
-        """
-        threading.Thread.__init__(self, name="zmq for dataflow " + uri)
-        self.daemon = True
-        self.uri = uri
-        self.max_discard = max_discard
-        self._ctx = zmq_ctx
-        # don't keep strong reference to notifier so that it can be garbage
-        # collected normally and it will let us know then that we can stop
-        self.w_notifier = WeakMethod(notifier)
-
-        # create a zmq synchronised channel to receive _commands
-        self._commands = zmq_ctx.socket(zmq.PAIR)
-        self._commands.connect("inproc://" + uri)
-
-        # create a zmq subscription to receive the data
-        self._data = zmq_ctx.socket(zmq.SUB)
-        self._data.connect("ipc://" + uri)
-        # TODO find out if it does something and if it does, depend on max_discard
-#        self.data.hwm = 1 # drop message silently if there is already one in the queue
-        self._data.hwm = 0  # FIXME currently set to 0 in order to avoid discarding when not wanted
-
-        # TODO: we need a more advance support for max_discards to be able to
-        # ensure all the data is received when the client needs it.
-        # API should be either:
-        #  *  .max_discard = XXX (= per dataflow)
-        #  * .subscribe(callback, discard=True) (per subscriber)
-
-    def run(self):
-        """
-        Process messages for commands and data
-        """
-        # Warning: this might run even when ending (aka "in a __del__() state")
-        # Which means: logging might be None, and zmq might not be working
-        # normally (apparently zmq.POLLIN == None during this time).
-        try:
-            poller = zmq.Poller()
-            poller.register(self._commands, zmq.POLLIN)
-            poller.register(self._data, zmq.POLLIN)
-            discarded = 0
-            while True:
-                socks = dict(poller.poll())
-
-                # process commands
-                if self._commands in socks:
-                    message = self._commands.recv()
-                    if message == "SUB":
-                        self._data.setsockopt(zmq.SUBSCRIBE, '')
-                        logging.debug("Subscribed to remote dataflow %s", self.uri)
-                        self._commands.send("SUBD")
-                    elif message == "UNSUB":
-                        self._data.setsockopt(zmq.UNSUBSCRIBE, '')
-                        if logging:
-                            logging.debug("Unsubscribed from remote dataflow %s", self.uri)
-                        # no confirmation (async)
-                    elif message == "STOP":
-                        return
-                    else:
-                        logging.warning("Received unknown message %s", message)
-
-                # receive data
-                if self._data in socks:
-                    # TODO: be more resilient if wrong data is received (can
-                    # block forever)
-                    array_format = self._data.recv_pyobj()
-                    array_md = self._data.recv_pyobj()
-                    array_buf = self._data.recv(copy=False)
-                    # logging.debug("Received new DataArray over ZMQ for %s", self.uri)
-                    # more fresh data already?
-                    if (self._data.getsockopt(zmq.EVENTS) & zmq.POLLIN and
-                        discarded < self.max_discard):
-                        discarded += 1
-                        # logging.debug("Discarding object received as a newer one is available")
-                        continue
-                    # TODO: only log the accumulated number every second, to avoid log flooding
-#                     if discarded:
-#                         logging.debug("Dataflow %s dropped %d arrays", self.uri, discarded)
-                    discarded = 0
-                    # TODO: any need to use zmq.utils.rebuffer.array_from_buffer()?
-                    if len(array_buf):
-                        array = numpy.frombuffer(array_buf, dtype=array_format["dtype"])
-                    else: # frombuffer doesn't support zero length array
-                        array = numpy.empty((0,), dtype=array_format["dtype"])
-                    array.shape = array_format["shape"]
-                    darray = DataArray(array, metadata=array_md)
-
-                    try:
-                        self.w_notifier(darray)
-                    except WeakRefLostError:
-                        return  # It's a sign there is nothing left to do
-        except:
-            if logging:
-                logging.exception("Ending ZMQ thread due to exception")
-        finally:
-            try:
-                self._commands.close()
-            except:
-                print "Exception closing ZMQ commands connection"
-            try:
-                self._data.close()
-            except:
-                print "Exception closing ZMQ data connection"
+def _decodeDataArray(sock, array_format):
+    """
+    Receives the rest of a DataArray message
+    sock (0MQ socket)
+    array_format (dict): the format, already received
+    returns (DataArray): the data, sharing the memory of the 0MQ message
+    """
+    # TODO: be more resilient if wrong data is received (can block forever)
+    array_md = sock.recv_pyobj()
+    array_buf = sock.recv(copy=False)
+    # TODO: any need to use zmq.utils.rebuffer.array_from_buffer()?
+    if len(array_buf):
+        array = numpy.frombuffer(array_buf, dtype=array_format["dtype"])
+    else: # frombuffer doesn't support zero length array
+        array = numpy.empty((0,), dtype=array_format["dtype"])
+    array.shape = array_format["shape"]
+    return DataArray(array, metadata=array_md)
+
+
+def _receiveDataArray(sock):
+    """
+    Receives one DataArray published by a DataFlow
+    sock (0MQ socket)
+    returns (DataArray): the new data
+    """
+    sock.recv()  # topic
+    array_format = sock.recv_pyobj()
+    return _decodeDataArray(sock, array_format)
+
+
+def _receiveGetReply(sock):
+    """
+    Receives one reply of DataFlow._publish_get() or _publish_ping()
+    sock (0MQ socket)
+    returns (int, DataArray or None): the request number, and the data (None
+      for a ping)
+    """
+    sock.recv()  # topic
+    array_format = sock.recv_pyobj()
+    if array_format.get("ping"):
+        return array_format["req"], None
+    return array_format["req"], _decodeDataArray(sock, array_format)
+
 
 def unregister_dataflows(self):
     # Only for the "DataFlow"s, the real objects, not the proxys
@@ -26,7 +26,33 @@ import threading
 import time
 
 
-class CancellableThreadPoolExecutor(ThreadPoolExecutor):
+class _QueueingExecutorMixin(object):
+    """
+    For executors which keep track of the futures not yet finished in
+    ._queue, in the order they were submitted.
+    """
+
+    def get_next_future(self, f):
+        """
+        Return the next future submitted after the given future.
+        The order is the one that was used to submit the work. Note that if the
+        executor runs tasks in parallel, it is not necessarily executed after
+        the given future.
+        f (Future): a scheduled future
+        return (Future or None): the next future or None if no task is
+          scheduled after the given future.
+        """
+        with self._shutdown_lock:
+            ffound = False
+            for schedf in self._queue:
+                if ffound:
+                    return schedf
+                elif schedf is f:
+                    ffound = True
+            return None
+
+
+class CancellableThreadPoolExecutor(_QueueingExecutorMixin, ThreadPoolExecutor):
     """
     An extended ThreadPoolExecutor that can cancel all the jobs not yet started.
     It also allows non standard Future to be created.
@@ -98,25 +124,8 @@ class CancellableThreadPoolExecutor(ThreadPoolExecutor):
                 # the task raised an exception => we don't care
                 pass
 
-    def get_next_future(self, f):
-        """
-        Return the next future scheduled after the given future.
-        The order is the one that was used to submit the work.
-        f (Future): a scheduled future
-        return (Future or None): the next future or None if no task is
-          scheduled after the given future.
-        """
-        with self._shutdown_lock:
-            ffound = False
-            for schedf in self._queue:
-                if ffound:
-                    return schedf
-                elif schedf is f:
-                    ffound = True
-            return None
-
 
-class ParallelThreadPoolExecutor(ThreadPoolExecutor):
+class ParallelThreadPoolExecutor(_QueueingExecutorMixin, ThreadPoolExecutor):
     """
     An extended ThreadPoolExecutor that can execute multiple jobs in parallel
     -if not on the same dependences set.
@@ -67,6 +67,11 @@ MD_EBEAM_SPOT_DIAM = "Electron beam spot diameter" # m (float), approximate diam
 MD_WL_POLYNOMIAL = "Wavelength polynomial" # m, m/px, m/px²... (list of float), polynomial to convert from a pixel number of a spectrum to the wavelength
 MD_WL_LIST = "Wavelength list" # m... (list of float), wavelength for each pixel. The list is the same length as the C dimension
 
+# Only present on images which are still being acquired (progressive scanning):
+# the rows after this index are not yet acquired, and will be sent again later
+# in a complete image (without this metadata).
+MD_VALID_ROWS = "Valid rows"  # 0 <= int, number of rows (from the top) which contain acquired data
+
 MD_PIXEL_DUR = "Pixel duration"  # Time duration of a 'pixel' along the time dimension
 MD_TIME_OFFSET = "Time offset"  # Time of the first 'pixel' in the time dimension (added to ACQ_DATE), default is 0
 
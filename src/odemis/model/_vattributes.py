@@ -34,7 +34,7 @@ import zmq
 
 from odemis.util.weak import WeakMethod, WeakRefLostError
 
-from . import _core
+from . import _core, _zmqhub
 
 
 class NotSettableError(AttributeError):
@@ -333,9 +333,7 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         self.max_discard = 100
         self.readonly = False # will be updated in __setstate__
 
-        self._ctx = None
-        self._commands = None
-        self._thread = None
+        self._subscription = None
 
     @property
     def value(self):
@@ -391,17 +389,12 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
 
         self._global_name = self._pyroUri.sockname + "@" + self._pyroUri.object
 
-        self._ctx = None
-        self._commands = None
-        self._thread = None
+        self._subscription = None
 
-    def _create_thread(self):
-        logging.debug("Creating thread for VA %s", self._global_name)
-        self._ctx = zmq.Context(1) # apparently 0MQ reuse contexts
-        self._commands = self._ctx.socket(zmq.PAIR)
-        self._commands.bind("inproc://" + self._global_name)
-        self._thread = SubscribeProxyThread(self.notify, self._global_name, self.max_discard, self._ctx)
-        self._thread.start()
+    def _create_subscription(self):
+        logging.debug("Creating subscription for VA %s", self._global_name)
+        self._subscription = _zmqhub.getSubscriptionHub().register(
+                   self._global_name, self.notify, self.max_discard, _receiveValue)
 
     def subscribe(self, listener, init=False, **kwargs):
         count_before = len(self._listeners)
@@ -416,10 +409,9 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         """
         start the remote subscription
         """
-        if not self._thread:
-            self._create_thread()
-        self._commands.send("SUB")
-        self._commands.recv() # synchronise
+        if not self._subscription:
+            self._create_subscription()
+        _zmqhub.getSubscriptionHub().subscribe(self._subscription)
 
         # send subscription to the actual VA
         # a bit tricky because the underlying method gets created on the fly
@@ -435,23 +427,19 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
         stop the remote subscription
         """
         Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._global_name)
-        if self._commands:
-            self._commands.send("UNSUB")
+        if self._subscription:
+            _zmqhub.getSubscriptionHub().unsubscribe(self._subscription)
 
     def __del__(self):
-        # end the thread (but it will stop as soon as it notices we are gone anyway)
+        # stop the subscription (but it will stop as soon as it notices we are gone anyway)
         try:
-            if self._thread:
-                if self._thread.is_alive():
-                    if len(self._listeners):
-                        logging.warning("Stopping subscription while there are still subscribers "
-                                        "because VA '%s' is going out of context",
-                                        self._global_name)
-                        Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._global_name)
-                    self._commands.send("STOP")
-                    self._thread.join(1)
-                self._commands.close()
-            # self._ctx.term()
+            if self._subscription:
+                if len(self._listeners):
+                    logging.warning("Stopping subscription while there are still subscribers "
+                                    "because VA '%s' is going out of context",
+                                    self._global_name)
+                    Pyro4.Proxy.__getattr__(self, "unsubscribe")(self._global_name)
+                _zmqhub.getSubscriptionHub().unregister(self._subscription)
         except Exception:
             pass
 
@@ -461,74 +449,13 @@ class VigilantAttributeProxy(VigilantAttributeBase, Pyro4.Proxy):
             pass  # don't be too rough if that fails, it's not big deal anymore
 
 
-class SubscribeProxyThread(threading.Thread):
-    def __init__(self, notifier, uri, max_discard, zmq_ctx):
-        """
-        notifier (callable): method to call when a new value arrives
-        uri (string): unique string to identify the connection
-        max_discard (int)
-        zmq_ctx (0MQ context): available 0MQ context to use
-        """
-        threading.Thread.__init__(self, name="zmq for VA " + uri)
-        self.daemon = True
-        self.uri = uri
-        self.max_discard = max_discard
-        self._ctx = zmq_ctx
-        # don't keep strong reference to notifier so that it can be garbage
-        # collected normally and it will let us know then that we can stop
-        self.w_notifier = WeakMethod(notifier)
-
-        # create a zmq synchronised channel to receive commands
-        self._commands = zmq_ctx.socket(zmq.PAIR)
-        self._commands.connect("inproc://" + uri)
-
-        # create a zmq subscription to receive the data
-        self.data = zmq_ctx.socket(zmq.SUB)
-        self.data.connect("ipc://" + uri)
-
-    def run(self):
-        # Process messages for commands and data
-        poller = zmq.Poller()
-        poller.register(self._commands, zmq.POLLIN)
-        poller.register(self.data, zmq.POLLIN)
-        discarded = 0
-        while True:
-            socks = dict(poller.poll())
-
-            # process commands
-            if socks.get(self._commands) == zmq.POLLIN:
-                message = self._commands.recv()
-                if message == "SUB":
-                    self.data.setsockopt(zmq.SUBSCRIBE, '')
-                    self._commands.send("SUBD")
-                elif message == "UNSUB":
-                    self.data.setsockopt(zmq.UNSUBSCRIBE, '')
-                    # no confirmation (async)
-                elif message == "STOP":
-                    self._commands.close()
-                    self.data.close()
-                    return
-
-            # receive data
-            if socks.get(self.data) == zmq.POLLIN:
-                value = self.data.recv_pyobj()
-                # more fresh data already?
-                if (
-                        self.data.getsockopt(zmq.EVENTS) & zmq.POLLIN and
-                        discarded < self.max_discard
-                ):
-                    discarded += 1
-                    continue
-                if discarded:
-                    logging.debug("VA discarded %d values", discarded)
-                discarded = 0
-
-                try:
-                    self.w_notifier(value)
-                except WeakRefLostError:
-                    self._commands.close()
-                    self.data.close()
-                    return
+def _receiveValue(sock):
+    """
+    Receives one value published by a VigilantAttribute
+    sock (0MQ socket)
+    returns (object): the new value
+    """
+    return sock.recv_pyobj()
 
 
 def unregister_vigilant_attributes(self):
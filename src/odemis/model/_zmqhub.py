@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+# Reception of the VA and DataFlow updates on the proxies. All the
+# subscriptions of a process share the same 0MQ context and the same thread
+# polling all the sockets. The notifications are passed to a few dispatch
+# threads, so that a slow listener doesn't block all the other proxies.
+
+from __future__ import division
+
+import Queue
+import collections
+import logging
+import os
+import threading
+import time
+import zmq
+
+from odemis.util.weak import WeakMethod, WeakRefLostError
+
+
+DISPATCH_THREADS = 4  # Number of threads calling the listeners
+MAX_RECV_BURST = 64  # Max messages received in a row from the same socket
+
+
+class Subscription(object):
+    """
+    Represents the connection of one proxy to the 0MQ publisher of its remote
+    VA or DataFlow. To be created via SubscriptionHub.register().
+    """
+    def __init__(self, uri, notifier, max_discard, receiver, topic="", direct=False):
+        self.uri = uri
+        self.topic = topic
+        self.direct = direct
+        # don't keep strong reference to notifier so that it can be garbage
+        # collected normally and it will let us know then that we can stop
+        self.w_notifier = WeakMethod(notifier)
+        self.max_discard = max_discard
+        self.receiver = receiver
+        self.socket = None  # Only accessed from the hub thread
+
+        # All protected by the dispatch lock of the hub
+        self.active = True
+        self.pending = collections.deque()  # (time of reception, value)
+        self.scheduled = False  # True if in the dispatch queue, or being dispatched
+
+        # Statistics
+        self.received = 0
+        self.discarded = 0
+        self.dispatched = 0
+        self.latency_total = 0  # s, time between reception and notification
+        self.latency_max = 0  # s
+        self.duration_total = 0  # s, time spent in the notifier
+
+
+class SubscriptionHub(object):
+    """
+    Receives the messages of all the subscriptions of the process, and calls
+    the corresponding notifiers.
+    Use getSubscriptionHub() to get the hub of the current process.
+    """
+    def __init__(self, dispatch_threads=DISPATCH_THREADS):
+        self._ctx = zmq.Context(1)
+        self._subs = set()  # Subscriptions registered (and not yet removed)
+
+        # Commands to the hub thread, which owns all the sockets. 0MQ sockets
+        # are not thread-safe, so the waking up socket is protected by a lock.
+        self._commands = Queue.Queue()
+        wake_uri = "inproc://subscription hub %x" % (id(self),)
+        # Reentrant, because __del__ of a proxy (which unregisters) can happen anytime
+        self._wake_lock = threading.RLock()
+        self._wake_send = self._ctx.socket(zmq.PAIR)
+        self._wake_send.bind(wake_uri)
+        self._wake_recv = self._ctx.socket(zmq.PAIR)
+        self._wake_recv.connect(wake_uri)
+
+        self._dispatch_lock = threading.RLock()
+        self._ready = Queue.Queue()  # Subscriptions with values to notify
+
+        self._thread = threading.Thread(target=self._runHub,
+                                        name="zmq subscription hub")
+        self._thread.daemon = True
+        self._thread.start()
+
+        self._dispatchers = []
+        for i in range(dispatch_threads):
+            t = threading.Thread(target=self._runDispatcher,
+                                 name="zmq subscription dispatcher %d" % (i,))
+            t.daemon = True
+            t.start()
+            self._dispatchers.append(t)
+
+    def register(self, uri, notifier, max_discard, receiver, topic="", direct=False):
+        """
+        Connect to a publisher. Nothing is received until subscribe() is called.
+        uri (str): unique string to identify the connection (the ipc file)
+        notifier (callable): method to call when a new value arrives
+        max_discard (int): amount of messages that can be discarded in a row if
+          a new one is already available.
+        receiver (callable socket -> value): function to receive one value
+          from the socket.
+        topic (str): only the messages starting with this topic are received
+        direct (bool): if True, the notifier is called directly from the hub
+          thread, instead of going through the dispatchers. No value is ever
+          discarded. Only for notifiers which return immediately (and never
+          block), so that the values are not delayed by the other subscriptions.
+        returns (Subscription): to be passed to the other methods
+        """
+        sub = Subscription(uri, notifier, max_discard, receiver, topic, direct)
+        self._sendCommand("ADD", sub, wait=True)
+        return sub
+
+    def subscribe(self, sub):
+        """
+        Start receiving the values. It returns when it is effective, so the
+        publisher can be asked to start sending right after.
+        """
+        self._sendCommand("SUB", sub, wait=True)
+
+    def unsubscribe(self, sub):
+        """
+        Stop receiving the values (asynchronous)
+        """
+        self._sendCommand("UNSUB", sub)
+
+    def unregister(self, sub):
+        """
+        Disconnect from the publisher, and stop notifying (asynchronous).
+        The subscription cannot be used anymore afterwards.
+        """
+        with self._dispatch_lock:
+            sub.active = False
+            sub.pending.clear()
+        self._sendCommand("REMOVE", sub)
+
+    def getStats(self):
+        """
+        Gives information on the current state of the hub, useful for profiling
+        returns (dict str -> value): with the keys:
+          threads (int): number of threads used by the hub
+          sockets (int): number of sockets opened by the hub
+          subscriptions (dict str -> dict str -> number): uri -> statistics of
+            the subscription (received, discarded, dispatched, pending,
+            latency_avg (s), latency_max (s), duration_avg (s)). Latency is the
+            time between the reception and the call to the notifier.
+        """
+        subs = {}
+        with self._dispatch_lock:
+            for s in self._subs:
+                n = max(1, s.dispatched)
+                subs[s.uri] = {"received": s.received,
+                               "discarded": s.discarded,
+                               "dispatched": s.dispatched,
+                               "pending": len(s.pending),
+                               "latency_avg": s.latency_total / n,
+                               "latency_max": s.latency_max,
+                               "duration_avg": s.duration_total / n,
+                               }
+        return {"threads": 1 + len(self._dispatchers),
+                "sockets": 2 + len(subs),
+                "subscriptions": subs}
+
+    def _sendCommand(self, cmd, sub, wait=False):
+        done = threading.Event() if wait else None
+        self._commands.put((cmd, sub, done))
+        with self._wake_lock:
+            self._wake_send.send("")
+        if done:
+            done.wait()
+
+    def _processCommands(self, poller, sockets):
+        """
+        Run all the commands waiting. Only called from the hub thread.
+        """
+        while True:
+            try:
+                cmd, sub, done = self._commands.get(block=False)
+            except Queue.Empty:
+                return
+
+            try:
+                if cmd == "ADD":
+                    sub.socket = self._ctx.socket(zmq.SUB)
+                    # Never drop messages in 0MQ, the discarding is done
+                    # according to max_discard, before notifying.
+                    sub.socket.hwm = 0
+                    sub.socket.connect("ipc://" + sub.uri)
+                    poller.register(sub.socket, zmq.POLLIN)
+                    sockets[sub.socket] = sub
+                    with self._dispatch_lock:
+                        self._subs.add(sub)
+                elif cmd == "SUB":
+                    sub.socket.setsockopt(zmq.SUBSCRIBE, sub.topic)
+                    logging.debug("Subscribed to remote %s", sub.uri)
+                elif cmd == "UNSUB":
+                    if sub.socket:
+                        sub.socket.setsockopt(zmq.UNSUBSCRIBE, sub.topic)
+                elif cmd == "REMOVE":
+                    self._closeSocket(poller, sockets, sub)
+                else:
+                    logging.warning("Received unknown command %s", cmd)
+            except Exception:
+                logging.exception("Failed to run command %s on %s", cmd, sub.uri)
+            finally:
+                if done:
+                    done.set()
+
+    def _closeSocket(self, poller, sockets, sub):
+        with self._dispatch_lock:
+            self._subs.discard(sub)
+        if sub.socket is None:
+            return
+        poller.unregister(sub.socket)
+        del sockets[sub.socket]
+        sub.socket.close()
+        sub.socket = None
+
+    def _runHub(self):
+        """
+        Receives all the messages from the sockets
+        """
+        # Warning: this might run even when ending (aka "in a __del__() state")
+        # Which means: logging might be None, and zmq might not be working
+        # normally (apparently zmq.POLLIN == None during this time).
+        try:
+            poller = zmq.Poller()
+            poller.register(self._wake_recv, zmq.POLLIN)
+            sockets = {}  # socket -> Subscription
+            while True:
+                socks = dict(poller.poll())
+
+                if self._wake_recv in socks:
+                    self._wake_recv.recv()
+                    self._processCommands(poller, sockets)
+
+                for s in socks:
+                    sub = sockets.get(s)
+                    if sub is None:
+                        continue
+                    # Receive all the messages already there (within reason),
+                    # so that the dispatcher can discard the oldest ones.
+                    for i in range(MAX_RECV_BURST):
+                        try:
+                            value = sub.receiver(s)
+                        except Exception:
+                            logging.exception("Failed to receive message from %s", sub.uri)
+                            break
+                        self._queueValue(sub, value)
+                        if not s.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                            break
+        except:
+            if logging:
+                logging.exception("Ending ZMQ subscription hub due to exception")
+
+    def _queueValue(self, sub, value):
+        if sub.direct:
+            self._notifyDirect(sub, value)
+            return
+
+        with self._dispatch_lock:
+            if not sub.active:
+                return
+            sub.received += 1
+            sub.pending.append((time.time(), value))
+            if not sub.scheduled:
+                sub.scheduled = True
+                self._ready.put(sub)
+
+    def _notifyDirect(self, sub, value):
+        """
+        Calls the notifier of the subscription immediately, from the hub thread
+        """
+        with self._dispatch_lock:
+            if not sub.active:
+                return
+            sub.received += 1
+
+        tstart = time.time()
+        try:
+            sub.w_notifier(value)
+        except WeakRefLostError:
+            self.unregister(sub)
+        except Exception:
+            logging.exception("Failed to notify value from %s", sub.uri)
+        tend = time.time()
+
+        with self._dispatch_lock:
+            sub.dispatched += 1
+            sub.duration_total += tend - tstart
+
+    def _runDispatcher(self):
+        """
+        Calls the notifiers of the subscriptions which have received values.
+        Only one dispatcher handles a given subscription at a time, so that the
+        values are notified in order.
+        """
+        try:
+            while True:
+                sub = self._ready.get()
+                with self._dispatch_lock:
+                    if not sub.pending:
+                        sub.scheduled = False
+                        continue
+                    # Newer values available => discard the old ones
+                    ndiscard = min(len(sub.pending) - 1, sub.max_discard)
+                    for i in range(ndiscard):
+                        sub.pending.popleft()
+                    sub.discarded += ndiscard
+                    tr, value = sub.pending.popleft()
+
+                tstart = time.time()
+                try:
+                    sub.w_notifier(value)
+                except WeakRefLostError:
+                    # It's a sign there is nothing left to do
+                    self.unregister(sub)
+                except Exception:
+                    logging.exception("Failed to notify value from %s", sub.uri)
+                tend = time.time()
+
+                with self._dispatch_lock:
+                    sub.dispatched += 1
+                    latency = tstart - tr
+                    sub.latency_total += latency
+                    sub.latency_max = max(sub.latency_max, latency)
+                    sub.duration_total += tend - tstart
+                    # Let the other subscriptions go first, before the next value
+                    if sub.pending and sub.active:
+                        self._ready.put(sub)
+                    else:
+                        sub.scheduled = False
+        except:
+            if logging:
+                logging.exception("Ending ZMQ dispatcher due to exception")
+
+
+_hub = None
+_hub_pid = None
+_hub_lock = threading.Lock()
+
+
+def getSubscriptionHub():
+    """
+    returns (SubscriptionHub): the hub of the current process. It is created
+      on the first call (and after a fork, as threads are not duplicated).
+    """
+    global _hub, _hub_pid
+    with _hub_lock:
+        if _hub is None or _hub_pid != os.getpid():
+            _hub = SubscriptionHub()
+            _hub_pid = os.getpid()
+        return _hub
+
+
+def getSubscriptionStats():
+    """
+    returns (dict): the statistics of the subscriptions of this process
+      (cf SubscriptionHub.getStats()), or None if no proxy has ever subscribed.
+    """
+    if _hub is None or _hub_pid != os.getpid():
+        return None
+    return _hub.getStats()
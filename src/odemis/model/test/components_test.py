@@ -26,7 +26,7 @@ from Pyro4.core import isasync
 import logging
 import numpy
 from odemis import model
-from odemis.model._components import DigitalCamera, Actuator, Axis
+from odemis.model._components import DigitalCamera, Actuator, Axis, Microscope
 import unittest
 
 
@@ -227,6 +227,49 @@ class TestActuator(unittest.TestCase):
 #             self.assertAlmostEqual(val, abs_mov_back[axis])
 
 
+class TestGetComponent(unittest.TestCase):
+    """
+    Test getComponent(), with a local microscope, instead of the back-end one
+    """
+
+    def setUp(self):
+        self.mic = Microscope("fake mic", "sparc")
+        self.cam = DigitalCamera("fake cam", "ccd")
+        self.act = FakeActuator("fake act", "stage", axes={"x": Axis(range=(-1, 1))})
+        self.mic.alive.value = {self.cam}
+        self._orig_mic = model._core._microscope
+        model._core._microscope = self.mic
+        model._core._comps_index = None
+
+    def tearDown(self):
+        model._core._microscope = self._orig_mic
+        model._core._comps_index = None
+
+    def test_lookup(self):
+        self.assertIs(model.getComponent(role="ccd"), self.cam)
+        self.assertIs(model.getComponent(name="fake cam"), self.cam)
+        self.assertIs(model.getComponent(name="fake cam", role="ccd"), self.cam)
+        self.assertIs(model.getComponent(role="sparc"), self.mic)
+        self.assertEqual(model.getComponents(), {self.mic, self.cam})
+        with self.assertRaises(LookupError):
+            model.getComponent(name="fake cam", role="stage")
+        with self.assertRaises(LookupError):
+            model.getComponent(role="stage")
+        with self.assertRaises(ValueError):
+            model.getComponent()
+
+    def test_alive_change(self):
+        """
+        Check the index is updated when the components alive change
+        """
+        self.assertIs(model.getComponent(role="ccd"), self.cam)
+        self.mic.alive.value = self.mic.alive.value | {self.act}
+        self.assertIs(model.getComponent(role="stage"), self.act)
+        self.mic.alive.value = {self.act}
+        with self.assertRaises(LookupError):
+            model.getComponent(role="ccd")
+
+
 class FakeActuator(Actuator):
     @isasync
     def moveRel(self, shift):
@@ -670,6 +670,61 @@ class RemoteTest(unittest.TestCase):
         self.assertEqual(array.shape, (2048, 2048))
         self.assertEqual(array[0][0], 0)
 
+#    @unittest.skip("simple")
+    def test_dataflow_get_busy_hub(self):
+        """
+        Check get() still works when all the dispatchers of the hub are busy
+        """
+        self.comp.data.reset()
+        self.comp.data.get()  # To initialise the connection
+
+        release = threading.Event()
+
+        def block_listener(value):
+            release.wait(20)
+
+        vas = (self.comp.prop, self.comp.listval, self.comp.enum, self.comp.cont)
+        vals = (47, [3, 8], "c", 3.0)
+        self.assertGreaterEqual(len(vas), model._zmqhub.DISPATCH_THREADS)
+        try:
+            for va, v in zip(vas, vals):
+                va.subscribe(block_listener)
+                va.value = v
+            time.sleep(0.1)  # give time to start notifying
+
+            tstart = time.time()
+            array = self.comp.data.get()
+            self.assertLess(time.time() - tstart, 5)
+            self.assertEqual(array.shape, (2048, 2048))
+        finally:
+            release.set()
+            for va in vas:
+                va.unsubscribe(block_listener)
+
+#    @unittest.skip("simple")
+    def test_dataflow_get_big(self):
+        """
+        Compare get() over 0MQ with get() over Pyro, on big arrays
+        """
+        self.comp.data.setShape((4096, 4096), 16)  # 32 MB
+        self.comp.data.get()  # To initialise the connection
+
+        nb = 5
+        tstart = time.time()
+        for i in range(nb):
+            array = self.comp.data.get()
+        dur_zmq = (time.time() - tstart) / nb
+
+        tstart = time.time()
+        for i in range(nb):
+            array_pyro = Pyro4.Proxy.__getattr__(self.comp.data, "get")()
+        dur_pyro = (time.time() - tstart) / nb
+
+        print "get() of %s took %g s via 0MQ, and %g s via Pyro" % (array.shape, dur_zmq, dur_pyro)
+        self.assertEqual(array.shape, (4096, 4096))
+        numpy.testing.assert_array_equal(array, array_pyro)
+        self.comp.data.setShape((2048, 2048), 16)
+
 #    @unittest.skip("simple")
     def test_va_update(self):
         prop = self.comp.prop
@@ -713,6 +768,36 @@ class RemoteTest(unittest.TestCase):
         except TypeError:
             pass # as it should be
 
+#    @unittest.skip("simple")
+    def test_subscription_hub(self):
+        """
+        Check all the subscriptions share the same threads
+        """
+        prop = self.comp.prop
+        self.called = 0
+        self.count = 0
+        self.expected_shape = (2048, 2048)
+        self.data_arrays_sent = 0
+        self.comp.data.reset()
+
+        prop.subscribe(self.receive_va_update)
+        self.comp.data.subscribe(self.receive_data)
+        self.comp.change_prop(46)
+        time.sleep(0.5)
+        self.comp.data.unsubscribe(self.receive_data)
+        prop.unsubscribe(self.receive_va_update)
+
+        self.assertGreaterEqual(self.called, 1)
+        self.assertGreaterEqual(self.count, 1)
+
+        # No new thread for the new subscriptions
+        stats = model.getSubscriptionStats()
+        self.assertEqual(stats["threads"], 1 + model._zmqhub.DISPATCH_THREADS)
+        self.assertGreaterEqual(len(stats["subscriptions"]), 2)
+        for s in stats["subscriptions"].values():
+            self.assertLessEqual(s["dispatched"] + s["discarded"] + s["pending"], s["received"])
+            self.assertGreaterEqual(s["latency_max"], s["latency_avg"])
+
     def receive_va_update(self, value):
         self.called += 1
         self.last_value = value
@@ -26,7 +26,6 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 
 from __future__ import division, absolute_import
 
-import Queue
 import collections
 from functools import wraps
 import inspect
@@ -35,11 +34,10 @@ import math
 import signal
 import threading
 import time
-import weakref
 
 from decorator import decorator
 
-from . import weak
+from . import weak, scheduler
 
 
 def find_closest(val, l):
@@ -274,49 +272,8 @@ def normalize_rect(rect):
     return type(rect)((l, t, r, b))
 
 
-def _li_thread(delay, q):
-
-    try:
-        exect = time.time()
-        while True:
-            # read the latest arguments in the queue (if there are more)
-            t, f, args, kwargs = q.get() # first wait until there is something
-            if t is None:
-                return
-
-            # wait until it's time for it
-            next_t = (min(exect, t) + delay)
-            while True: # discard arguments if there is newer calls already queued
-                sleep_t = next_t - time.time()
-                if sleep_t > 0:
-                    # logging.debug("waiting %f s until executing call", sleep_t)
-                    # time.sleep(sleep_t)
-                    timeout = sleep_t
-                    block = True
-                else: # just check one last time
-                    block = False
-                    timeout = None
-
-                try:
-                    t, f, args, kwargs = q.get(block=block, timeout=timeout)
-                    if t is None: # Sign that we should stop (object is gone)
-                        return
-                    # logging.debug("Overriding call with call at %f", t)
-                except Queue.Empty:
-                    break
-
-            try:
-                exect = time.time()
-                # logging.debug("executing function %s with a delay of %f s", f.__name__, exect - t)
-                f(*args, **kwargs)
-            except Exception:
-                logging.exception("During limited invocation call")
-
-            # clean up early, to avoid possible cyclic dep on the instance
-            del f, args, kwargs
-
-    finally:
-        logging.debug("Ending li thread")
+# All the delayed calls of limit_invocation are run by the same few threads
+_li_scheduler = scheduler.Scheduler(4, "li thread")
 
 
 def limit_invocation(delay_s):
@@ -347,8 +304,7 @@ def limit_invocation(delay_s):
 
         # Hacky way to store value per instance and per methods
         last_call_name = '%s_lim_inv_last_call' % f.__name__
-        queue_name = '%s_lim_inv_queue' % f.__name__
-        wr_name = '%s_lim_inv_wr' % f.__name__
+        job_name = '%s_lim_inv_job' % f.__name__
 
         @wraps(f)
         def limit(self, *args, **kwargs):
@@ -363,28 +319,20 @@ def limit_invocation(delay_s):
                     now - getattr(self, last_call_name) < delay_s):
                     # logging.debug('Delaying method call')
                     try:
-                        q = getattr(self, queue_name)
+                        job = getattr(self, job_name)
                     except AttributeError:
-                        # Create everything need
-                        q = Queue.Queue()
-                        setattr(self, queue_name, q)
-
-                        # Detect when instance of self is dereferenced
-                        # and kill thread then
-                        def on_deref(obj):
-                            # logging.debug("object %r gone", obj)
-                            q.put((None, None, None, None)) # ask the thread to stop
-
-                        wref = weakref.ref(self, on_deref)
-                        setattr(self, wr_name, wref)
-
-                        t = threading.Thread(target=_li_thread,
-                                             name="li thread for %s" % f.__name__,
-                                             args=(delay_s, q))
-                        t.daemon = True
-                        t.start()
-
-                    q.put((now, f, (self,) + args, kwargs))
+                        # The job only keeps a reference to the instance
+                        # while the call is pending
+                        job = _li_scheduler.createJob(f, "li for %s" % f.__name__,
+                                                      min_period=delay_s, weak=False)
+                        setattr(self, job_name, job)
+
+                    # If the previous call was executed immediately, run this
+                    # one 'delay_s' after it (otherwise, the job knows it)
+                    last_call = getattr(self, last_call_name)
+                    if last_call <= now:
+                        job.last_start = max(job.last_start, last_call)
+                    job.request((self,) + args, kwargs)
                     setattr(self, last_call_name, now + delay_s)
                     return
                 else:
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Measures the performance of the DataFlows: how many frames and bytes per
+# second are received, the latency between the acquisition and the reception,
+# and the regularity of the reception (jitter).
+# The simulators can be benchmarked without back-end, both with a local
+# subscription (in the same process) and a remote one (over Pyro and 0MQ, from
+# a separate container), which gives a reproducible reference.
+
+from __future__ import division
+
+import importlib
+import logging
+import numpy
+from odemis import model
+from odemis.util import units
+import threading
+import time
+
+
+# Configuration of the simulators which can be benchmarked without back-end
+# name -> class, kwargs, role of the component with the dataflow
+SIMULATORS = {
+    "simcam": ("odemis.driver.simcam.Camera",
+               {"name": "Bench Camera", "role": "ccd",
+                "image": "simcam-fake-overview.h5"},
+               "ccd"),
+    "simsem": ("odemis.driver.simsem.SimSEM",
+               {"name": "Bench SEM", "role": "sem",
+                # Send the images as fast as they are generated
+                "realistic_timing": False,
+                "children": {"scanner": {"name": "Bench E-beam", "role": "e-beam"},
+                             "detector0": {"name": "Bench Detector", "role": "se-detector"}
+                            }
+                },
+               "se-detector"),
+}
+
+# Order of the results in the report
+_REPORT_KEYS = ("frames", "duration", "fps", "throughput", "latency_avg",
+                "latency_min", "latency_max", "jitter")
+
+
+def measure_dataflow(df, duration=5, warmup=1):
+    """
+    Subscribes to a dataflow, and measures how fast the data is received.
+    df (DataFlow or DataFlowProxy): the dataflow to measure
+    duration (0<float): time (in s) during which the data is recorded
+    warmup (0<=float): time (in s) before the recording starts, to skip the
+      start-up of the acquisition
+    return (dict str -> number or None):
+      frames (int): number of frames received
+      duration (float): time between the first and last frame received (s)
+      fps (float): frames per second
+      throughput (float): bytes per second
+      latency_avg, latency_min, latency_max (float): time (s) between the
+        acquisition date of the data (MD_ACQ_DATE), and its reception. None
+        if the data has no acquisition date.
+      jitter (float): standard deviation of the time between frames (s)
+    """
+    recording = threading.Event()
+    frames = []  # time of reception, bytes, acquisition date
+
+    def on_data(df, data):
+        now = time.time()
+        if recording.is_set():
+            frames.append((now, data.nbytes, data.metadata.get(model.MD_ACQ_DATE)))
+
+    df.subscribe(on_data)
+    try:
+        time.sleep(warmup)
+        recording.set()
+        time.sleep(duration)
+    finally:
+        df.unsubscribe(on_data)
+        recording.clear()
+
+    res = dict.fromkeys(_REPORT_KEYS)
+    res["frames"] = len(frames)
+    if len(frames) < 2:
+        logging.warning("Only %d frames received in %g s, cannot measure the dataflow",
+                        len(frames), duration)
+        return res
+
+    trecv = numpy.array([f[0] for f in frames])
+    dur = trecv[-1] - trecv[0]
+    res["duration"] = float(dur)
+    if dur > 0:
+        res["fps"] = (len(frames) - 1) / dur
+        # The first frame is the start, so it's not counted
+        res["throughput"] = sum(f[1] for f in frames[1:]) / dur
+    res["jitter"] = float(numpy.diff(trecv).std())
+
+    latencies = [f[0] - f[2] for f in frames if f[2] is not None]
+    if latencies:
+        res["latency_avg"] = sum(latencies) / len(latencies)
+        res["latency_min"] = min(latencies)
+        res["latency_max"] = max(latencies)
+
+    return res
+
+
+def _get_class(path):
+    modname, clsname = path.rsplit(".", 1)
+    return getattr(importlib.import_module(modname), clsname)
+
+
+def _find_component(root, role):
+    """
+    return (Component): the root or one of its children with the given role
+    """
+    if root.role == role:
+        return root
+    for c in root.children.value:
+        if c.role == role:
+            return c
+    raise LookupError("No component with role %s" % (role,))
+
+
+def bench_simulator(name, df_name="data", duration=5, remote=True):
+    """
+    Measures the dataflow of a simulator, without back-end
+    name (str): one of the SIMULATORS
+    df_name (str): name of the dataflow
+    duration (0<float): time (in s) of each measurement
+    remote (bool): if True, also measure the dataflow in a separate container
+    return (list of (str, dict)): for each mode ("local" and "remote"), the
+      results of measure_dataflow()
+    """
+    try:
+        clsname, kwargs, role = SIMULATORS[name]
+    except KeyError:
+        raise ValueError("Unknown simulator %s, known ones are: %s" %
+                         (name, ", ".join(sorted(SIMULATORS.keys()))))
+    klass = _get_class(clsname)
+
+    results = []
+    comp = klass(**kwargs)
+    try:
+        df = getattr(_find_component(comp, role), df_name)
+        results.append(("local", measure_dataflow(df, duration)))
+    finally:
+        comp.terminate()
+
+    if remote:
+        cont, comp = model.createInNewContainer("bench" + name, klass, kwargs)
+        try:
+            df = getattr(_find_component(comp, role), df_name)
+            results.append(("remote", measure_dataflow(df, duration)))
+        finally:
+            comp.terminate()
+            cont.terminate()
+
+    return results
+
+
+def format_report(title, res, pretty=True):
+    """
+    Converts the results of measure_dataflow() to a text
+    title (unicode): name of the measurement
+    res (dict): results of measure_dataflow()
+    pretty (bool): if False, the values are written without unit, in a
+      machine-friendly way (one per line, tab separated from the title and
+      the name of the value).
+    return (unicode): the report (multiple lines)
+    """
+    if not pretty:
+        lines = []
+        for k in _REPORT_KEYS:
+            v = res[k]
+            lines.append(u"%s\t%s\t%s" % (title, k, "" if v is None else repr(v)))
+        return u"\n".join(lines)
+
+    def rstr(v, unit):
+        if v is None:
+            return u"unknown"
+        return units.readable_str(v, unit, sig=3)
+
+    lines = [u"%s:" % (title,),
+             u"  frames: %d in %s" % (res["frames"], rstr(res["duration"], "s")),
+             u"  frame rate: %s fps" % (rstr(res["fps"], None),),
+             u"  throughput: %s" % (rstr(res["throughput"], "B/s"),),
+             u"  latency: %s (min %s, max %s)" % (rstr(res["latency_avg"], "s"),
+                                                 rstr(res["latency_min"], "s"),
+                                                 rstr(res["latency_max"], "s")),
+             u"  jitter: %s" % (rstr(res["jitter"], "s"),),
+            ]
+    return u"\n".join(lines)
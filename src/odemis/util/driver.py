@@ -21,8 +21,10 @@ Odemis. If not, see http://www.gnu.org/licenses/.
 '''
 from __future__ import division
 
+import Pyro4
 from Pyro4.errors import CommunicationError
 import collections
+from concurrent import futures
 import logging
 import math
 from odemis import model
@@ -30,6 +32,7 @@ import os
 import re
 import sys
 import threading
+import time
 
 
 def getSerialDriver(name):
@@ -127,6 +130,35 @@ def estimateMoveDuration(distance, speed, accel):
         return t1 + t2
 
 
+def moveAbsTrajectory(actuator, positions):
+    """
+    Requests an actuator to go through a series of positions, as one trajectory.
+    All the moves are queued at once, so that the actuator starts each move as
+    soon as the previous one is over, and can skip what is only needed after
+    the last move (eg, reading the final position of the axes).
+    If a move fails or is cancelled, all the following moves are cancelled.
+    Note: as the position is not read between the moves, when the future of an
+    intermediary position is done, the .position of the actuator might not be
+    updated yet. It is only guaranteed to be up to date once the last future
+    is done (or once a move is cancelled or fails).
+    actuator (Actuator): the actuator to move
+    positions (list of dict str -> float): the successive absolute positions
+    return (list of Futures): one future per position, which is done when the
+      position is reached
+    """
+    fs = [actuator.moveAbs(p) for p in positions]
+
+    def cancel_following(f, following):
+        if f.cancelled() or f.exception() is not None:
+            for nf in following:
+                nf.cancel()
+
+    for i, f in enumerate(fs[:-1]):
+        f.add_done_callback(lambda f, following=fs[i + 1:]: cancel_following(f, following))
+
+    return fs
+
+
 def checkLightBand(band):
     """
     Check that the given object looks like a light band. It should either be
@@ -163,40 +195,172 @@ def checkLightBand(band):
     # no error found
 
 # Special trick functions for speeding up Pyro start-up
-def _speedUpPyroVAConnect(comp):
+
+# Maximum number of threads used to connect to the proxies in the background
+MAX_BIND_THREADS = 8
+
+
+def _bindProxy(obj):
     """
-    Ensures that all the VAs of the component will be quick to access
+    Force the creation of the connection to a proxy.
+    If the connection already exists it's very fast.
+    obj (Pyro4.Proxy)
+    """
+    try:
+        obj._pyroBind()
+    except Exception:
+        logging.debug("Failed to connect to %s", obj, exc_info=True)
+
+
+def _getProxies(comp):
+    """
+    List all the remote objects of a component
     comp (Component)
+    return (list of Pyro4.Proxy): the component itself (if it's a proxy), and
+      all its VAs, DataFlows and Events which are proxies.
     """
-    # Force the creation of the connection
-    # If the connection already exists it's very fast, otherwise, we wait
-    # for the connection to be created in a separate thread
+    objs = [comp]
+    objs.extend(model.getVAs(comp).values())
+    objs.extend(model.getDataFlows(comp).values())
+    objs.extend(model.getEvents(comp).values())
+    return [o for o in objs if isinstance(o, Pyro4.core.Proxy)]
+
+
+class ComponentDirectory(object):
+    """
+    Local index of all the components of a microscope.
+    All the components (including the description of their VAs, DataFlows and
+    Events) are received in a single call to the back-end. The connection to
+    each of the proxies can then be done in the background, by a limited number
+    of threads.
+    The index is the same as the one of model.getComponent(), and similarly,
+    it is reset whenever the .alive VA of the root changes.
+    """
+
+    def __init__(self, root, max_threads=MAX_BIND_THREADS):
+        """
+        root (Component): the microscope (or any component). If it has a
+          .alive VA, the components are taken from it, otherwise, the children
+          are explored recursively.
+        max_threads (1 <= int): maximum number of threads used to connect the
+          proxies.
+        """
+        self.root = root
+        self._index_lock = threading.Lock()
+        self._index = None  # None or the index, as returned by model._core._indexComponents()
+        if model.hasVA(root, "alive"):
+            # Subscribe before reading the value, to not miss any change.
+            try:
+                root.alive.subscribe(self._onAlive)
+            except Exception:
+                logging.warning("Failed to follow the components alive, directory will not be updated",
+                                exc_info=True)
+        self._getIndex()
+
+        self._max_threads = max_threads
+        self._executor = None
+        self._bind_futures = []
+
+    def getComponent(self, name=None, role=None):
+        """
+        Find a component, according to its name or role.
+        Same as model.getComponent(), but without any call to the back-end.
+        name (str): name of the component to look for
+        role (str): role of the component to look for
+        return (Component): the component with the given name
+        raise LookupError: if no component with such a name is given
+        """
+        if name is None and role is None:
+            raise ValueError("Need to specify at least a name or a role")
+
+        return model._core._lookupComponent(self._getIndex(), name, role)
+
+    def getComponents(self):
+        """
+        return (frozenset of Component): all the components listed
+        """
+        return self._getIndex()[0]
+
+    def _onAlive(self, alive):
+        """
+        Called when the list of components alive changes
+        """
+        with self._index_lock:
+            self._index = None
+
+    def _getIndex(self):
+        """
+        Returns the index of all the components, and (re)creates it if needed
+        return (tuple): as returned by model._core._indexComponents()
+        """
+        with self._index_lock:
+            if self._index is None:
+                tstart = time.time()
+                if model.hasVA(self.root, "alive"):
+                    comps = self.root.alive.value | {self.root}
+                else:
+                    comps = model._core._getChildren(self.root)
+                self._index = model._core._indexComponents(comps)
+                logging.debug("Listed %d components in %g s", len(comps), time.time() - tstart)
+            return self._index
+
+    def bind(self):
+        """
+        Start connecting to all the proxies (components, VAs, DataFlows and
+        Events) in the background. It does nothing but speed up later access.
+        It returns immediately.
+        return (list of Futures): one future per proxy, which is done once the
+          proxy is connected.
+        """
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(max_workers=self._max_threads)
+
+        fs = []
+        comps = self.getComponents()
+        # The components first, as they are the most likely to be used first
+        proxies = [c for c in comps if isinstance(c, Pyro4.core.Proxy)]
+        for c in comps:
+            proxies.extend(p for p in _getProxies(c) if p is not c)
+        for p in proxies:
+            fs.append(self._executor.submit(_bindProxy, p))
+
+        self._bind_futures.extend(fs)
+        return fs
+
+    def waitBound(self, timeout=None):
+        """
+        Wait until all the proxies are connected
+        timeout (None or float): maximum time to wait (in s)
+        return (bool): True if all the proxies are connected
+        """
+        done, not_done = futures.wait(self._bind_futures, timeout=timeout)
+        return not not_done
+
+    def close(self):
+        """
+        Stops the background connection threads (once all the pending
+        connections are done).
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
 
-    for name, va in model.getVAs(comp).items():
-        t = threading.Thread(name="Connection to VA %s.%s" % (comp.name, name),
-                             target=va._pyroBind)
-        t.daemon = True
-        t.start()
 
 def speedUpPyroConnect(comp):
     """
     Ensures that all the children of the component will be quick to access.
     It does nothing but speed up later access.
     comp (Component)
+    return (ComponentDirectory): the directory of all the components found
     """
     # each connection is pretty fast (~10ms) but when listing all the VAs of
     # all the components, it can easily add up to 1s if done sequentially.
-
-    def bind_obj(obj):
-#        logging.debug("binding comp %s", obj.name)
-        obj._pyroBind()
-        speedUpPyroConnect(obj)
-
-    _speedUpPyroVAConnect(comp)
-
-    for child in comp.children.value:
-        t = threading.Thread(name="Connection to %s" % child.name, target=bind_obj, args=(child,))
-        t.start()
+    # However, starting one thread per proxy also costs a lot, so use a
+    # limited number of threads.
+    cdir = ComponentDirectory(comp)
+    cdir.bind()
+    cdir.close()  # The threads will stop once all the connections are done
+    return cdir
 
 
 BACKEND_RUNNING = "RUNNING"
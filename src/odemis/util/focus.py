@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Focus measures: estimate how sharp an image is (the higher, the better).
+# They are used for autofocus, so they have to be computed fast, compared to
+# the acquisition time. So, all the heavy computations rely on OpenCV, which
+# is using vectorised (SIMD) code, and work in float32 (or integers) instead
+# of float64. Even faster, the measure can be done on just the center of the
+# image, and/or a binned image.
+
+from __future__ import division
+
+import cv2
+import numpy
+
+
+# Focus measure methods
+FM_LAPLACIAN = "laplacian"  # Variance of the Laplacian
+FM_TENENGRAD = "tenengrad"  # Mean of the square of the Sobel gradient
+FM_NORM_VARIANCE = "normvar"  # Variance divided by mean
+FM_STD = "std"  # Standard deviation
+
+
+def ToGray(image):
+    """
+    Convert a RGB(A) image to grayscale. Grayscale images are passed unchanged.
+    image (numpy array of shape YX or YXC): image in uint8, uint16 or float32
+    return (numpy array of shape YX): same dtype as the image
+    """
+    if image.ndim != 3:
+        return image
+
+    if image.dtype not in (numpy.uint8, numpy.uint16, numpy.float32):
+        image = image.astype(numpy.float32)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY)
+    elif image.shape[2] == 3:
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    raise ValueError("Image of shape %s is not RGB" % (image.shape,))
+
+
+def ReduceImage(image, roi=None, binning=1):
+    """
+    Reduce the amount of data of an image, to speed up the focus measurement.
+    image (numpy array of shape YX): the image
+    roi (None or tuple of 4 0<=floats<=1): left, top, right, bottom of the area
+      to keep, relative to the full image. If None, the whole image is kept.
+    binning (1<=int): number of pixels averaged together, along each dimension
+    return (numpy array of shape YX): a view on the image if only the ROI is
+      changed, or a new float32 image if binned.
+    """
+    if roi is not None:
+        h, w = image.shape[:2]
+        l, t, r, b = roi
+        image = image[int(t * h):max(int(t * h) + 1, int(b * h)),
+                      int(l * w):max(int(l * w) + 1, int(r * w))]
+
+    if binning > 1:
+        h, w = image.shape[0] // binning, image.shape[1] // binning
+        if h < 1 or w < 1:
+            raise ValueError("Binning %d too large for an image of shape %s" %
+                             (binning, image.shape))
+        image = image[:h * binning, :w * binning]
+        if image.dtype != numpy.float32:
+            image = image.astype(numpy.float32)
+        # Area interpolation of an integer down-scale is exactly the mean
+        image = cv2.resize(image, (w, h), interpolation=cv2.INTER_AREA)
+
+    return image
+
+
+def _toFloat32(image):
+    if image.dtype == numpy.float32:
+        return image
+    return image.astype(numpy.float32)
+
+
+def LaplacianVariance(image):
+    """
+    image (numpy array of shape YX): grayscale image
+    return (0<=float): the variance of the Laplacian of the image
+    """
+    lap = cv2.Laplacian(_toFloat32(image), cv2.CV_32F)
+    _, sd = cv2.meanStdDev(lap)
+    return float(sd[0, 0]) ** 2
+
+
+def Tenengrad(image):
+    """
+    image (numpy array of shape YX): grayscale image
+    return (0<=float): the mean of the square of the gradient magnitude
+    """
+    image = _toFloat32(image)
+    gx = cv2.Sobel(image, cv2.CV_32F, 1, 0)
+    gy = cv2.Sobel(image, cv2.CV_32F, 0, 1)
+    # Sum of squares with float64 accumulator, without float64 images
+    return (cv2.norm(gx, cv2.NORM_L2SQR) + cv2.norm(gy, cv2.NORM_L2SQR)) / image.size
+
+
+def NormalizedVariance(image):
+    """
+    image (numpy array of shape YX): grayscale image
+    return (0<=float): the variance of the image divided by its mean. It's
+      insensitive to the brightness of the image.
+    """
+    mean, sd = cv2.meanStdDev(_toFloat32(image))
+    if mean[0, 0] <= 0:
+        return 0
+    return float(sd[0, 0]) ** 2 / float(mean[0, 0])
+
+
+def StandardDeviation(image):
+    """
+    image (numpy array of shape YX): grayscale image
+    return (0<=float): the standard deviation of the image
+    """
+    _, sd = cv2.meanStdDev(_toFloat32(image))
+    return float(sd[0, 0])
+
+
+_METRICS = {FM_LAPLACIAN: LaplacianVariance,
+            FM_TENENGRAD: Tenengrad,
+            FM_NORM_VARIANCE: NormalizedVariance,
+            FM_STD: StandardDeviation,
+           }
+
+
+def MeasureFocus(image, method=FM_LAPLACIAN, roi=None, binning=1):
+    """
+    Estimates the focus level of an image
+    image (numpy array of shape YX or YXC): the image. If RGB, it's first
+      converted to grayscale.
+    method (FM_*): the focus measure to use
+    roi (None or tuple of 4 0<=floats<=1): area of the image to use, relative
+      to the full image (cf ReduceImage())
+    binning (1<=int): binning to apply on the image before measuring
+    return (0<=float): the focus level (the higher, the better). Values from
+      different methods, roi or binning cannot be compared.
+    """
+    try:
+        measure = _METRICS[method]
+    except KeyError:
+        raise ValueError("Unknown focus measure method %s" % (method,))
+
+    image = ToGray(image)
+    image = ReduceImage(image, roi, binning)
+    return measure(image)
@@ -16,9 +16,11 @@ You should have received a copy of the GNU General Public License along with Ode
 '''
 from __future__ import division
 
+from concurrent import futures
 from concurrent.futures._base import CancelledError, CANCELLED, FINISHED, RUNNING
 from itertools import izip
 import logging
+import multiprocessing
 import numpy
 from odemis import model
 from scipy.optimize import curve_fit
@@ -37,30 +39,27 @@ PEAK_WIDTHS = {'gaussian': 0.1, 'lorentzian': 1e-4}
 
 # These two fitting functions are called back from curve_fit()
 # Note: when returning NaN, curve_fit() appears to not like the proposed parameters
+# They are vectorized: all the peaks are computed at once, as a 2D array.
 
 def GaussianFit(data, *peaks):
     """
     Applies gaussian fitting to data given the "peaks" parameters.
     peaks (list of floats): series of pos, width, amplitude and initial offset
     """
-    gau = peaks[-1]  # Automatically converted to a vector in the addition
-    for pos, width, amplitude in _Grouped(peaks[:-1], 3):
-        sprime = pos * abs(width)
-        gau += abs(amplitude) * _Normalize(numpy.exp(-(data - pos) ** 2 / sprime ** 2))
-
-    return gau
+    pos, width, amplitude = _PeaksArray(peaks)
+    sprime = pos * numpy.abs(width)
+    gau = numpy.exp(-(numpy.asarray(data) - pos) ** 2 / sprime ** 2)
+    return peaks[-1] + (numpy.abs(amplitude) * _Normalize(gau)).sum(axis=0)
 
 
 def LorentzianFit(data, *peaks):
     """
     Applies lorentzian fitting to data given the "peaks" parameters.
     """
-    lor = peaks[-1]
-    for pos, width, amplitude in _Grouped(peaks[:-1], 3):
-        wprime = pos * abs(width)
-        lor += abs(amplitude) * _Normalize(wprime ** 2 / ((data - pos) ** 2 + wprime ** 2))
-
-    return lor
+    pos, width, amplitude = _PeaksArray(peaks)
+    wprime = pos * numpy.abs(width)
+    lor = wprime ** 2 / ((numpy.asarray(data) - pos) ** 2 + wprime ** 2)
+    return peaks[-1] + (numpy.abs(amplitude) * _Normalize(lor)).sum(axis=0)
 
 
 def Smooth(signal, window_len=11, window='hanning'):
@@ -200,6 +199,124 @@ def Detect(y_vector, x_vector=None, lookahead=5, delta=0):
 #     return f
 
 
+def _FitSpectrum(future, spectrum, wavelength, type='gaussian'):
+    """
+    Smooths the spectrum signal, detects the peaks and applies the type of peak
+    fitting required.
+    future (model.ProgressiveFuture): future of the task, with a _fit_state
+    spectrum (1d array of floats): The data representing the spectrum.
+    wavelength (1d array of floats): The wavelength values corresponding to the
+    spectrum given.
+    type (str): Type of fitting to be applied (for now only ‘gaussian’ and
+    ‘lorentzian’ are available).
+    returns (1d array of floats): the (raw) optimized parameters, as pos,
+      width, amplitude for each peak, followed by the offset.
+    raises:
+            KeyError if given type not available
+            ValueError if fitting cannot be applied
+            CancelledError if the future is cancelled
+    """
+    # values based on experimental datasets
+    if len(wavelength) >= 2000:
+        divider = 20
+    elif len(wavelength) >= 1000:
+        divider = 25
+    else:
+        divider = 30
+    init_window_size = max(3, len(wavelength) // divider)
+    window_size = init_window_size
+    logging.debug("Starting peak detection on data (len = %d) with window = %d",
+                  len(wavelength), window_size)
+    try:
+        width = PEAK_WIDTHS[type]
+        FitFunction = PEAK_FUNCTIONS[type]
+    except KeyError:
+        raise KeyError("Given type %s not in available fitting types: %s" % (type, PEAK_FUNCTIONS.keys()))
+    for step in range(5):
+        if future._fit_state == CANCELLED:
+            raise CancelledError()
+        smoothed = Smooth(spectrum, window_len=window_size)
+        # Increase window size until peak detection finds enough peaks to fit
+        # the spectrum curve
+        peaks = Detect(smoothed, wavelength, lookahead=window_size, delta=5)[0]
+        if peaks == []:
+            window_size = int(round(window_size * 1.2))
+            logging.debug("Retrying to fit peak with window = %d", window_size)
+            continue
+
+        fit_list = []
+        for (pos, amplitude) in peaks:
+            fit_list.append(pos)
+            fit_list.append(width)
+            fit_list.append(amplitude)
+        # Initialize offset to 0
+        fit_list.append(0)
+
+        if future._fit_state == CANCELLED:
+            raise CancelledError()
+
+        try:
+            # => in scipy 0.17, curve_fit() supports the 'bounds' parameter
+            params, _ = curve_fit(FitFunction, wavelength, spectrum, p0=fit_list)
+            return params
+        except Exception:
+            window_size = int(round(window_size * 1.2))
+            logging.debug("Retrying to fit peak with window = %d", window_size)
+            continue
+
+    raise ValueError("Could not apply peak fitting of type %s." % type)
+
+
+def _FitSpectra(spectra, wavelength, type, seed):
+    """
+    Fits a series of spectra, with a fixed number of peaks. Each fit starts
+    from the result of the previous spectrum, so the spectra should be ordered
+    so that each spectrum is close to the previous one (eg, neighbouring pixels).
+    It is run in a separate process, so it must be a module function.
+    spectra (2d array of shape NC): the spectra to fit
+    wavelength (1d array of floats of length C): The wavelength values
+    type (str): Type of fitting to be applied
+    seed (1d array of floats): the (raw) parameters to start the fitting from,
+      when the previous fit is not available or failed.
+    returns (2d array of shape N x len(seed)): the (raw) parameters of each
+      spectrum. If the fitting failed, all the parameters are NaN.
+    """
+    FitFunction = PEAK_FUNCTIONS[type]
+    params = numpy.empty((len(spectra), len(seed)), dtype=numpy.float64)
+    prev = seed
+    for i, spec in enumerate(spectra):
+        p = None
+        for p0 in ((prev, seed) if prev is not seed else (seed,)):
+            try:
+                p, _ = curve_fit(FitFunction, wavelength, spec, p0=p0)
+            except Exception:
+                continue
+            if numpy.all(numpy.isfinite(p)):
+                break
+            p = None
+
+        if p is None:
+            params[i] = numpy.nan
+            prev = seed
+        else:
+            params[i] = p
+            prev = p
+
+    return params
+
+
+def _SerpentineIndices(shape):
+    """
+    Computes the order to go through all the pixels, so that each pixel is
+    a neighbour of the previous one
+    shape (int, int): Y, X dimensions
+    returns (1d array of ints): the flat indices of the pixels, in order
+    """
+    indices = numpy.arange(shape[0] * shape[1]).reshape(shape)
+    indices[1::2] = indices[1::2, ::-1]
+    return indices.ravel()
+
+
 class PeakFitter(object):
     def __init__(self):
         # will take care of executing peak fitting asynchronously
@@ -252,55 +369,7 @@ class PeakFitter(object):
                 ValueError if fitting cannot be applied
         """
         try:
-            # values based on experimental datasets
-            if len(wavelength) >= 2000:
-                divider = 20
-            elif len(wavelength) >= 1000:
-                divider = 25
-            else:
-                divider = 30
-            init_window_size = max(3, len(wavelength) // divider)
-            window_size = init_window_size
-            logging.debug("Starting peak detection on data (len = %d) with window = %d",
-                          len(wavelength), window_size)
-            try:
-                width = PEAK_WIDTHS[type]
-                FitFunction = PEAK_FUNCTIONS[type]
-            except KeyError:
-                raise KeyError("Given type %s not in available fitting types: %s" % (type, PEAK_FUNCTIONS.keys()))
-            for step in range(5):
-                if future._fit_state == CANCELLED:
-                    raise CancelledError()
-                smoothed = Smooth(spectrum, window_len=window_size)
-                # Increase window size until peak detection finds enough peaks to fit
-                # the spectrum curve
-                peaks = Detect(smoothed, wavelength, lookahead=window_size, delta=5)[0]
-                if peaks == []:
-                    window_size = int(round(window_size * 1.2))
-                    logging.debug("Retrying to fit peak with window = %d", window_size)
-                    continue
-
-                fit_list = []
-                for (pos, amplitude) in peaks:
-                    fit_list.append(pos)
-                    fit_list.append(width)
-                    fit_list.append(amplitude)
-                # Initialize offset to 0
-                fit_list.append(0)
-
-                if future._fit_state == CANCELLED:
-                    raise CancelledError()
-
-                try:
-                    # => in scipy 0.17, curve_fit() supports the 'bounds' parameter
-                    params, _ = curve_fit(FitFunction, wavelength, spectrum, p0=fit_list)
-                    break
-                except Exception:
-                    window_size = int(round(window_size * 1.2))
-                    logging.debug("Retrying to fit peak with window = %d", window_size)
-                    continue
-            else:
-                raise ValueError("Could not apply peak fitting of type %s." % type)
+            params = _FitSpectrum(future, spectrum, wavelength, type)
             # reformat parameters to (list of 3 tuples, offset)
             peaks_params = []
             for pos, width, amplitude in _Grouped(params[:-1], 3):
@@ -318,6 +387,136 @@ class PeakFitter(object):
                     raise CancelledError()
                 future._fit_state = FINISHED
 
+    def FitCube(self, data, wavelength, type='gaussian'):
+        """
+        Fits the peaks of every pixel of a spectrum cube. The peaks are first
+        detected on the mean spectrum, and then every spectrum is fitted with
+        the same number of peaks, starting from the parameters of its
+        neighbour. The fitting is run in parallel, in separate processes.
+        data (DataArray of shape C11YX or CYX): the spectrum cube
+        wavelength (1d array of floats of length C): The wavelength values
+          corresponding to the spectrum dimension.
+        type (str): Type of fitting to be applied (for now only ‘gaussian’ and
+        ‘lorentzian’ are available).
+        returns (model.ProgressiveFuture): Progress of DoFitCube, whose result()
+          will return:
+             params (list of 3-tuple of DataArrays of shape YX): Each peak
+               parameters as (pos, width, amplitude) maps. The pixels where
+               the fitting failed contain NaN.
+             offset (DataArray of shape YX): global offset to add
+        """
+        if data.ndim not in (3, 5) or data.shape[1:-2] not in ((), (1, 1)):
+            raise ValueError("Data must be of shape CYX or C11YX, but got %s" % (data.shape,))
+        if len(wavelength) != data.shape[0]:
+            raise ValueError("Wavelength has %d values, but data has %d" %
+                             (len(wavelength), data.shape[0]))
+
+        est_start = time.time() + 0.1
+        f = model.ProgressiveFuture(start=est_start,
+                                    end=est_start + self.estimateFitCubeTime(data))
+        f._fit_state = RUNNING
+        f._fit_lock = threading.Lock()
+        f._subfutures = []
+        f.task_canceller = self._CancelFit
+
+        return self._executor.submitf(f, self._DoFitCube, f, data, wavelength, type)
+
+    def _DoFitCube(self, future, data, wavelength, type='gaussian'):
+        """
+        Fits the peaks of every pixel of a spectrum cube (cf FitCube)
+        future (model.ProgressiveFuture): Progressive future provided by the wrapper
+        data, wavelength, type: cf FitCube
+        returns: cf FitCube
+        raises:
+                KeyError if given type not available
+                ValueError if fitting cannot be applied on the mean spectrum
+        """
+        try:
+            if type not in PEAK_FUNCTIONS:
+                raise KeyError("Given type %s not in available fitting types: %s" % (type, PEAK_FUNCTIONS.keys()))
+            shape = data.shape[-2:]
+            cube = numpy.asarray(data).reshape(data.shape[0], -1)  # C, YX
+            wavelength = numpy.asarray(wavelength, dtype=numpy.float64)
+
+            # The mean spectrum gives the peaks present in the whole cube
+            seed = _FitSpectrum(future, cube.mean(axis=1), wavelength, type)
+            logging.debug("Fitting %d peaks on %d spectra", (len(seed) - 1) // 3, cube.shape[1])
+
+            # Go through the pixels in serpentine order, so that each fit
+            # starts from the result of a neighbour, and split it by rows
+            # between the processes.
+            order = _SerpentineIndices(shape)
+            spectra = cube.T[order]
+            nworkers = multiprocessing.cpu_count()
+            rows_per_chunk = max(1, shape[0] // (nworkers * 4))
+            chunks = [(i * shape[1], min(i + rows_per_chunk, shape[0]) * shape[1])
+                      for i in range(0, shape[0], rows_per_chunk)]
+
+            params = numpy.empty((len(spectra), len(seed)), dtype=numpy.float64)
+            executor = futures.ProcessPoolExecutor(max_workers=nworkers)
+            try:
+                with future._fit_lock:
+                    if future._fit_state == CANCELLED:
+                        raise CancelledError()
+                    future._subfutures = [executor.submit(_FitSpectra, spectra[b:e],
+                                                          wavelength, type, seed)
+                                          for b, e in chunks]
+
+                tstart = time.time()
+                for sf, (b, e) in zip(future._subfutures, chunks):
+                    params[b:e] = sf.result()
+                    left = len(spectra) - e
+                    future.set_progress(end=time.time() + (time.time() - tstart) * left / e)
+            finally:
+                executor.shutdown(wait=True)
+
+            if future._fit_state == CANCELLED:
+                raise CancelledError()
+
+            # Put back in image order
+            pmap = numpy.empty_like(params)
+            pmap[order] = params
+            pmap = pmap.reshape(shape + (len(seed),))
+            nfailed = numpy.isnan(pmap[..., -1]).sum()
+            if nfailed:
+                logging.info("Failed to fit peaks on %d spectra", nfailed)
+
+            return self._paramsToDataArrays(data, pmap)
+        except CancelledError:
+            logging.debug("Fitting of type %s was cancelled.", type)
+        finally:
+            with future._fit_lock:
+                if future._fit_state == CANCELLED:
+                    raise CancelledError()
+                future._fit_state = FINISHED
+
+    def _paramsToDataArrays(self, data, pmap):
+        """
+        Converts the (raw) parameters of each pixel into parameter maps
+        data (DataArray): the spectrum cube
+        pmap (3d array of shape YXP): parameters for each pixel
+        returns: cf FitCube
+        """
+        md = dict(getattr(data, "metadata", {}))
+        # The maps have no more wavelength dimension
+        for k in (model.MD_WL_LIST, model.MD_WL_POLYNOMIAL):
+            md.pop(k, None)
+
+        def to_da(a, desc):
+            amd = md.copy()
+            amd[model.MD_DESCRIPTION] = desc
+            return model.DataArray(numpy.ascontiguousarray(a), amd)
+
+        peaks_params = []
+        for i in range((pmap.shape[-1] - 1) // 3):
+            pos, width, amplitude = pmap[..., 3 * i], pmap[..., 3 * i + 1], pmap[..., 3 * i + 2]
+            # Force positive, as in _DoFit()
+            peaks_params.append((to_da(pos, "Peak %d position" % (i + 1,)),
+                                 to_da(numpy.abs(width), "Peak %d width" % (i + 1,)),
+                                 to_da(numpy.abs(amplitude), "Peak %d amplitude" % (i + 1,))))
+        offset = to_da(pmap[..., -1], "Peak offset")
+        return peaks_params, offset
+
     def _CancelFit(self, future):
         """
         Canceller of _DoFit task.
@@ -328,6 +527,9 @@ class PeakFitter(object):
             if future._fit_state == FINISHED:
                 return False
             future._fit_state = CANCELLED
+            # Fitting of a cube: stop the processes as soon as possible
+            for sf in getattr(future, "_subfutures", []):
+                sf.cancel()
             logging.debug("Fitting cancelled.")
 
         return True
@@ -339,6 +541,16 @@ class PeakFitter(object):
         # really rough estimation
         return len(data) * 10e-3  # s
 
+    def estimateFitCubeTime(self, data):
+        """
+        Estimates the fitting duration of a whole spectrum cube
+        data (DataArray of shape C...YX): the spectrum cube
+        """
+        # Each pixel starts from a good guess, so it's faster than a normal fit
+        npixels = data.shape[-1] * data.shape[-2]
+        return (self.estimateFitTime(data) +
+                npixels * data.shape[0] * 1e-4 / multiprocessing.cpu_count())  # s
+
 
 def Curve(wavelength, peak_parameters, offset, type='gaussian'):
     """
@@ -377,12 +589,28 @@ def _Grouped(iterable, n):
     return izip(*[iter(iterable)] * n)
 
 
+def _PeaksArray(peaks):
+    """
+    Converts the flat peaks parameters into arrays, ready for broadcasting
+    peaks (list of floats): series of pos, width, amplitude and offset
+    returns (3 arrays of shape Nx1): pos, width and amplitude of each peak
+    """
+    p = numpy.asarray(peaks[:-1], dtype=numpy.float64).reshape(-1, 3, 1)
+    return p[:, 0], p[:, 1], p[:, 2]
+
+
 def _Normalize(vector):
-    normfac = numpy.max(vector)
-    if normfac == 0:
+    """
+    Normalize each vector so that its maximum is 1
+    vector (array of shape ...N): vector, or several vectors on the last dim
+    returns (array of same shape): normalized vectors, or NaN if any of them
+      is null.
+    """
+    normfac = numpy.max(vector, axis=-1)
+    if numpy.any(normfac == 0):
         # TODO: raise a ValueError instead? But that confuses curve_fit a lot
         logging.debug("Tried to normalize null vector")
         return float("NaN")
 
-    vecnorm = vector / normfac
+    vecnorm = vector / numpy.expand_dims(normfac, -1)
     return vecnorm
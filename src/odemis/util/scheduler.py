@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License version 2 as published by the Free Software Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+
+# Runs "jobs" on a small, fixed, number of threads. It replaces the pattern of
+# one thread per object, waiting for an Event to do some processing (eg, update
+# the image of a stream). With many objects, that means many threads which are
+# mostly idle, but all contend for the GIL as soon as several have something to
+# do.
+# A job is requested, and will run "soon". If it's requested again before
+# running, it still runs only once (with the latest arguments). A job never
+# runs simultaneously in several threads, and can be limited to a minimum
+# period between two runs. When several jobs are waiting, the one with the
+# lowest priority value runs first.
+
+from __future__ import division
+
+import logging
+import threading
+import time
+
+from odemis.util.weak import WeakMethod, WeakRefLostError
+
+
+class Job(object):
+    """
+    A function run by a Scheduler, when requested
+    """
+
+    def __init__(self, scheduler, fn, name=None, min_period=0, weak=True):
+        """
+        scheduler (Scheduler): the scheduler which runs the job
+        fn (callable): the function to run
+        name (None or str): name of the job, for the logs
+        min_period (0<=float): minimum time (in s) between the start of two runs
+        weak (bool): if True, only a weak reference to the function is kept.
+          When the function (or the object of the method) is gone, the job is
+          not run anymore.
+        """
+        self._scheduler = scheduler
+        self._fn = WeakMethod(fn) if weak else fn
+        self.name = name or getattr(fn, "__name__", "job")
+        self.min_period = min_period
+        self.last_start = 0  # time of the last start (0 = never)
+
+        # Only accessed with the scheduler lock
+        self._args = ()
+        self._kwargs = {}
+
+        # Statistics
+        self.requested = 0  # number of calls to request()
+        self.runs = 0  # number of actual runs
+        self.duration_total = 0  # s
+        self.duration_max = 0  # s
+        self.latency_total = 0  # s, time between the request and the start
+        self.latency_max = 0  # s
+
+    def request(self, args=(), kwargs=None, priority=0):
+        """
+        Ask to run the job. If the job was already requested, and is not yet
+        running, the previous request is replaced.
+        args (tuple): arguments for the function
+        kwargs (None or dict): keyword arguments for the function
+        priority (comparable): the lower, the sooner it runs, compared to the
+          other jobs waiting. If already requested, the lowest priority is kept.
+        """
+        self._scheduler._request(self, args, kwargs or {}, priority)
+
+    def cancel(self):
+        """
+        Cancel the pending request (the current run, if any, is not stopped)
+        """
+        self._scheduler._cancel(self)
+
+    def isPending(self):
+        """
+        return (bool): True if the job is requested, and not yet started
+        """
+        return self._scheduler._isPending(self)
+
+    def getStats(self):
+        """
+        return (dict str -> number): requested, runs (number of actual runs),
+          duration_avg, duration_max (time spent running, in s), latency_avg,
+          latency_max (time between the request and the start, in s)
+        """
+        n = max(1, self.runs)
+        return {"requested": self.requested,
+                "runs": self.runs,
+                "duration_avg": self.duration_total / n,
+                "duration_max": self.duration_max,
+                "latency_avg": self.latency_total / n,
+                "latency_max": self.latency_max,
+                }
+
+    def _run(self, args, kwargs, trequest):
+        """
+        Run the function, and update the statistics. Called by the scheduler.
+        """
+        tstart = time.time()
+        try:
+            self._fn(*args, **kwargs)
+        except WeakRefLostError:
+            logging.debug("Skipping job %s, as its object is gone", self.name)
+            return
+        except Exception:
+            logging.exception("Failure while running job %s", self.name)
+        tend = time.time()
+
+        self.runs += 1
+        latency = tstart - trequest
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        dur = tend - tstart
+        self.duration_total += dur
+        self.duration_max = max(self.duration_max, dur)
+
+
+class Scheduler(object):
+    """
+    Runs the requested jobs in a fixed number of threads.
+    It's intended for a few dozens of jobs at most.
+    """
+
+    def __init__(self, nthreads, name="Scheduler"):
+        """
+        nthreads (1<=int): maximum number of jobs running simultaneously
+        name (str): base name of the threads
+        """
+        self._nthreads = nthreads
+        self._name = name
+        self._cond = threading.Condition(threading.Lock())
+        self._pending = {}  # Job -> priority, time of request
+        self._running = set()  # Jobs
+        self._threads = []  # Started only when the first job is requested
+
+    def createJob(self, fn, name=None, min_period=0, weak=True):
+        """
+        Create a job run by this scheduler. See Job for the arguments.
+        return (Job)
+        """
+        return Job(self, fn, name, min_period, weak)
+
+    def _request(self, job, args, kwargs, priority):
+        with self._cond:
+            job.requested += 1
+            job._args, job._kwargs = args, kwargs
+            if job in self._pending:
+                prev_prio, treq = self._pending[job]
+                self._pending[job] = min(prev_prio, priority), treq
+            else:
+                self._pending[job] = priority, time.time()
+
+            if len(self._threads) < self._nthreads:
+                t = threading.Thread(target=self._runJobs,
+                                     name="%s %d" % (self._name, len(self._threads)))
+                t.daemon = True
+                t.start()
+                self._threads.append(t)
+            self._cond.notify()
+
+    def _cancel(self, job):
+        with self._cond:
+            if self._pending.pop(job, None) is not None:
+                job._args, job._kwargs = (), {}
+
+    def _isPending(self, job):
+        with self._cond:
+            return job in self._pending
+
+    def _pickJob(self):
+        """
+        Must be called with the lock taken
+        return (Job or None, None or float): the job to run now, and if there
+          is no job to run, the maximum time to wait (None = until notified)
+        """
+        now = time.time()
+        best, best_key = None, None
+        wait = None
+        for job, (prio, treq) in self._pending.items():
+            if job in self._running:
+                continue
+            due = job.last_start + job.min_period
+            if due > now:
+                wait = due - now if wait is None else min(wait, due - now)
+                continue
+            if best is None or (prio, treq) < best_key:
+                best, best_key = job, (prio, treq)
+        return best, wait
+
+    def _runJobs(self):
+        try:
+            while True:
+                with self._cond:
+                    while True:
+                        job, wait = self._pickJob()
+                        if job is not None:
+                            break
+                        self._cond.wait(wait)
+
+                    prio, treq = self._pending.pop(job)
+                    args, kwargs = job._args, job._kwargs
+                    job._args, job._kwargs = (), {}
+                    job.last_start = time.time()
+                    self._running.add(job)
+
+                try:
+                    job._run(args, kwargs, treq)
+                finally:
+                    # Don't keep references on the arguments while waiting
+                    del args, kwargs
+                    with self._cond:
+                        self._running.discard(job)
+                        # A new request for this job might be waiting for it
+                        self._cond.notify_all()
+                    del job
+        except Exception:
+            # Can happen when ending, as everything is being deleted
+            if logging:
+                logging.exception("Ending scheduler thread due to exception")
+
+    def getStats(self):
+        """
+        return (dict str -> number): threads (number of threads started),
+          pending (number of jobs waiting), running (number of jobs running)
+        """
+        with self._cond:
+            return {"threads": len(self._threads),
+                    "pending": len(self._pending),
+                    "running": len(self._running),
+                    }
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import logging
+from odemis.driver import simcam
+from odemis.util import benchmark
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+CONFIG_CAM = {"name": "camera", "role": "ccd", "image": "simcam-fake-overview.h5"}
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_measure_dataflow(self):
+        cam = simcam.Camera(**CONFIG_CAM)
+        cam.exposureTime.value = 0.05  # s
+        try:
+            res = benchmark.measure_dataflow(cam.data, duration=2, warmup=0.5)
+        finally:
+            cam.terminate()
+
+        # 20 fps max, so at least a few frames, and not more than expected
+        self.assertTrue(2 <= res["frames"] <= 41, "Got %d frames" % res["frames"])
+        self.assertGreater(res["fps"], 0)
+        self.assertLessEqual(res["fps"], 21)
+        self.assertGreater(res["throughput"], 0)
+        # Simcam sets the acquisition date, at the beginning of the exposure
+        self.assertGreaterEqual(res["latency_min"], 0)
+        self.assertLessEqual(res["latency_min"], res["latency_avg"])
+        self.assertLessEqual(res["latency_avg"], res["latency_max"])
+        self.assertGreaterEqual(res["jitter"], 0)
+
+        report = benchmark.format_report(u"cam", res)
+        self.assertIn(u"fps", report)
+        report = benchmark.format_report(u"cam", res, pretty=False)
+        self.assertEqual(len(report.splitlines()), len(res))
+
+    def test_bench_simulator(self):
+        results = benchmark.bench_simulator("simcam", duration=1)
+        self.assertEqual([m for m, r in results], ["local", "remote"])
+        for m, res in results:
+            self.assertGreater(res["frames"], 0)
+
+        with self.assertRaises(ValueError):
+            benchmark.bench_simulator("nosim")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,8 +24,10 @@ from __future__ import division
 import logging
 from odemis import model
 import odemis
+from odemis.driver import simulated
 from odemis.util import test
-from odemis.util.driver import getSerialDriver, speedUpPyroConnect, readMemoryUsage
+from odemis.util.driver import getSerialDriver, speedUpPyroConnect, readMemoryUsage, \
+    ComponentDirectory, moveAbsTrajectory
 import os
 import time
 import unittest
@@ -60,17 +62,104 @@ class TestDriver(unittest.TestCase):
 
         model._components._microscope = None # force reset of the microscope for next connection
 
-        speedUpPyroConnect(model.getMicroscope())
+        cdir = speedUpPyroConnect(model.getMicroscope())
+        self.assertTrue(cdir.waitBound(10))
+        if need_stop:
+            test.stop_backend()
+
+    def test_componentDirectory(self):
+        try:
+            test.start_backend(SECOM_CONFIG)
+            need_stop = True
+        except LookupError:
+            logging.info("A running backend is already found, will not stop it")
+            need_stop = False
+        except IOError as exp:
+            logging.error(str(exp))
+            raise
+
+        model._components._microscope = None # force reset of the microscope for next connection
+        microscope = model.getMicroscope()
+
+        tstart = time.time()
+        cdir = ComponentDirectory(microscope, max_threads=4)
+        cdir.bind()
+        logging.info("Directory created in %g s", time.time() - tstart)
+
+        # Should find the same components as the standard functions
+        self.assertEqual({c.name for c in cdir.getComponents()},
+                         {c.name for c in model.getComponents()})
+        ccd = cdir.getComponent(role="ccd")
+        self.assertEqual(ccd.name, model.getComponent(role="ccd").name)
+        self.assertEqual(cdir.getComponent(name=ccd.name), ccd)
+        self.assertEqual(cdir.getComponent(name=ccd.name, role="ccd"), ccd)
+        with self.assertRaises(LookupError):
+            cdir.getComponent(role="ccd", name="notarealname")
+        with self.assertRaises(LookupError):
+            cdir.getComponent(role="notarealrole")
+
+        self.assertTrue(cdir.waitBound(10))
+        cdir.close()
 
-        time.sleep(2)
         if need_stop:
             test.stop_backend()
 
+    def test_componentDirectoryAlive(self):
+        """
+        Check the directory follows the changes of the components alive
+        """
+        mic = model.Microscope("fake mic", "sparc")
+        cam = model.DigitalCamera("fake cam", "ccd")
+        mic.alive.value = {cam}
+        cdir = ComponentDirectory(mic)
+        self.assertIs(cdir.getComponent(role="ccd"), cam)
+        self.assertEqual(cdir.getComponents(), {mic, cam})
+
+        mic.alive.value = set()
+        with self.assertRaises(LookupError):
+            cdir.getComponent(role="ccd")
+        self.assertEqual(cdir.getComponents(), {mic})
+
+        mic.alive.value = {cam}
+        self.assertIs(cdir.getComponent(name="fake cam"), cam)
+        cdir.close()
+
     def test_memoryUsage(self):
         m = readMemoryUsage()
         self.assertGreater(m, 1)
 
 
+class TestMoveAbsTrajectory(unittest.TestCase):
+
+    def setUp(self):
+        self.stage = simulated.Stage("stage", "test", axes=["x", "y"])
+
+    def tearDown(self):
+        self.stage.terminate()
+
+    def test_simple(self):
+        positions = [{"x": 0.01 * i, "y": -0.01 * i} for i in range(5)]
+        fs = moveAbsTrajectory(self.stage, positions)
+        self.assertEqual(len(fs), len(positions))
+        for f in fs:
+            f.result()
+        self.assertEqual(self.stage.position.value, positions[-1])
+
+    def test_cancel(self):
+        """
+        Cancelling one point cancels all the following ones
+        """
+        self.stage.speed.value = {"x": 0.1, "y": 0.1}
+        positions = [{"x": 0.01 * i} for i in range(1, 5)]
+        fs = moveAbsTrajectory(self.stage, positions)
+        time.sleep(0.01)  # first move in progress
+        self.assertTrue(fs[1].cancel())
+        fs[0].result()
+        for f in fs[2:]:
+            self.assertTrue(f.cancelled())
+        self.assertEqual(self.stage.position.value["x"], positions[0]["x"])
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
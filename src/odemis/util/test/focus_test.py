@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import cv2
+import logging
+import numpy
+import odemis
+from odemis.dataio import hdf5, tiff
+from odemis.util import focus
+import os
+from scipy import ndimage
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+ODEMIS_PATH = os.path.dirname(odemis.__file__)
+# Representative images: SECOM optical, Delphi SEM and Delphi overview (RGB)
+IMAGES = {"secom-ccd": ODEMIS_PATH + "/driver/andorcam2-fake-clara.tiff",
+          "secom-optical": ODEMIS_PATH + "/acq/align/test/real_optical.h5",
+          "delphi-sem": ODEMIS_PATH + "/acq/align/test/sem_hole.h5",
+          "delphi-overview": ODEMIS_PATH + "/driver/simcam-fake-overview.h5",
+         }
+METHODS = (focus.FM_LAPLACIAN, focus.FM_TENENGRAD, focus.FM_NORM_VARIANCE, focus.FM_STD)
+
+
+def read_image(fn):
+    """
+    return (ndarray of shape YX or YXC)
+    """
+    if fn.endswith(".h5"):
+        da = hdf5.read_data(fn)[0]
+    else:
+        da = tiff.read_data(fn)[0]
+    im = numpy.squeeze(da)
+    if im.ndim == 3 and im.shape[0] in (3, 4):  # CYX -> YXC
+        im = numpy.rollaxis(im, 0, 3)
+    return numpy.ascontiguousarray(im)
+
+
+class TestFocusMeasure(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.images = {n: read_image(fn) for n, fn in IMAGES.items()}
+
+    def test_blur(self):
+        """
+        Check all the methods find the sharpest image
+        """
+        for n, im in self.images.items():
+            gray = focus.ToGray(im)
+            for mtd in METHODS:
+                for roi, binning in ((None, 1), ((0.25, 0.25, 0.75, 0.75), 1), (None, 2)):
+                    prev_lvl = focus.MeasureFocus(gray, mtd, roi, binning)
+                    for sigma in (2, 4, 8):
+                        blur = ndimage.gaussian_filter(gray, sigma=sigma)
+                        lvl = focus.MeasureFocus(blur, mtd, roi, binning)
+                        self.assertGreater(prev_lvl, lvl,
+                                           "%s on %s with sigma %g" % (mtd, n, sigma))
+                        prev_lvl = lvl
+
+    def test_reduce(self):
+        im = numpy.arange(20 * 40, dtype=numpy.uint16).reshape(20, 40)
+        red = focus.ReduceImage(im, (0.25, 0.5, 0.75, 1))
+        self.assertEqual(red.shape, (10, 20))
+        self.assertEqual(red[0, 0], im[10, 10])
+
+        red = focus.ReduceImage(im, binning=3)
+        self.assertEqual(red.shape, (6, 13))
+        self.assertEqual(red.dtype, numpy.float32)
+        self.assertAlmostEqual(red[0, 0], im[0:3, 0:3].mean())
+
+        gray = focus.ToGray(numpy.zeros((20, 40, 3), dtype=numpy.uint8))
+        self.assertEqual(gray.shape, (20, 40))
+
+    def test_dtypes(self):
+        """
+        Check all the methods accept the integer types not supported by OpenCV
+        """
+        im = self.images["secom-ccd"]
+        for dtype in (numpy.uint16, numpy.uint32, numpy.int64, numpy.float64):
+            imt = im.astype(dtype)
+            for mtd in METHODS:
+                lvl = focus.MeasureFocus(imt, mtd)
+                self.assertGreaterEqual(lvl, 0, "%s on %s" % (mtd, dtype))
+
+    def test_laplacian(self):
+        """
+        Check the float32 computation gives the same result as in float64
+        """
+        im = self.images["secom-ccd"]
+        lvl64 = cv2.Laplacian(im, cv2.CV_64F).var()
+        lvl32 = focus.LaplacianVariance(im)
+        self.assertAlmostEqual(lvl32 / lvl64, 1, places=4)
+
+    def test_speed(self):
+        """
+        Benchmark of the focus measures, in the different conditions
+        """
+        reductions = (("full", None, 1), ("center", (0.25, 0.25, 0.75, 0.75), 1),
+                      ("bin 2", None, 2), ("center bin 2", (0.25, 0.25, 0.75, 0.75), 2))
+        for n, im in self.images.items():
+            for mtd in METHODS:
+                durs = {}
+                for rn, roi, binning in reductions:
+                    tstart = time.time()
+                    for i in range(10):
+                        focus.MeasureFocus(im, mtd, roi, binning)
+                    durs[rn] = (time.time() - tstart) / 10
+                logging.info("%s on %s %s took: %s", mtd, n, im.shape,
+                             ", ".join("%s = %.3g ms" % (rn, durs[rn] * 1e3)
+                                       for rn, _, _ in reductions))
+                # A quarter of the image has to be faster
+                self.assertLess(durs["center"], durs["full"])
+
+        # Compare to the original optical focus measure
+        im = self.images["secom-ccd"]
+        tstart = time.time()
+        for i in range(10):
+            cv2.Laplacian(im, cv2.CV_64F).var()
+        dur64 = (time.time() - tstart) / 10
+        tstart = time.time()
+        for i in range(10):
+            focus.MeasureFocus(im, focus.FM_LAPLACIAN)
+        dur32 = (time.time() - tstart) / 10
+        logging.info("Laplacian took %g ms in float64, and %g ms in float32",
+                     dur64 * 1e3, dur32 * 1e3)
+
+
+if __name__ == "__main__":
+    unittest.main()
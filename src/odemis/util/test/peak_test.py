@@ -18,6 +18,7 @@ from __future__ import division
 
 import logging
 import numpy
+from odemis import model
 from odemis.dataio import hdf5
 from odemis.util import peak
 import os
@@ -85,6 +86,38 @@ class TestPeak(unittest.TestCase):
         # Assert wrong fitting type
         self.assertRaises(KeyError, peak.Curve, wl, params, offset, type='wrongType')
 
+    def test_fit_cube(self):
+        data = model.DataArray(self.data[:, 20:26, 20:30], {model.MD_PIXEL_SIZE: (1e-6, 1e-6)})
+        wl = self.wl
+
+        f = self._peak_fitter.FitCube(data, wl)
+        params, offset = f.result()
+        self.assertTrue(1 <= len(params) < 20)
+        self.assertEqual(offset.shape, data.shape[-2:])
+        for pos, width, amplitude in params:
+            for m in (pos, width, amplitude):
+                self.assertEqual(m.shape, data.shape[-2:])
+                self.assertEqual(m.metadata[model.MD_PIXEL_SIZE], (1e-6, 1e-6))
+            # Most of the pixels should be fitted, with the peak within the range
+            fitted = numpy.isfinite(pos)
+            self.assertGreater(fitted.sum(), pos.size * 0.9)
+            self.assertTrue(numpy.all(wl[0] - 100 < pos[fitted]))
+            self.assertTrue(numpy.all(pos[fitted] < wl[-1] + 100))
+            self.assertTrue(numpy.all(width[fitted] >= 0))
+
+        # Each pixel gives about the same result as a standalone fit
+        spec = data[:, 3, 5]
+        curve = peak.Curve(wl, [(p[3, 5], w[3, 5], a[3, 5]) for p, w, a in params], offset[3, 5])
+        rmse_cube = numpy.sqrt(numpy.mean((curve - spec) ** 2))
+        sparams, soffset = self._peak_fitter.Fit(spec, wl).result()
+        scurve = peak.Curve(wl, sparams, soffset)
+        rmse_single = numpy.sqrt(numpy.mean((scurve - spec) ** 2))
+        self.assertLess(rmse_cube, rmse_single * 1.5)
+
+        # Wrong shape
+        with self.assertRaises(ValueError):
+            self._peak_fitter.FitCube(data[0], wl)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Copyright © 2026 Delmic
+
+This file is part of Odemis.
+
+Odemis is free software: you can redistribute it and/or modify it under the terms
+of the GNU General Public License version 2 as published by the Free Software
+Foundation.
+
+Odemis is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR
+PURPOSE. See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with
+Odemis. If not, see http://www.gnu.org/licenses/.
+'''
+from __future__ import division
+
+import gc
+import logging
+from odemis.util import scheduler
+import threading
+import time
+import unittest
+
+
+logging.getLogger().setLevel(logging.DEBUG)
+
+
+class Counter(object):
+
+    def __init__(self, duration=0):
+        self.calls = []  # start time, args
+        self.duration = duration
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def run(self, *args):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.calls.append((time.time(), args))
+        time.sleep(self.duration)
+        with self._lock:
+            self.running -= 1
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_coalesce(self):
+        """
+        Requests while the job is waiting are run only once, with the last args
+        """
+        sch = scheduler.Scheduler(2, "test")
+        cnt = Counter(0.2)
+        job = sch.createJob(cnt.run)
+        for i in range(10):
+            job.request((i,))
+        time.sleep(0.1)  # first run in progress
+        for i in range(10, 20):
+            job.request((i,))
+        time.sleep(1)
+
+        # One run right away, then only one more with the latest arguments
+        self.assertEqual(len(cnt.calls), 2)
+        self.assertEqual(cnt.calls[-1][1], (19,))
+        # Never in parallel
+        self.assertEqual(cnt.max_running, 1)
+        stats = job.getStats()
+        self.assertEqual(stats["requested"], 20)
+        self.assertEqual(stats["runs"], 2)
+        self.assertGreaterEqual(stats["duration_avg"], 0.2)
+
+    def test_pending(self):
+        """
+        isPending() is True only between the request and the start of the run
+        """
+        sch = scheduler.Scheduler(1, "test")
+        cnt = Counter(0.2)
+        job = sch.createJob(cnt.run)
+        self.assertFalse(job.isPending())
+        job.request()
+        time.sleep(0.1)  # first run in progress
+        self.assertFalse(job.isPending())
+        job.request()
+        self.assertTrue(job.isPending())
+        job.cancel()
+        self.assertFalse(job.isPending())
+        time.sleep(0.3)
+        self.assertEqual(len(cnt.calls), 1)
+
+    def test_min_period(self):
+        sch = scheduler.Scheduler(2, "test")
+        cnt = Counter()
+        job = sch.createJob(cnt.run, min_period=0.2)
+        tend = time.time() + 1
+        while time.time() < tend:
+            job.request()
+            time.sleep(0.01)
+        time.sleep(0.3)
+
+        # ~ 1 s / 0.2 s
+        self.assertLessEqual(len(cnt.calls), 7)
+        self.assertGreaterEqual(len(cnt.calls), 4)
+        for (t1, a1), (t2, a2) in zip(cnt.calls[:-1], cnt.calls[1:]):
+            self.assertGreaterEqual(t2 - t1, 0.19)
+
+    def test_priority(self):
+        """
+        The jobs with the lowest priority value run first, and never more than
+        the number of threads simultaneously.
+        """
+        sch = scheduler.Scheduler(1, "test")
+        cnt = Counter(0.1)
+        blocker = sch.createJob(cnt.run)
+        blocker.request(("blocker",))
+        time.sleep(0.05)  # blocker is running
+        jobs = [sch.createJob(cnt.run) for i in range(3)]
+        jobs[0].request(("low",), priority=2)
+        jobs[1].request(("high",), priority=0)
+        jobs[2].request(("medium",), priority=1)
+        time.sleep(0.6)
+
+        self.assertEqual([a[0] for t, a in cnt.calls],
+                         ["blocker", "high", "medium", "low"])
+        self.assertEqual(cnt.max_running, 1)
+        self.assertEqual(sch.getStats()["threads"], 1)
+
+    def test_weak(self):
+        """
+        A job on a method doesn't prevent the object from being deleted
+        """
+        sch = scheduler.Scheduler(1, "test")
+        cnt = Counter()
+        job = sch.createJob(cnt.run)
+        job.request()
+        time.sleep(0.1)
+        self.assertEqual(len(cnt.calls), 1)
+
+        del cnt
+        gc.collect()
+        job.request()  # should not fail
+        time.sleep(0.1)
+        self.assertEqual(job.getStats()["runs"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()